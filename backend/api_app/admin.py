@@ -1,21 +1,108 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils.html import format_html
 from .models import User, Storage
+from .pagination import EstimatedCountPaginator
+from .search import search_storage
 
 # Настраиваем отображение модели User
 class UserAdmin(BaseUserAdmin):
-    list_display = ('email', 'username', 'fullname', 'role', 'is_staff', 'is_active')
+    list_display = ('email', 'username', 'fullname', 'role', 'is_staff', 'is_active', 'files_count', 'files_size')
     list_filter = ('is_staff', 'is_active')
     search_fields = ('email', 'username')
     ordering = ('email',)
     filter_horizontal = ()
     fieldsets = ()
+    # Без точного COUNT(*) по всей таблице на каждой странице списка
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Количество и объем файлов считаются подзапросами только для пользователей текущей страницы
+        # (по индексу storage_user_upload_idx), а не агрегацией по всей таблице storage
+        files = Storage.objects.filter(id_user=OuterRef('pk')).order_by().values('id_user')
+        return super().get_queryset(request).annotate(
+            files_count=Coalesce(Subquery(files.annotate(value=Count('id_file')).values('value')), 0),
+            files_size=Coalesce(Subquery(files.annotate(value=Sum('size')).values('value')), 0),
+        )
+
+    @admin.display(description='Файлов', ordering='files_count')
+    def files_count(self, obj):
+        url = reverse('admin:api_app_storage_changelist') + f'?user={obj.pk}'
+        return format_html('<a href="{}">{}</a>', url, obj.files_count)
+
+    @admin.display(description='Объем, байт', ordering='files_size')
+    def files_size(self, obj):
+        return obj.files_size
+
+    def delete_model(self, request, obj):
+        # Строки файлов удаляются каскадом, содержимое на диске удалит purge_trash по очереди
+        with transaction.atomic():
+            Storage.all_objects.filter(id_user=obj).queue_purge()
+            obj.delete()
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            Storage.all_objects.filter(id_user__in=queryset).queue_purge()
+            queryset.delete()
+
+# Фильтр по владельцу без вывода всех пользователей в боковой панели:
+# включается ссылкой из списка пользователей (?user=<id>) и показывает только выбранного
+class OwnerFilter(admin.SimpleListFilter):
+    title = 'владелец'
+    parameter_name = 'user'
+
+    def lookups(self, request, model_admin):
+        value = self.value()
+        if not value or not value.isdigit():
+            return []
+        user = User.objects.filter(pk=value).only('username').first()
+        return [(value, str(user) if user else value)]
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit():
+            return queryset.filter(id_user=value)
+        return queryset
 
 # Настраиваем отображение модели Storage
 class StorageAdmin(admin.ModelAdmin):
     list_display = ('original_name', 'id_user', 'size', 'upload_date')
-    list_filter = ('id_user', 'upload_date')
-    search_fields = ('original_name', 'id_user__username')
+    list_select_related = ('id_user',)
+    list_filter = (OwnerFilter, 'upload_date', 'chunked', 'encrypted')
+    autocomplete_fields = ('id_user',)
+    raw_id_fields = ('folder',)
+    search_fields = ('original_name', 'comment')
+    search_help_text = ('Поиск по имени файла, комментарию и началу имени владельца. '
+                        'Для поиска по началу имени файла используйте ^, например: ^report')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('expire_links',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Используем тот же поиск, что и API, чтобы запрос попадал в trigram-индексы
+        term, mode = search_term.strip(), 'substring'
+        if term.startswith('^'):
+            term, mode = term[1:].strip(), 'prefix'
+        if not term:
+            return queryset, False
+        # Плюс файлы владельцев, чье имя начинается с запроса: подзапрос по небольшой таблице пользователей,
+        # файлы выбираются по индексу id_user
+        owners = User.objects.filter(username__istartswith=term).values('pk')
+        return search_storage(queryset, term, mode=mode) | queryset.filter(id_user__in=owners), False
+
+    def delete_queryset(self, request, queryset):
+        # Стандартное действие "Удалить выбранные": пакетное удаление вместе с файлами на диске
+        queryset.delete_files()
+
+    @admin.action(description='Отключить ссылки на скачивание')
+    def expire_links(self, request, queryset):
+        updated = queryset.filter(token__isnull=False).update(token=None, token_expiration=None, token_rate_limit=None)
+        self.message_user(request, f'Ссылки отключены: {updated}', messages.SUCCESS)
 
 # Регистрируем модели
 admin.site.register(User, UserAdmin)
@@ -0,0 +1,122 @@
+"""
+Токены доступа с ограниченным сроком действия.
+
+Вход (/api/auth/login/) проверяет пароль один раз и выдает пару токенов:
+- access - подписанный HMAC (django.core.signing) {id пользователя, id сессии} со временем выдачи,
+  действует AUTH_ACCESS_TOKEN_LIFETIME секунд; проверка - подпись и один запрос по первичному ключу сессии;
+- refresh - случайная строка, в БД хранится только ее sha256 (AuthSession.refresh_hash, уникальный индекс);
+  обменивается на новую пару (/api/auth/refresh/) без пароля, действует AUTH_REFRESH_TOKEN_LIFETIME секунд.
+Пароль (PBKDF2) на каждом запросе не проверяется.
+"""
+import hashlib
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import AuthSession
+
+ACCESS_SALT = 'api_app.authentication.access'
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def sign_access(session):
+    return signing.dumps({'u': session.id_user_id, 's': session.id_session}, salt=ACCESS_SALT)
+
+
+def token_pair(session, refresh):
+    return {
+        'access': sign_access(session),
+        'refresh': refresh,
+        'token_type': AccessTokenAuthentication.keyword,
+        'expires_in': settings.AUTH_ACCESS_TOKEN_LIFETIME,
+        'refresh_expires': session.expires,
+        # По id сессии клиент узнает свой выход в ленте событий (событие logout)
+        'session': session.id_session,
+    }
+
+
+def start_session(user):
+    """Новая сессия после проверки пароля: пара токенов. Заодно удаляются истекшие сессии пользователя"""
+    now = timezone.now()
+    AuthSession.objects.filter(id_user=user, expires__lt=now).delete()
+    refresh = secrets.token_urlsafe(32)
+    session = AuthSession.objects.create(
+        id_user=user, refresh_hash=hash_token(refresh),
+        expires=now + timedelta(seconds=settings.AUTH_REFRESH_TOKEN_LIFETIME),
+    )
+    return token_pair(session, refresh)
+
+
+def refresh_session(refresh):
+    """
+    Обмен refresh-токена на новую пару (старый refresh больше не действует). None - токен неизвестен,
+    истек или уже обменян (например, параллельно из другой вкладки)
+    """
+    old_hash = hash_token(refresh)
+    try:
+        session = AuthSession.objects.select_related('id_user').get(refresh_hash=old_hash)
+    except AuthSession.DoesNotExist:
+        return None
+    now = timezone.now()
+    if session.expires <= now or not session.id_user.is_active:
+        return None
+    new_refresh = secrets.token_urlsafe(32)
+    session.refresh_hash = hash_token(new_refresh)
+    session.expires = now + timedelta(seconds=settings.AUTH_REFRESH_TOKEN_LIFETIME)
+    # Условное обновление: из двух одновременных обменов одного токена успешен только один
+    updated = AuthSession.objects.filter(pk=session.pk, refresh_hash=old_hash).update(
+        refresh_hash=session.refresh_hash, expires=session.expires,
+    )
+    if not updated:
+        return None
+    return token_pair(session, new_refresh)
+
+
+def end_session(session=None, refresh=None):
+    """
+    Завершает сессию (по access-токену - request.auth, или по refresh, когда access уже истек).
+    Возвращает удаленную сессию или None
+    """
+    if session is None:
+        session = AuthSession.objects.filter(refresh_hash=hash_token(refresh)).first() if refresh else None
+    if session is None:
+        return None
+    AuthSession.objects.filter(pk=session.pk).delete()
+    return session
+
+
+class AccessTokenAuthentication(BaseAuthentication):
+    """Заголовок Authorization: Bearer <access>. request.auth - сессия (AuthSession)"""
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Неправильный заголовок Authorization.')
+        try:
+            payload = signing.loads(auth[1].decode(), salt=ACCESS_SALT, max_age=settings.AUTH_ACCESS_TOKEN_LIFETIME)
+        except signing.SignatureExpired:
+            raise AuthenticationFailed('Срок действия токена истек.')
+        except (signing.BadSignature, UnicodeDecodeError):
+            raise AuthenticationFailed('Недействительный токен.')
+
+        try:
+            session = AuthSession.objects.select_related('id_user').get(pk=payload['s'])
+        except AuthSession.DoesNotExist:
+            raise AuthenticationFailed('Сессия завершена.')
+        if session.id_user_id != payload['u'] or session.expires <= timezone.now() or not session.id_user.is_active:
+            raise AuthenticationFailed('Сессия завершена.')
+        return session.id_user, session
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,163 @@
+"""
+Хранилище блоков (chunk store) с разбиением файлов по содержимому (content-defined chunking, FastCDC).
+
+Граница блока выбирается по скользящему gear-хэшу содержимого, поэтому вставка или удаление байтов
+в середине файла меняет только соседние блоки, а остальные блоки (и их SHA-256) остаются прежними.
+Клиент, который разбивает файл тем же алгоритмом, может спросить у сервера, каких блоков нет,
+и загрузить только их. Параметры алгоритма (GEAR, размеры, маски) должны совпадать на клиенте и сервере.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+
+try:
+    import numpy
+except ImportError:  # без numpy граница ищется циклом по байтам на Python (примерно 0.1 с на мегабайт)
+    numpy = None
+
+MIN_CHUNK_SIZE = 256 * 1024
+AVG_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Нормализованное разбиение FastCDC: до среднего размера маска строже (реже граница), после - мягче
+MASK_S = (1 << 21) - 1
+MASK_L = (1 << 19) - 1
+MASK_64 = (1 << 64) - 1
+
+# Таблица gear: 256 псевдослучайных 64-битных чисел, детерминированно получаемых из SHA-256 индекса
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'big') for i in range(256)]
+
+READ_SIZE = 64 * 1024
+
+# Граница зависит только от младших бит хэша (MASK_S и MASK_L), а младшие WINDOW_BITS бит хэша
+# (h << 1) + gear[byte] - только от последних WINDOW_BITS байт: более старые байты сдвинуты выше.
+# Поэтому хэши всех позиций считаются сразу для блока байтов как сумма WINDOW_BITS сдвинутых значений gear
+WINDOW_BITS = MASK_S.bit_length()
+GEAR_LOW = numpy.array([value & MASK_S for value in GEAR], dtype=numpy.uint32) if numpy else None
+SCAN_BLOCK_SIZE = 256 * 1024
+
+
+def cut_point(data, start=0):
+    """Длина следующего блока в data[start:] (граница по gear-хэшу или MAX_CHUNK_SIZE)"""
+    length = len(data) - start
+    if length <= MIN_CHUNK_SIZE:
+        return length
+    end = min(length, MAX_CHUNK_SIZE)
+    normal = min(AVG_CHUNK_SIZE, end)
+    if numpy is None:
+        return _cut_point_python(data, start, normal, end)
+
+    view = numpy.frombuffer(data, dtype=numpy.uint8)
+    i = MIN_CHUNK_SIZE
+    while i < end:
+        stop = min(i + SCAN_BLOCK_SIZE, end)
+        # Предыдущие байты окна, но не раньше MIN_CHUNK_SIZE: с этой позиции хэш начинается с нуля
+        context = max(MIN_CHUNK_SIZE, i - WINDOW_BITS + 1)
+        fingerprints = _window_fingerprints(GEAR_LOW[view[start + context:start + stop]])[i - context:]
+        # До среднего размера действует маска MASK_S, после - MASK_L
+        split = min(max(normal - i, 0), stop - i)
+        hits = numpy.flatnonzero((fingerprints[:split] & MASK_S) == 0)
+        if hits.size:
+            return i + int(hits[0]) + 1
+        hits = numpy.flatnonzero((fingerprints[split:] & MASK_L) == 0)
+        if hits.size:
+            return i + split + int(hits[0]) + 1
+        i = stop
+    return end
+
+
+def _window_fingerprints(values):
+    """
+    Младшие биты хэша для каждой позиции: сумма values[i - k] << k по k < WINDOW_BITS (в начале - по
+    имеющимся байтам). Окна удваиваются (1, 2, 4, 8, 16 байт) и складываются по битам WINDOW_BITS:
+    несколько векторных сложений вместо WINDOW_BITS
+    """
+    result, width, covered, bits = None, 1, 0, WINDOW_BITS
+    window = values
+    while True:
+        if bits & 1:
+            if result is None:
+                result = window.copy()
+            elif covered < len(window):
+                result[covered:] += window[:len(window) - covered] << covered
+            covered += width
+        bits >>= 1
+        if not bits:
+            return result
+        doubled = window.copy()
+        doubled[width:] += window[:len(window) - width] << width
+        window, width = doubled, width * 2
+
+
+def _cut_point_python(data, start, normal, end):
+    gear = GEAR
+    fingerprint = 0
+    i = MIN_CHUNK_SIZE
+    while i < normal:
+        fingerprint = ((fingerprint << 1) + gear[data[start + i]]) & MASK_64
+        if not fingerprint & MASK_S:
+            return i + 1
+        i += 1
+    while i < end:
+        fingerprint = ((fingerprint << 1) + gear[data[start + i]]) & MASK_64
+        if not fingerprint & MASK_L:
+            return i + 1
+        i += 1
+    return end
+
+
+def iter_chunks(fileobj):
+    """Читает файловый объект и выдает блоки (bytes); в памяти не больше 2 * MAX_CHUNK_SIZE"""
+    buffer = bytearray()
+    eof = False
+    while True:
+        while not eof and len(buffer) < MAX_CHUNK_SIZE:
+            data = fileobj.read(MAX_CHUNK_SIZE)
+            if not data:
+                eof = True
+            buffer += data
+        if not buffer:
+            return
+        size = cut_point(buffer) if (eof or len(buffer) >= MAX_CHUNK_SIZE) else len(buffer)
+        yield bytes(buffer[:size])
+        del buffer[:size]
+
+
+def chunk_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_path(hash_hex):
+    """Путь к блоку на диске: MEDIA_ROOT/chunks/ab/cd/abcd..."""
+    return os.path.join(settings.MEDIA_ROOT, 'chunks', hash_hex[:2], hash_hex[2:4], hash_hex)
+
+
+def write_chunk(hash_hex, data):
+    """Атомарно записывает блок на диск (через временный файл), если его там еще нет"""
+    path = chunk_path(hash_hex)
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def read_chunks(hashes, read_size=READ_SIZE):
+    """Последовательно читает блоки с диска частями по read_size байт (потоковая сборка файла)"""
+    for hash_hex in hashes:
+        with open(chunk_path(hash_hex), 'rb') as f:
+            while True:
+                data = f.read(read_size)
+                if not data:
+                    break
+                yield data
@@ -0,0 +1,205 @@
+"""
+Копирование и перемещение файлов на сервере, без скачивания и повторной загрузки.
+
+Копия файла на диске создается самым дешевым доступным способом (clone_file):
+жесткая ссылка, reflink (FICLONE, btrfs/XFS), os.copy_file_range (копирование внутри ядра)
+и только затем обычное копирование частями. Жесткие ссылки безопасны: файлы в uploads/ не изменяются
+на месте (переименование - os.rename, удаление - unlink одной ссылки), а шифрование не привязано к id файла.
+У файлов из хранилища блоков копируются только ссылки на те же блоки.
+Перемещение меняет только строки storage: файлы на диске и блоки не трогаются.
+"""
+import errno
+import logging
+import os
+import shutil
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import events
+from .models import Folder, Storage, StorageChunk, StorageEvent
+from .uploads import resolve_names
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 1024 * 1024
+# ioctl FICLONE (linux/fs.h): копия, разделяющая блоки с исходным файлом до первой записи
+FICLONE = 0x40049409
+# Ошибки, после которых пробуем следующий способ копирования (другая ФС, не поддерживается, нет прав)
+FALLBACK_ERRORS = (errno.EXDEV, errno.EPERM, errno.EACCES, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP,
+                   errno.EINVAL, errno.ENOSYS, errno.ETXTBSY, errno.EBADF, errno.ENOTTY)
+
+# Поля, которые копия берет у исходного файла
+COPY_FIELDS = ('comment', 'size', 'chunked', 'encrypted', 'checksum', 'content_type', 'charset', 'file_mtime')
+
+
+def clone_file(src, dst, hardlink=True):
+    """
+    Создает файл dst с содержимым src (FileExistsError, если dst уже есть).
+    Возвращает использованный способ: link, reflink, copy_file_range или copy
+    """
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return 'link'
+        except FileExistsError:
+            raise
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRORS:
+                raise
+    with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+        try:
+            try:
+                import fcntl
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return 'reflink'
+            except (ImportError, OSError) as e:
+                if isinstance(e, OSError) and e.errno not in FALLBACK_ERRORS:
+                    raise
+            if hasattr(os, 'copy_file_range'):
+                try:
+                    size = os.fstat(fsrc.fileno()).st_size
+                    offset = 0
+                    while offset < size:
+                        copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - offset, offset, offset)
+                        if not copied:
+                            break
+                        offset += copied
+                    if offset == size:
+                        return 'copy_file_range'
+                except OSError as e:
+                    if e.errno not in FALLBACK_ERRORS:
+                        raise
+                # Начинаем заново: часть данных могла быть скопирована
+                fdst.truncate(0)
+            fsrc.seek(0)
+            fdst.seek(0)
+            shutil.copyfileobj(fsrc, fdst, READ_SIZE)
+            return 'copy'
+        except BaseException:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+def clone_content(source, copy):
+    """Копирует файл source на диске под новым свободным именем и записывает его в copy.file"""
+    generated = copy.file.field.generate_filename(copy, copy.original_name)
+    while True:
+        # Имя может занять параллельная загрузка: тогда берем следующее свободное
+        file_name = default_storage.get_available_name(generated)
+        path = default_storage.path(file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            method = clone_file(source.file.path, path, hardlink=settings.STORAGE_COPY_HARDLINKS)
+            break
+        except FileExistsError:
+            continue
+    copy.file.name = file_name
+    return method
+
+
+def copy_files(files, user, folder):
+    """
+    Копирует файлы (Storage) в хранилище user, в папку folder (None - корень): содержимое на диске
+    копируется параллельно (clone_content), строки добавляются одним bulk_create, блоки - ссылками
+    на те же блоки, счетчики папки обновляются один раз. Возвращает результаты по каждому файлу
+    """
+    names = resolve_names(user.id_user, [source.original_name for source in files])
+    copies = [
+        Storage(id_user=user, folder=folder, original_name=name, **{field: getattr(source, field) for field in COPY_FIELDS})
+        for source, name in zip(files, names)
+    ]
+
+    def clone(index):
+        source, copy = files[index], copies[index]
+        if source.chunked:
+            return 'chunks', None
+        try:
+            return clone_content(source, copy), None
+        except OSError as e:
+            logger.error('Не удалось скопировать файл id_file=%s: %s', source.id_file, e)
+            return None, 'Файл не найден на диске' if e.errno == errno.ENOENT else str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, settings.STORAGE_BATCH_WORKERS)) as executor:
+        cloned = list(executor.map(clone, range(len(files))))
+
+    created = [(source, copy) for source, copy, (_, error) in zip(files, copies, cloned) if not error]
+    try:
+        with transaction.atomic():
+            Storage.objects.bulk_create([copy for _, copy in created])
+            copy_ids = {source.id_file: copy for source, copy in created if source.chunked}
+            if copy_ids:
+                StorageChunk.objects.bulk_create(
+                    (StorageChunk(storage=copy_ids[id_file], position=position, chunk_id=hash_hex)
+                     for id_file, position, hash_hex in StorageChunk.objects.filter(storage__in=list(copy_ids))
+                     .values_list('storage_id', 'position', 'chunk_id').iterator()),
+                    batch_size=1000,
+                )
+            if folder and created:
+                Folder.adjust_totals(folder.path, len(created), sum(copy.size for _, copy in created))
+            events.emit_many([
+                StorageEvent(id_user=user, kind=events.UPLOAD, id_file=copy.id_file, payload=events.file_payload(copy))
+                for _, copy in created
+            ])
+    except Exception:
+        # Строки не добавлены: убираем созданные копии на диске
+        for source, copy in created:
+            if not source.chunked and os.path.isfile(copy.file.path):
+                os.remove(copy.file.path)
+        raise
+
+    results = []
+    for source, copy, (method, error) in zip(files, copies, cloned):
+        if error:
+            results.append({'id_file': source.id_file, 'detail': error})
+        else:
+            results.append({
+                'id_file': source.id_file,
+                'new_id_file': copy.id_file,
+                'original_name': copy.original_name,
+                'size': copy.size,
+                'method': method,
+            })
+    return results
+
+
+def move_files(files, user, folder):
+    """
+    Перемещает файлы (Storage, с select_related('folder')) к user в папку folder: одним bulk_update строк,
+    счетчики папок - по одному UPDATE на папку. У файлов другого владельца подбирается свободное имя
+    и сбрасывается публичная ссылка; прежний владелец получает событие delete, новый - upload.
+    Возвращает перемещенные файлы
+    """
+    foreign = [source for source in files if source.id_user_id != user.id_user]
+    foreign_ids = {source.id_file for source in foreign}
+    for source, name in zip(foreign, resolve_names(user.id_user, [source.original_name for source in foreign])):
+        source.original_name = name
+        source.token = source.token_expiration = source.token_rate_limit = None
+
+    totals = defaultdict(lambda: [0, 0])
+    moved_events = []
+    for source in files:
+        if source.folder_id:
+            totals[source.folder.path][0] -= 1
+            totals[source.folder.path][1] -= source.size
+        if folder:
+            totals[folder.path][0] += 1
+            totals[folder.path][1] += source.size
+        if source.id_file in foreign_ids:
+            moved_events.append(StorageEvent(id_user_id=source.id_user_id, kind=events.DELETE, id_file=source.id_file, payload={'id_file': source.id_file}))
+        source.id_user, source.folder = user, folder
+        moved_events.append(StorageEvent(
+            id_user=user, kind=events.UPLOAD if source.id_file in foreign_ids else events.MOVE,
+            id_file=source.id_file, payload=events.file_payload(source),
+        ))
+
+    with transaction.atomic():
+        Storage.objects.bulk_update(files, ['id_user', 'folder', 'original_name', 'token', 'token_expiration', 'token_rate_limit'], batch_size=1000)
+        for path, (files_delta, size_delta) in totals.items():
+            Folder.adjust_totals(path, files_delta, size_delta)
+        events.emit_many(moved_events)
+    return files
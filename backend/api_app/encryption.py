@@ -0,0 +1,119 @@
+"""
+Шифрование файлов на диске потоковым AEAD-форматом с произвольным доступом.
+
+Формат файла: заголовок MAGIC | размер сегмента (4 байта) | соль (16 байт),
+затем сегменты: AES-256-GCM(открытый текст до SEGMENT_SIZE байт) + тег 16 байт.
+Ключ файла выводится из главного ключа (STORAGE_ENCRYPTION_KEY) через HKDF с солью файла,
+nonce сегмента - его номер. В AAD входят заголовок, номер сегмента и признак последнего сегмента,
+поэтому перестановка, подмена и обрезка сегментов обнаруживаются при расшифровке.
+Любой сегмент расшифровывается независимо, что позволяет читать файл с произвольного смещения.
+"""
+import base64
+import math
+import os
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from django.conf import settings
+
+MAGIC = b'MCE1'
+SEGMENT_SIZE = 64 * 1024
+TAG_SIZE = 16
+SALT_SIZE = 16
+HEADER_SIZE = len(MAGIC) + 4 + SALT_SIZE
+
+
+def get_master_key():
+    """Главный ключ из настроек (32 байта в url-safe base64) или None, если шифрование выключено"""
+    key = settings.STORAGE_ENCRYPTION_KEY
+    if not key:
+        return None
+    key = base64.urlsafe_b64decode(key)
+    if len(key) != 32:
+        raise ValueError('STORAGE_ENCRYPTION_KEY должен содержать 32 байта в base64')
+    return key
+
+
+def _file_cipher(master_key, salt):
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b'mycloud-file').derive(master_key)
+    return AESGCM(key)
+
+
+def _nonce(index):
+    return index.to_bytes(12, 'big')
+
+
+def _aad(header, index, final):
+    return header + index.to_bytes(8, 'big') + (b'\x01' if final else b'\x00')
+
+
+def encrypt_stream(chunks, dst, master_key, segment_size=SEGMENT_SIZE):
+    """
+    Шифрует поток частей (iterable of bytes) и пишет результат в dst.
+    В памяти держится не больше одного сегмента. Возвращает размер открытого текста
+    """
+    salt = os.urandom(SALT_SIZE)
+    header = MAGIC + segment_size.to_bytes(4, 'big') + salt
+    cipher = _file_cipher(master_key, salt)
+    dst.write(header)
+
+    buffer = bytearray()
+    index = total = 0
+    for data in chunks:
+        buffer += data
+        total += len(data)
+        # Строго больше: последний сегмент (возможно, полный или пустой) шифруется с признаком final
+        while len(buffer) > segment_size:
+            dst.write(cipher.encrypt(_nonce(index), bytes(buffer[:segment_size]), _aad(header, index, False)))
+            del buffer[:segment_size]
+            index += 1
+    dst.write(cipher.encrypt(_nonce(index), bytes(buffer), _aad(header, index, True)))
+    return total
+
+
+class EncryptedFile:
+    """Чтение зашифрованного файла с произвольного смещения (расшифровываются только нужные сегменты)"""
+
+    def __init__(self, path, master_key):
+        self.file = open(path, 'rb')
+        self.header = self.file.read(HEADER_SIZE)
+        if len(self.header) != HEADER_SIZE or not self.header.startswith(MAGIC):
+            self.file.close()
+            raise ValueError(f'Файл не зашифрован или поврежден: {path}')
+        self.segment_size = int.from_bytes(self.header[len(MAGIC):len(MAGIC) + 4], 'big')
+        self.cipher = _file_cipher(master_key, self.header[-SALT_SIZE:])
+        body_size = os.fstat(self.file.fileno()).st_size - HEADER_SIZE
+        self.segments = max(1, math.ceil(body_size / (self.segment_size + TAG_SIZE)))
+        self.size = body_size - self.segments * TAG_SIZE
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def read_segment(self, index):
+        self.file.seek(HEADER_SIZE + index * (self.segment_size + TAG_SIZE))
+        data = self.file.read(self.segment_size + TAG_SIZE)
+        final = index == self.segments - 1
+        return self.cipher.decrypt(_nonce(index), data, _aad(self.header, index, final))
+
+    def iter_range(self, start=0, end=None):
+        """Открытый текст в диапазоне [start, end) по сегментам"""
+        end = self.size if end is None else min(end, self.size)
+        if start >= end:
+            return
+        for index in range(start // self.segment_size, (end - 1) // self.segment_size + 1):
+            segment_start = index * self.segment_size
+            data = self.read_segment(index)
+            yield data[max(start - segment_start, 0):end - segment_start]
+
+
+def iter_decrypted(path, master_key, start=0, end=None):
+    """Генератор расшифрованного содержимого файла в диапазоне [start, end)"""
+    with EncryptedFile(path, master_key) as encrypted:
+        yield from encrypted.iter_range(start, end)
@@ -0,0 +1,175 @@
+"""
+Лента изменений хранилища пользователя: события пишутся в журнал StorageEvent,
+а при каждой записи у пользователя меняется "версия" в кэше, чтобы открытые
+потоки (SSE) обращались к БД только когда действительно появилось что-то новое.
+"""
+import logging
+import time
+from datetime import timedelta
+
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from .models import Storage, StorageEvent
+from .serializers import StorageListSerializer
+
+logger = logging.getLogger(__name__)
+
+UPLOAD = 'upload'
+UPDATE = 'update'
+RENAME = 'rename'
+MOVE = 'move'
+DELETE = 'delete'
+LINK = 'link'
+FOLDER = 'folder'
+LOGOUT = 'logout'
+
+# Событий за одно чтение журнала
+BATCH_SIZE = 500
+
+
+def version_key(id_user):
+    return f'events:version:{id_user}'
+
+
+def file_payload(storage_file):
+    """Данные файла в том же виде, что и в списке файлов (StorageListSerializer)"""
+    return {
+        field: getattr(storage_file, Storage._meta.get_field(field).attname)
+        for field in StorageListSerializer.fields
+    }
+
+
+def emit_many(events):
+    """Пишет события одним INSERT. events - список StorageEvent"""
+    if not events:
+        return
+    StorageEvent.objects.bulk_create(events)
+
+    def bump_versions():
+        for id_user in {event.id_user_id for event in events}:
+            cache.set(version_key(id_user), get_random_string(12), None)
+    # Версию меняем после фиксации транзакции, иначе поток может прочитать БД раньше, чем увидит событие
+    transaction.on_commit(bump_versions)
+
+
+def emit(id_user, kind, id_file=None, payload=None):
+    emit_many([StorageEvent(id_user_id=id_user, kind=kind, id_file=id_file, payload=payload or {})])
+
+
+def emit_file(kind, storage_file):
+    emit(storage_file.id_user_id, kind, storage_file.id_file, file_payload(storage_file))
+
+
+def settled_cursor(cursor, limit=BATCH_SIZE * 2):
+    """
+    Граница, до которой журнал уже не изменится. id событий выдаются до фиксации транзакции, поэтому событие
+    с меньшим id может стать видимым позже события с большим: пропуск в последовательности id считается
+    незафиксированной транзакцией, пока следующее за ним событие моложе EVENTS_COMMIT_WINDOW секунд
+    (дольше - транзакция откачена или события удалены). Проверяется не больше limit событий за вызов.
+    Возвращает границу и признак, что журнал за ней нужно проверить еще раз (пропуск или не все события проверены)
+    """
+    horizon = timezone.now() - timedelta(seconds=settings.EVENTS_COMMIT_WINDOW)
+    rows = list(StorageEvent.objects.filter(id__gt=cursor).order_by('id').values_list('id', 'created_date')[:limit])
+    for event_id, created_date in rows:
+        if event_id != cursor + 1 and created_date > horizon:
+            return cursor, True
+        cursor = event_id
+    return cursor, len(rows) == limit
+
+
+def start_cursor():
+    """
+    Курсор для клиента без курсора (или с устаревшим): последнее событие, перед которым нет незафиксированных
+    транзакций. Проверка начинается с последнего события старше EVENTS_COMMIT_WINDOW, а если таких нет -
+    с самого старого события (более ранние удалены prune_events, это не пропуск)
+    """
+    horizon = timezone.now() - timedelta(seconds=settings.EVENTS_COMMIT_WINDOW)
+    cursor = StorageEvent.objects.filter(created_date__lte=horizon).order_by('-id').values_list('id', flat=True).first()
+    if cursor is None:
+        cursor = (StorageEvent.objects.order_by('id').values_list('id', flat=True).first() or 1) - 1
+    return settled_cursor(cursor)[0]
+
+
+def read_events(id_user, cursor):
+    """
+    События пользователя после курсора, но не дальше settled_cursor: (события, новый курсор, есть ли еще).
+    Курсор сдвигается и без событий пользователя, чтобы следующее чтение не проверяло журнал заново
+    """
+    until, more = settled_cursor(cursor)
+    batch = list(StorageEvent.objects.filter(id_user=id_user, id__gt=cursor, id__lte=until).order_by('id').values(
+        'id', 'kind', 'id_file', 'payload', 'created_date',
+    )[:BATCH_SIZE])
+    if len(batch) == BATCH_SIZE:
+        return batch, batch[-1]['id'], True
+    return batch, until, more
+
+
+def format_event(event_id, kind, data):
+    return f'id: {event_id}\nevent: {kind}\ndata: {orjson.dumps(data, option=orjson.OPT_UTC_Z).decode()}\n\n'
+
+
+class EventStream:
+    """
+    Состояние потока SSE ленты пользователя, общее для асинхронного (ASGI) и синхронного (WSGI) генератора:
+    генератор только получает версию из кэша, вызывает step() и ждет EVENTS_POLL_INTERVAL, пока нет backlog.
+    БД читается при изменении версии (version_key), пока журнал нужно проверить еще раз (read_events)
+    и не реже раза в 30 секунд. Поток закрывается через EVENTS_STREAM_SECONDS (клиент переподключается
+    с Last-Event-ID) или при выходе из сессии, открывшей поток
+    """
+
+    def __init__(self, id_user, cursor, reset, session_id):
+        self.id_user = id_user
+        self.cursor = cursor
+        self.reset = reset
+        self.session_id = session_id
+        self.started = self.last_check = self.last_ping = time.monotonic()
+        self.version = None
+        self.check = True
+        self.backlog = False
+        self.closed = False
+
+    @property
+    def running(self):
+        return not self.closed and time.monotonic() - self.started < settings.EVENTS_STREAM_SECONDS
+
+    def head(self):
+        chunks = [f'retry: {settings.EVENTS_RETRY_MS}\n\n']
+        if self.reset:
+            chunks.append(format_event(self.cursor, 'reset', {"cursor": self.cursor}))
+        return chunks
+
+    def due(self, version):
+        """Нужно ли читать БД при этой версии из кэша"""
+        return self.check or version != self.version or time.monotonic() - self.last_check >= 30
+
+    def poll(self, version):
+        """Чтение журнала: строки SSE новых событий (поток закрывается на событии выхода из его сессии)"""
+        self.version, self.last_check = version, time.monotonic()
+        batch, self.cursor, self.check = read_events(self.id_user, self.cursor)
+        # Пачка заполнена целиком - следующую читаем без паузы
+        self.backlog = self.check and len(batch) == BATCH_SIZE
+        chunks = []
+        for event in batch:
+            chunks.append(format_event(event['id'], event['kind'], event))
+            if event['kind'] == LOGOUT and event['payload'].get('session') == self.session_id:
+                self.closed = True
+                return chunks
+        if chunks:
+            self.last_ping = self.last_check
+        return chunks + self.idle()
+
+    def idle(self):
+        """Комментарий-пинг раз в 15 секунд без событий, чтобы прокси не закрывали соединение"""
+        now = time.monotonic()
+        if now - self.last_ping < 15:
+            return []
+        self.last_ping = now
+        return [': ping\n\n']
+
+    def step(self, version):
+        return self.poll(version) if self.due(version) else self.idle()
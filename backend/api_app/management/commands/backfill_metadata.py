@@ -0,0 +1,104 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api_app.chunking import read_chunks
+from api_app.encryption import get_master_key, iter_decrypted
+from api_app.models import Storage
+from api_app.sniffing import SNIFF_SIZE, sniff
+
+READ_SIZE = 1024 * 1024
+FIELDS = ['content_type', 'charset', 'file_mtime', 'checksum']
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет метаданные содержимого (content_type, charset, file_mtime, checksum) у файлов, '
+        'загруженных до их появления. Файлы читаются параллельно, записи обновляются пакетами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Количество потоков для чтения файлов (по умолчанию 8)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пакета записей (по умолчанию 500)')
+        parser.add_argument('--skip-checksums', action='store_true',
+                            help='Не вычислять контрольные суммы (читаются только первые байты файлов)')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.master_key = get_master_key()
+        counts = dict.fromkeys(('rows', 'updated', 'missing'), 0)
+
+        queryset = Storage.objects.filter(content_type__isnull=True).order_by('id_file')
+        last = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                # Пакеты по первичному ключу (keyset), без OFFSET
+                rows = list(queryset.filter(id_file__gt=last)[:options['batch_size']])
+                if not rows:
+                    break
+                last = rows[-1].id_file
+                counts['rows'] += len(rows)
+                updated = [row for row, ok in zip(rows, executor.map(self.fill_in_thread, rows)) if ok]
+                counts['missing'] += len(rows) - len(updated)
+                if updated:
+                    Storage.objects.bulk_update(updated, FIELDS)
+                    counts['updated'] += len(updated)
+                self.stdout.write(f'Обработано записей: {counts["rows"]}')
+
+        summary = ', '.join(f'{key}: {value}' for key, value in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Итого - {summary}'))
+
+    def fill_in_thread(self, file):
+        try:
+            return self.fill(file)
+        finally:
+            # Для файлов в хранилище блоков поток читает список блоков из БД
+            connections.close_all()
+
+    def fill(self, file):
+        """Заполняет поля file; False - если содержимое недоступно"""
+        need_checksum = file.checksum is None and not self.options['skip_checksums']
+        if file.encrypted and not self.master_key:
+            self.stderr.write(f'Нет ключа шифрования для id_file={file.id_file}')
+            return False
+        checksum = hashlib.sha256()
+        head = bytearray()
+        try:
+            if not file.chunked:
+                path = os.path.join(settings.MEDIA_ROOT, file.file.name)
+                file.file_mtime = datetime.fromtimestamp(os.stat(path).st_mtime, tz=timezone.utc)
+            for data in self.read_content(file, need_checksum):
+                if need_checksum:
+                    checksum.update(data)
+                if len(head) < SNIFF_SIZE:
+                    head.extend(data[:SNIFF_SIZE - len(head)])
+                elif not need_checksum:
+                    break
+        except Exception as e:
+            self.stderr.write(f'Не удалось прочитать id_file={file.id_file}: {e}')
+            return False
+        file.content_type, file.charset = sniff(bytes(head), file.original_name)
+        if need_checksum:
+            file.checksum = checksum.hexdigest()
+        return True
+
+    def read_content(self, file, whole):
+        if file.chunked:
+            hashes = list(file.chunk_hashes())
+            return read_chunks(hashes if whole else hashes[:1])
+        path = os.path.join(settings.MEDIA_ROOT, file.file.name)
+        if file.encrypted:
+            return iter_decrypted(path, self.master_key)
+        return self.read_file(path, None if whole else SNIFF_SIZE)
+
+    def read_file(self, path, limit):
+        with open(path, 'rb') as f:
+            while data := f.read(limit or READ_SIZE):
+                yield data
+                if limit:
+                    return
@@ -0,0 +1,75 @@
+import base64
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api_app.authentication import AccessTokenAuthentication, refresh_session, start_session
+from api_app.models import User
+
+PASSWORD = 'benchmark-password'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет процессорное время аутентификации одного запроса: Basic (пароль PBKDF2 на каждом запросе), '
+        'access-токен (HMAC и запрос сессии по первичному ключу) и обмен refresh-токена. '
+        'Временный пользователь создается в транзакции, которая затем откатывается'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Количество запросов для токенов (по умолчанию 200)')
+        parser.add_argument('--basic-requests', type=int, default=5, help='Количество запросов с Basic (по умолчанию 5)')
+
+    def measure(self, count, call):
+        """Процессорное и полное время одного вызова (медианы), мс"""
+        cpu, wall = [], []
+        for _ in range(count):
+            cpu_start, wall_start = time.process_time(), time.perf_counter()
+            call()
+            cpu.append(time.process_time() - cpu_start)
+            wall.append(time.perf_counter() - wall_start)
+        return statistics.median(cpu) * 1000, statistics.median(wall) * 1000
+
+    def authenticate(self, authentication, header):
+        request = Request(APIRequestFactory().get('/api/users/me/', HTTP_AUTHORIZATION=header))
+        result = authentication.authenticate(request)
+        assert result is not None, header
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        try:
+            with transaction.atomic():
+                results = self.run(count, options['basic_requests'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write('Аутентификация одного запроса (медиана, процессорное / полное время):')
+        for name, (cpu, wall) in results.items():
+            self.stdout.write(f'  {name:<42} {cpu:8.3f} / {wall:8.3f} мс')
+        basic, access = results['Basic (PBKDF2)'][0], results['Bearer access-токен'][0]
+        self.stdout.write(self.style.SUCCESS(f'Access-токен дешевле Basic по процессору: x{basic / max(access, 0.001):.0f}'))
+
+    def run(self, count, basic_count):
+        user = User.objects.create_user(email='benchmark-auth@example.invalid', username='benchmark-auth', password=PASSWORD)
+        basic = 'Basic ' + base64.b64encode(f'{user.username}:{PASSWORD}'.encode()).decode()
+        tokens = start_session(user)
+
+        results = {}
+        results['Basic (PBKDF2)'] = self.measure(basic_count, lambda: self.authenticate(BasicAuthentication(), basic))
+        results['Bearer access-токен'] = self.measure(
+            count, lambda: self.authenticate(AccessTokenAuthentication(), f'Bearer {tokens["access"]}'))
+
+        def refresh():
+            tokens.update(refresh_session(tokens['refresh']))
+        results['Обмен refresh-токена (/api/auth/refresh/)'] = self.measure(count, refresh)
+        return results
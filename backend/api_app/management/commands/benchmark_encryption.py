@@ -0,0 +1,81 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from api_app.encryption import EncryptedFile, encrypt_stream
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость записи/чтения файла без шифрования и с шифрованием (encryption.py), а также чтения с произвольного смещения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=256, help='Размер тестового файла в МБ (по умолчанию 256)')
+        parser.add_argument('--reads', type=int, default=1000, help='Количество чтений с произвольного смещения')
+
+    def iter_file(self, path, chunk_size=64 * 1024):
+        with open(path, 'rb') as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def measure(self, func):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        size = options['size_mb'] * 1024 * 1024
+        key = os.urandom(32)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'source')
+            plain = os.path.join(tmp, 'plain')
+            encrypted = os.path.join(tmp, 'encrypted')
+            with open(source, 'wb') as f:
+                for _ in range(size // (1024 * 1024)):
+                    f.write(os.urandom(1024 * 1024))
+
+            def copy_plain():
+                with open(plain, 'wb') as dst:
+                    for chunk in self.iter_file(source):
+                        dst.write(chunk)
+
+            def copy_encrypted():
+                with open(encrypted, 'wb') as dst:
+                    encrypt_stream(self.iter_file(source), dst, key)
+
+            def read_plain():
+                for _ in self.iter_file(plain):
+                    pass
+
+            def read_encrypted():
+                with EncryptedFile(encrypted, key) as f:
+                    for _ in f.iter_range():
+                        pass
+
+            results = [
+                ('Запись без шифрования', self.measure(copy_plain)),
+                ('Запись с шифрованием', self.measure(copy_encrypted)),
+                ('Чтение без шифрования', self.measure(read_plain)),
+                ('Чтение с расшифровкой', self.measure(read_encrypted)),
+            ]
+
+            # Чтение 4 КБ с произвольного смещения: расшифровывается только один-два сегмента
+            timings = []
+            with EncryptedFile(encrypted, key) as f:
+                for _ in range(options['reads']):
+                    offset = random.randrange(size - 4096)
+                    start = time.perf_counter()
+                    b''.join(f.iter_range(offset, offset + 4096))
+                    timings.append(time.perf_counter() - start)
+            overhead = os.path.getsize(encrypted) - os.path.getsize(plain)
+
+        self.stdout.write(f'Размер файла: {options["size_mb"]} МБ, накладные расходы на диске: {overhead} байт')
+        for title, seconds in results:
+            self.stdout.write(f'{title + ":":<25} {size / seconds / 1024 / 1024:8.1f} МБ/с')
+        self.stdout.write(self.style.SUCCESS(
+            f'Чтение 4 КБ с произвольного смещения: медиана {statistics.median(timings) * 1e6:.0f} мкс ({options["reads"]} чтений)'
+        ))
@@ -0,0 +1,53 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api_app.models import User, Storage
+from api_app.renderers import ORJSONRenderer
+from api_app.serializers import StorageSerializer, StorageListSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время сериализации списка файлов: StorageSerializer + JSONRenderer и StorageListSerializer + ORJSONRenderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Количество строк в списке (по умолчанию 10000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Количество повторов каждого замера')
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+
+        # Все тестовые данные создаются в транзакции и откатываются в конце
+        with transaction.atomic():
+            user = User.objects.create_user(email='benchmark@example.com', username='benchmark_user', password=None, fullname='Benchmark')
+            Storage.objects.bulk_create(
+                Storage(id_user=user, original_name=f'file_{i}.txt', comment=f'comment {i}', size=i, file=f'uploads/file_{i}.txt')
+                for i in range(rows)
+            )
+            queryset = Storage.objects.filter(id_user=user)
+
+            def current():
+                return JSONRenderer().render(StorageSerializer(queryset, many=True).data)
+
+            def lightweight():
+                return ORJSONRenderer().render(StorageListSerializer(queryset).data)
+
+            current_time = self.measure(current, repeat)
+            lightweight_time = self.measure(lightweight, repeat)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'Строк: {rows}, повторов: {repeat} (медиана)')
+        self.stdout.write(f'StorageSerializer + JSONRenderer:        {current_time * 1000:.1f} мс')
+        self.stdout.write(f'StorageListSerializer + ORJSONRenderer:  {lightweight_time * 1000:.1f} мс')
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: x{current_time / lightweight_time:.1f}'))
@@ -0,0 +1,102 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Выполняется в новом процессе Python: так измеряется холодный запуск, а не уже загруженный manage.py
+WORKER_SCRIPT = '''
+import io, json, os, sys, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+imported = time.perf_counter()
+mode, workers, path = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+
+def first_request():
+    began = time.perf_counter()
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+        'wsgi.errors': sys.stderr,
+    }
+    statuses = []
+    b''.join(application(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+    second = time.perf_counter()
+    b''.join(application(dict(environ, **{'wsgi.input': io.BytesIO()}), lambda *args: None))
+    return {'first': second - began, 'second': time.perf_counter() - second, 'status': statuses[0]}
+
+result = {'import': imported - started}
+if mode == 'preload':
+    from backend_project.warmup import warm_up
+    result['warm_up'] = warm_up()
+    # Как gunicorn с preload_app: воркеры создаются fork после загрузки приложения
+    result['workers'] = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        if os.fork() == 0:
+            os.close(read_fd)
+            os.write(write_fd, json.dumps(first_request()).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as pipe:
+            result['workers'].append(json.loads(pipe.read()))
+        os.wait()
+else:
+    result['workers'] = [first_request()]
+print(json.dumps(result))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет время запуска воркера до ответа на первый запрос: без preload (каждый воркер импортирует '
+        'и загружает приложение сам) и с preload_app + warm_up (как в gunicorn.conf.py)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Количество воркеров (по умолчанию 4)')
+        parser.add_argument('--repeat', type=int, default=3, help='Количество повторов каждого замера (по умолчанию 3)')
+        parser.add_argument('--path', default='/api/health/ready/', help='Путь первого запроса (по умолчанию /api/health/ready/)')
+
+    def run(self, mode, workers, path):
+        completed = subprocess.run(
+            [sys.executable, '-c', WORKER_SCRIPT, mode, str(workers), path],
+            cwd=settings.BASE_DIR, env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+            capture_output=True, text=True,
+        )
+        if completed.returncode:
+            raise CommandError(f'Ошибка запуска процесса:\n{completed.stderr[-2000:]}')
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        workers, repeat, path = options['workers'], options['repeat'], options['path']
+
+        cold, preloaded, imports, warm_ups = [], [], [], []
+        for _ in range(repeat):
+            # Без preload каждый воркер - отдельный холодный процесс
+            for _ in range(workers):
+                result = self.run('cold', 1, path)
+                worker = result['workers'][0]
+                cold.append((result['import'] + worker['first'], worker))
+                imports.append(result['import'])
+            result = self.run('preload', workers, path)
+            warm_ups.append(result['import'] + result['warm_up'])
+            preloaded.extend((worker['first'], worker) for worker in result['workers'])
+
+        ms = lambda values: f'{statistics.median(values) * 1000:.0f} мс'
+        self.stdout.write(f'Воркеров: {workers}, повторов: {repeat}, первый запрос: {path} (медиана)')
+        self.stdout.write(f'Импорт и django.setup():                   {ms(imports)}')
+        self.stdout.write(f'Без preload, запуск воркера до ответа:      {ms([total for total, _ in cold])}'
+                          f' (из них первый запрос {ms([worker["first"] for _, worker in cold])},'
+                          f' следующий {ms([worker["second"] for _, worker in cold])})')
+        self.stdout.write(f'С preload, загрузка в главном процессе:     {ms(warm_ups)} (один раз)')
+        self.stdout.write(f'С preload, запуск воркера до ответа:        {ms([total for total, _ in preloaded])}'
+                          f' (следующий запрос {ms([worker["second"] for _, worker in preloaded])})')
+        statuses = {worker['status'] for _, worker in cold + preloaded}
+        self.stdout.write(f'Статусы ответов: {", ".join(sorted(statuses))}')
+        speedup = statistics.median([total for total, _ in cold]) / statistics.median([total for total, _ in preloaded])
+        self.stdout.write(self.style.SUCCESS(f'Ускорение запуска воркера: x{speedup:.1f}'))
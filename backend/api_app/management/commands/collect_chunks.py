@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api_app.models import Chunk, ChunkUpload
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет блоки хранилища блоков, на которые не ссылается ни один файл (например, загруженные, но не собранные в файл), '
+        'и устаревшие подтверждения загрузки блоков'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, default=24, help='Не трогать блоки моложе этого возраста, ч (по умолчанию 24)')
+
+    def handle(self, *args, **options):
+        older_than = timezone.now() - timedelta(hours=options['grace_hours'])
+        # Подтверждения загрузки блоков, так и не собранных в файл
+        ChunkUpload.objects.filter(created_date__lt=older_than).delete()
+        released = Chunk.release(older_than=older_than)
+        self.stdout.write(self.style.SUCCESS(f'Удалено блоков: {released}'))
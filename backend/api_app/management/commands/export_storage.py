@@ -0,0 +1,198 @@
+import hashlib
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+from django.utils import timezone
+
+from api_app.chunking import read_chunks
+from api_app.encryption import get_master_key, iter_decrypted
+from api_app.models import Folder, Storage, StorageChunk, User
+from api_app.transfer import (
+    FILE_FIELDS, FOLDER_FIELDS, FORMAT, READ_SIZE, USER_FIELDS, DirectoryWriter, Pipe, TarWriter,
+    batch_name, body_name, encode_rows, iter_read,
+)
+
+# Поля, нужные только для чтения содержимого: в выгрузку не попадают
+CONTENT_FIELDS = ('chunked', 'encrypted', 'file')
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает пользователей, папки и файлы (метаданные в NDJSON и содержимое) в каталог или tar-поток '
+        'для переноса на другой сервер командой import_storage. Содержимое читается параллельно, '
+        'в памяти держится не больше одного пакета записей'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Каталог, файл .tar / .tar.gz или "-" (tar в stdout, например для передачи через ssh)')
+        parser.add_argument('--user', action='append', dest='users', help='Выгрузить только этого пользователя (username, можно указать несколько раз)')
+        parser.add_argument('--workers', type=int, default=8, help='Количество потоков для чтения содержимого (по умолчанию 8)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пакета записей (по умолчанию 1000)')
+        parser.add_argument('--resume', action='store_true', help='Продолжить прерванную выгрузку в каталог с последнего готового пакета')
+        parser.add_argument('--after-id', type=int, default=0,
+                            help='Выгрузить только файлы с id_file больше указанного (продолжение переноса через tar-поток)')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.master_key = get_master_key()
+        output = options['output']
+        # Если выгрузка идет в stdout, ход выполнения пишется в stderr
+        self.log = self.stderr.write if output == '-' else self.stdout.write
+
+        users = User.objects.all()
+        if options['users']:
+            users = users.filter(username__in=options['users'])
+        folders = Folder.objects.filter(id_user__in=users)
+        files = Storage.objects.filter(id_user__in=users)
+
+        if output == '-':
+            writer = TarWriter(sys.stdout.buffer)
+        elif output.endswith(('.tar', '.tar.gz', '.tgz')):
+            writer = TarWriter(open(output, 'wb'), compress=not output.endswith('.tar'), close_file=True)
+        else:
+            writer = DirectoryWriter(output)
+        if options['resume'] and not writer.parallel:
+            raise CommandError('--resume работает только с выгрузкой в каталог; для tar-потока используйте --after-id')
+
+        self.counts = dict.fromkeys(('users', 'folders', 'files', 'bytes', 'missing'), 0)
+        with writer, ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            self.writer, self.executor = writer, executor
+            writer.write_bytes('manifest.json', encode_rows([{'format': FORMAT, 'created': timezone.now(), 'users': options['users']}]))
+            self.export_table('users', users, 'id_user', USER_FIELDS)
+            self.export_table('folders', folders, 'path', FOLDER_FIELDS)
+            self.export_table('files', files, 'id_file', (*FILE_FIELDS, *CONTENT_FIELDS), after=options['after_id'])
+
+        summary = ', '.join(f'{key}: {value}' for key, value in self.counts.items())
+        style = self.style.WARNING if self.counts['missing'] else self.style.SUCCESS
+        self.log(style(f'Итого - {summary}'))
+
+    # Пакеты записей по ключу (keyset), без OFFSET
+    def keyset(self, queryset, key, fields, last=None):
+        if queryset.model is not User:
+            # Владелец указывается по username: id пользователей на новом сервере будут другими
+            queryset = queryset.annotate(username=F('id_user__username'))
+            fields = (*fields, 'username')
+        while True:
+            page = queryset.order_by(key)
+            if last is not None:
+                page = page.filter(**{f'{key}__gt': last})
+            rows = list(page.values(*fields)[:self.batch_size])
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][key]
+
+    def export_table(self, table, queryset, key, fields, after=0):
+        number, last = 0, after or None
+        if self.options['resume']:
+            number, last_row = self.writer.resume_point(table)
+            if last_row and (last is None or last_row[key] > last):
+                last = last_row[key]
+        for rows in self.keyset(queryset, key, fields, last):
+            number += 1
+            name = batch_name(table, number)
+            if table == 'files':
+                rows = self.export_files(name, rows)
+            else:
+                self.writer.write_bytes(name, encode_rows(rows))
+            self.counts[table] += len(rows)
+            self.log(f'{name}: {len(rows)}, последний {key}={rows[-1][key] if rows else "-"}')
+
+    def export_files(self, name, rows):
+        """
+        Выгружает пакет файлов: NDJSON и содержимое. В каталоге NDJSON пишется последним (пакет готов),
+        в tar-потоке - первым (импорт читает метаданные раньше содержимого). Возвращает выгруженные записи
+        """
+        hashes = {}
+        chunked_ids = [row['id_file'] for row in rows if row['chunked']]
+        if chunked_ids:
+            chunks = StorageChunk.objects.filter(storage_id__in=chunked_ids).order_by('storage_id', 'position').values_list('storage_id', 'chunk_id')
+            hashes = {id_file: [hash_hex for _, hash_hex in group] for id_file, group in groupby(chunks, key=lambda item: item[0])}
+
+        # Записи без файла на диске пропускаются (их находит scan_storage): проверка до записи NDJSON
+        present = list(self.executor.map(self.is_present, rows))
+        for row, ok in zip(rows, present):
+            if not ok:
+                self.counts['missing'] += 1
+                self.stderr.write(f'MISSING id_file={row["id_file"]} {row["file"]}')
+        rows = [row for row, ok in zip(rows, present) if ok]
+
+        if self.writer.parallel:
+            sizes = list(self.executor.map(lambda row: self.write_body(name, row, hashes.get(row['id_file'], [])), rows))
+            self.counts['missing'] += sizes.count(None)
+            self.counts['bytes'] += sum(size for size in sizes if size)
+            rows = [row for row, size in zip(rows, sizes) if size is not None]
+            self.writer.write_bytes(name, encode_rows(self.records(rows)))
+        else:
+            self.writer.write_bytes(name, encode_rows(self.records(rows)))
+            # tar пишется последовательно: содержимое следующих файлов читается заранее в ограниченные очереди
+            pipes = [Pipe() for _ in rows]
+            futures = [
+                self.executor.submit(pipe.feed, self.iter_content(row, hashes.get(row['id_file'], [])))
+                for row, pipe in zip(rows, pipes)
+            ]
+            try:
+                for row, pipe in zip(rows, pipes):
+                    self.writer.write_file(body_name(name, row['id_file']), row['size'], pipe)
+                    if pipe.read(1):
+                        raise CommandError(f'Размер содержимого id_file={row["id_file"]} больше указанного в БД')
+                    self.counts['bytes'] += row['size']
+            except BaseException:
+                for pipe in pipes:
+                    pipe.abort()
+                raise
+            for future in futures:
+                future.result()
+        return rows
+
+    def records(self, rows):
+        return [{field: value for field, value in row.items() if field not in CONTENT_FIELDS} for row in rows]
+
+    def is_present(self, row):
+        return row['chunked'] or os.path.isfile(os.path.join(settings.MEDIA_ROOT, row['file']))
+
+    def iter_content(self, row, hashes):
+        """Содержимое файла частями: расшифрованное и собранное из блоков"""
+        if row['chunked']:
+            return read_chunks(hashes, READ_SIZE)
+        path = os.path.join(settings.MEDIA_ROOT, row['file'])
+        if row['encrypted']:
+            if not self.master_key:
+                raise CommandError(f'Нет ключа шифрования для id_file={row["id_file"]}')
+            return iter_decrypted(path, self.master_key)
+        return self.read_file(path)
+
+    def read_file(self, path):
+        with open(path, 'rb') as f:
+            yield from iter_read(f)
+
+    def write_body(self, name, row, hashes):
+        """
+        Запись содержимого в каталог (из потока пула): возвращает размер или None при ошибке.
+        Недостающая контрольная сумма вычисляется по пути
+        """
+        checksum = hashlib.sha256()
+
+        def hashing():
+            for data in self.iter_content(row, hashes):
+                checksum.update(data)
+                yield data
+
+        body = body_name(name, row['id_file'])
+        try:
+            size = self.writer.write_parts(body, hashing())
+        except Exception as e:
+            self.stderr.write(f'ERROR id_file={row["id_file"]}: {e}')
+            return None
+        if size != row['size'] or (row['checksum'] and row['checksum'] != checksum.hexdigest()):
+            self.stderr.write(f'CORRUPT id_file={row["id_file"]} {row["file"]}')
+            os.remove(self.writer.path(body))
+            return None
+        row['checksum'] = checksum.hexdigest()
+        return size
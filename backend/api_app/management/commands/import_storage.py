@@ -0,0 +1,254 @@
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from api_app import events
+from api_app.encryption import get_master_key
+from api_app.models import Chunk, Folder, Storage, StorageChunk, StorageEvent, User
+from api_app.transfer import FORMAT, USER_FIELDS, DirectorySource, Pipe, PipeAborted, TarSource, decode_rows, iter_read
+from api_app.uploads import resolve_names, store_content
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает выгрузку export_storage (каталог, файл .tar / .tar.gz или "-" - tar из stdin). '
+        'Записи добавляются пакетами через bulk_create, содержимое записывается заново (шифрование и режим '
+        'хранения - по настройкам этого сервера) с проверкой контрольных сумм. Повторный запуск продолжает '
+        'прерванный импорт: существующие пользователи, папки и файлы с той же контрольной суммой пропускаются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Каталог, файл .tar / .tar.gz или "-" (tar из stdin)')
+        parser.add_argument('--workers', type=int, default=8, help='Количество потоков для записи содержимого (по умолчанию 8)')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if source == '-':
+            self.source = TarSource(sys.stdin.buffer)
+        elif os.path.isdir(source):
+            self.source = DirectorySource(source)
+        elif os.path.isfile(source):
+            self.source = TarSource(open(source, 'rb'), close_file=True)
+        else:
+            raise CommandError(f'Выгрузка не найдена: {source}')
+
+        self.master_key = get_master_key()
+        self.chunk_mode = settings.STORAGE_CHUNK_MODE
+        # id папки в выгрузке -> (id, path) на этом сервере
+        self.folders = {}
+        self.counts = dict.fromkeys(('users', 'folders', 'files', 'bytes', 'skipped', 'errors'), 0)
+
+        with self.source, ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            self.executor = executor
+            for name, data in self.source:
+                if name == 'manifest.json':
+                    manifest = decode_rows(data)[0]
+                    if manifest.get('format') != FORMAT:
+                        raise CommandError(f'Неподдерживаемый формат выгрузки: {manifest.get("format")}')
+                elif name.startswith('users/'):
+                    self.import_users(decode_rows(data))
+                elif name.startswith('folders/'):
+                    self.import_folders(decode_rows(data))
+                elif name.startswith('files/') and name.endswith('.ndjson'):
+                    records = decode_rows(data)
+                    self.import_files(name, records)
+                    if records:
+                        # По этому id выгрузку можно продолжить: export_storage --after-id
+                        name = f'{name} (последний id_file={records[-1]["id_file"]})'
+                else:
+                    continue
+                self.stdout.write(f'{name}: готово')
+
+        summary = ', '.join(f'{key}: {value}' for key, value in self.counts.items())
+        style = self.style.WARNING if self.counts['errors'] else self.style.SUCCESS
+        self.stdout.write(style(f'Итого - {summary}'))
+
+    def user_ids(self, records):
+        usernames = {record['username'] for record in records}
+        return dict(User.objects.filter(username__in=usernames).values_list('username', 'id_user'))
+
+    def import_users(self, records):
+        """Новые пользователи - одним bulk_create; существующие (по username) остаются как есть"""
+        existing = self.user_ids(records)
+        taken_emails = set(User.objects.filter(email__in=[record['email'] for record in records]).values_list('email', flat=True))
+        new_users = []
+        for record in records:
+            if record['username'] in existing:
+                continue
+            if record['email'] in taken_emails:
+                self.counts['errors'] += 1
+                self.stderr.write(f'Пропущен пользователь {record["username"]}: email {record["email"]} уже занят')
+                continue
+            # Пароль переносится в виде хэша
+            new_users.append(User(**{field: record[field] for field in USER_FIELDS if field != 'id_user'}))
+        User.objects.bulk_create(new_users)
+        self.counts['users'] += len(new_users)
+
+    def import_folders(self, records):
+        """
+        Папки пакета уровень за уровнем (родитель раньше вложенных): существующая папка с тем же
+        родителем и именем используется повторно, новые - bulk_create, затем пути одним bulk_update
+        """
+        users = self.user_ids(records)
+        levels = defaultdict(list)
+        for record in records:
+            levels[len(Folder.ids_from_path(record['path']))].append(record)
+
+        for depth in sorted(levels):
+            pending = []
+            for record in levels[depth]:
+                id_user = users.get(record['username'])
+                parent = self.folders.get(record['parent']) if record['parent'] else (None, '/')
+                if id_user is None or parent is None:
+                    self.counts['skipped'] += 1
+                    continue
+                pending.append((record, id_user, parent))
+            if not pending:
+                continue
+
+            existing = {
+                (folder.id_user_id, folder.parent_id, folder.name): folder
+                for folder in Folder.objects.filter(
+                    id_user__in={id_user for _, id_user, _ in pending},
+                    name__in={record['name'] for record, _, _ in pending},
+                )
+            }
+            resolved, created = {}, []
+            for record, id_user, (parent_id, parent_path) in pending:
+                folder = existing.get((id_user, parent_id, record['name']))
+                if folder is None:
+                    folder = Folder(id_user_id=id_user, parent_id=parent_id, name=record['name'], depth=depth - 1)
+                    created.append((folder, parent_path))
+                resolved[record['id_folder']] = folder
+            with transaction.atomic():
+                # Путь строится из id, поэтому заполняется после вставки (как в Folder.save)
+                Folder.objects.bulk_create([folder for folder, _ in created])
+                for folder, parent_path in created:
+                    folder.path = f'{parent_path}{folder.id_folder}/'
+                Folder.objects.bulk_update([folder for folder, _ in created], ['path'])
+            self.folders.update((id_folder, (folder.id_folder, folder.path)) for id_folder, folder in resolved.items())
+            self.counts['folders'] += len(created)
+
+    def import_files(self, name, records):
+        users = self.user_ids(records)
+        existing = set(
+            Storage.objects.filter(id_user__in=users.values(), original_name__in={record['original_name'] for record in records})
+            .values_list('id_user', 'folder', 'original_name', 'checksum')
+        )
+        # Имена новых файлов подбираются как при загрузке: name, name(1)... (по пользователям)
+        planned = defaultdict(list)
+        files, folder_paths = {}, {}
+        for record in records:
+            id_user = users.get(record['username'])
+            folder_id, folder_path = self.folders.get(record['folder'], (None, None)) if record['folder'] else (None, '')
+            if id_user is None or folder_path is None:
+                self.counts['skipped'] += 1
+                continue
+            if record['checksum'] and (id_user, folder_id, record['original_name'], record['checksum']) in existing:
+                # Файл уже перенесен прошлым запуском
+                self.counts['skipped'] += 1
+                continue
+            files[record['id_file']] = Storage(
+                id_user_id=id_user, folder_id=folder_id, original_name=record['original_name'],
+                comment=record['comment'], size=0, last_download_date=record['last_download_date'],
+            )
+            folder_paths[record['id_file']] = folder_path
+            planned[id_user].append(record['id_file'])
+        for id_user, ids in planned.items():
+            for id_file, final_name in zip(ids, resolve_names(id_user, [files[id_file].original_name for id_file in ids])):
+                files[id_file].original_name = final_name
+
+        stored = []
+        if self.source.parallel:
+            items = [(record, open_body, files[record['id_file']]) for record, open_body in self.source.bodies(name, records) if record['id_file'] in files]
+            stored = list(self.executor.map(lambda item: self.store_in_thread(*item), items))
+        else:
+            # Содержимое читается из потока по порядку, запись (шифрование, разбиение на блоки) идет в пуле потоков
+            futures = []
+            for record, open_body in self.source.bodies(name, records):
+                storage_file = files.get(record['id_file'])
+                if storage_file is None:
+                    continue
+                pipe = Pipe()
+                futures.append((record, storage_file, self.executor.submit(self.store_in_thread, record, lambda pipe=pipe: pipe, storage_file)))
+                try:
+                    pipe.feed(iter_read(open_body()))
+                except PipeAborted:
+                    pass
+            stored = [future.result() for _, _, future in futures]
+            items = [(record, None, storage_file) for record, storage_file, _ in futures]
+
+        created, chunk_rows, folder_totals = [], [], defaultdict(lambda: [0, 0])
+        for (record, _, storage_file), (hashes, error) in zip(items, stored):
+            if error:
+                self.counts['errors'] += 1
+                self.stderr.write(f'Ошибка файла id_file={record["id_file"]} ({record["original_name"]}): {error}')
+                continue
+            created.append((storage_file, record['upload_date']))
+            chunk_rows.extend(StorageChunk(storage=storage_file, position=position, chunk_id=hash_hex) for position, hash_hex in enumerate(hashes or []))
+            if storage_file.folder_id:
+                totals = folder_totals[folder_paths[record['id_file']]]
+                totals[0] += 1
+                totals[1] += storage_file.size
+
+        try:
+            with transaction.atomic():
+                Storage.objects.bulk_create([storage_file for storage_file, _ in created])
+                # upload_date заполняется автоматически при вставке: возвращаем дату со старого сервера
+                for storage_file, upload_date in created:
+                    storage_file.upload_date = upload_date
+                Storage.objects.bulk_update([storage_file for storage_file, _ in created], ['upload_date'])
+                StorageChunk.objects.bulk_create(chunk_rows)
+                for path, (files_delta, size_delta) in folder_totals.items():
+                    Folder.adjust_totals(path, files_delta, size_delta)
+                events.emit_many([
+                    StorageEvent(id_user_id=storage_file.id_user_id, kind=events.UPLOAD, id_file=storage_file.id_file, payload=events.file_payload(storage_file))
+                    for storage_file, _ in created
+                ])
+        except Exception:
+            for storage_file, _ in created:
+                self.remove_content(storage_file, None)
+            Chunk.release([row.chunk_id for row in chunk_rows])
+            raise
+        self.counts['files'] += len(created)
+        self.counts['bytes'] += sum(storage_file.size for storage_file, _ in created)
+
+    def store_in_thread(self, record, open_body, storage_file):
+        try:
+            return self.store(record, open_body, storage_file)
+        finally:
+            # В режиме блоков поток работает с БД: закрываем его соединения
+            connections.close_all()
+
+    def store(self, record, open_body, storage_file):
+        """Записывает содержимое и сверяет размер и контрольную сумму: (хэши блоков, None) или (None, ошибка)"""
+        fileobj = None
+        try:
+            fileobj = open_body()
+            hashes = store_content(storage_file, fileobj, record['original_name'], self.master_key, self.chunk_mode)
+        except Exception as e:
+            if isinstance(fileobj, Pipe):
+                fileobj.abort()
+            return None, str(e)
+        finally:
+            if fileobj is not None and not isinstance(fileobj, Pipe):
+                fileobj.close()
+        if storage_file.size != record['size'] or (record['checksum'] and storage_file.checksum != record['checksum']):
+            self.remove_content(storage_file, hashes)
+            return None, 'размер или контрольная сумма не совпадает с выгрузкой'
+        # Тип содержимого из выгрузки: в потоке первые байты заранее не прочитать
+        for field in ('content_type', 'charset', 'file_mtime'):
+            if record[field]:
+                setattr(storage_file, field, record[field])
+        return hashes, None
+
+    def remove_content(self, storage_file, hashes):
+        if storage_file.file and os.path.isfile(storage_file.file.path):
+            os.remove(storage_file.file.path)
+        if hashes:
+            Chunk.release(hashes)
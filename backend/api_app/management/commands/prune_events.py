@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api_app.models import StorageEvent
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые события из журнала ленты изменений (клиенты с более старым курсором получат reset)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=settings.EVENTS_RETENTION_HOURS,
+                            help=f'Хранить события за последние N часов (по умолчанию {settings.EVENTS_RETENTION_HOURS})')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        latest = StorageEvent.objects.order_by('-id').values_list('id', flat=True).first()
+        # Последнее событие не удаляем никогда: по самому старому событию клиенты определяют, устарел ли их курсор
+        deleted = StorageEvent.objects.filter(created_date__lt=cutoff, id__lt=latest or 0).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Удалено событий: {deleted}'))
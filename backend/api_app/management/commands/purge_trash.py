@@ -0,0 +1,65 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api_app.models import Chunk, PurgeItem, Storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из корзины файлы старше срока хранения (строки, файлы на диске и освободившиеся блоки) '
+        'и обрабатывает очередь PurgeItem (содержимое удаленных пользователей). Работает пакетами с паузой '
+        'между ними, чтобы не нагружать диск и БД; запускается по расписанию (cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TRASH_RETENTION_DAYS,
+                            help=f'Удалять файлы, находящиеся в корзине дольше N дней (по умолчанию {settings.TRASH_RETENTION_DAYS})')
+        parser.add_argument('--batch-size', type=int, default=500, help='Файлов в одном пакете (по умолчанию 500)')
+        parser.add_argument('--pause', type=float, default=0.5, help='Пауза между пакетами, сек (по умолчанию 0.5)')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.pause = options['pause']
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        files = self.purge_trash(cutoff)
+        queued = self.purge_queue()
+        self.stdout.write(self.style.SUCCESS(f'Удалено из корзины: {files}, из очереди: {queued}'))
+
+    def batches(self, queryset):
+        """Пакеты первичных ключей (keyset, без OFFSET) с паузой между пакетами"""
+        last = 0
+        while True:
+            ids = list(queryset.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:self.batch_size])
+            if not ids:
+                return
+            yield ids
+            last = ids[-1]
+            time.sleep(self.pause)
+
+    def purge_trash(self, cutoff):
+        deleted = 0
+        queryset = Storage.all_objects.filter(deleted_at__lt=cutoff)
+        for ids in self.batches(queryset):
+            # Повторный фильтр: файл могли восстановить, пока шли предыдущие пакеты
+            deleted += queryset.filter(id_file__in=ids).delete_files()
+        return deleted
+
+    def purge_queue(self):
+        purged = 0
+        for ids in self.batches(PurgeItem.objects.all()):
+            items = list(PurgeItem.objects.filter(id__in=ids).values_list('file', 'chunk_hash'))
+            for name, _ in items:
+                path = os.path.join(settings.MEDIA_ROOT, name) if name else None
+                if path and os.path.isfile(path):
+                    os.remove(path)
+            hashes = [hash_hex for _, hash_hex in items if hash_hex]
+            if hashes:
+                # Блоки, на которые еще ссылаются другие файлы, Chunk.release не удаляет
+                Chunk.release(hashes)
+            purged += PurgeItem.objects.filter(id__in=ids).delete()[0]
+        return purged
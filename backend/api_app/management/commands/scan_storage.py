@@ -0,0 +1,222 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api_app.chunking import chunk_path
+from api_app.encryption import get_master_key, iter_decrypted
+from api_app.models import Chunk, Storage
+from api_app.throttling import BandwidthLimiter, TokenBucket
+
+READ_SIZE = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет согласованность файлов на диске и таблиц storage/chunks: файлы без записи в БД (сироты), '
+        'записи без файла, несовпадение размера и (с --verify) контрольных сумм. '
+        'Обход диска и проверка идут параллельно, в памяти держится не больше одного пакета'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Количество потоков для обхода диска и проверки (по умолчанию 8)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Размер пакета для запросов к БД (по умолчанию 2000)')
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help='Файлы моложе этого возраста не считаются сиротами (идущие загрузки), мин (по умолчанию 60)')
+        parser.add_argument('--quarantine', action='store_true', help='Переместить файлы-сироты в MEDIA_ROOT/quarantine/<дата>/')
+        parser.add_argument('--delete-dangling', action='store_true', help='Удалить записи storage, у которых нет файла на диске')
+        parser.add_argument('--verify', action='store_true',
+                            help='Прочитать файлы и сверить sha256 (пустые контрольные суммы заполняются)')
+        parser.add_argument('--verify-rate', type=int, default=50, help='Ограничение скорости чтения при --verify, МБ/с (0 - без ограничения)')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.grace = time.time() - options['grace_minutes'] * 60
+        self.quarantine_dir = os.path.join(settings.MEDIA_ROOT, 'quarantine', timezone.now().strftime('%Y%m%d-%H%M%S'))
+        self.limiter = BandwidthLimiter([TokenBucket('scan_storage', options['verify_rate'] * 1024 * 1024)])
+        self.master_key = get_master_key() if options['verify'] else None
+        self.counts = dict.fromkeys(('files', 'rows', 'chunks', 'orphans', 'dangling', 'size_mismatch', 'corrupt', 'filled'), 0)
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            self.executor = executor
+            # 1. Диск -> БД: файлы-сироты
+            for batch in self.walk(os.path.join(settings.MEDIA_ROOT, 'uploads')):
+                self.check_upload_batch(batch)
+            for batch in self.walk(os.path.join(settings.MEDIA_ROOT, 'chunks')):
+                self.check_chunk_file_batch(batch)
+            # 2. БД -> диск: записи без файлов, размер, контрольные суммы
+            self.scan_storage_rows()
+            self.scan_chunk_rows()
+
+        summary = ', '.join(f'{key}: {value}' for key, value in self.counts.items())
+        style = self.style.SUCCESS if not (self.counts['orphans'] or self.counts['dangling'] or self.counts['corrupt']) else self.style.WARNING
+        self.stdout.write(style(f'Итого - {summary}'))
+
+    # Параллельный обход каталога: пакеты (относительный путь от MEDIA_ROOT, mtime)
+    def walk(self, root):
+        if not os.path.isdir(root):
+            return
+        batches = queue.Queue(maxsize=self.options['workers'] * 4)
+        pending = [1]
+        lock = threading.Lock()
+        done = object()
+
+        def scan(path):
+            try:
+                batch = []
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            with lock:
+                                pending[0] += 1
+                            self.executor.submit(scan, entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            batch.append((os.path.relpath(entry.path, settings.MEDIA_ROOT), entry.stat().st_mtime))
+                            if len(batch) >= self.batch_size:
+                                batches.put(batch)
+                                batch = []
+                if batch:
+                    batches.put(batch)
+            except OSError as e:
+                self.stderr.write(f'Ошибка чтения каталога {path}: {e}')
+            finally:
+                with lock:
+                    pending[0] -= 1
+                    if not pending[0]:
+                        batches.put(done)
+
+        self.executor.submit(scan, root)
+        while (batch := batches.get()) is not done:
+            yield batch
+
+    def check_upload_batch(self, batch):
+        self.counts['files'] += len(batch)
+        names = [name.replace(os.sep, '/') for name, _ in batch]
+        known = set(Storage.all_objects.filter(file__in=names).values_list('file', flat=True))
+        for name, (path, mtime) in zip(names, batch):
+            if name not in known and mtime < self.grace:
+                self.report_orphan(path)
+
+    def check_chunk_file_batch(self, batch):
+        hashes = [os.path.basename(name) for name, _ in batch]
+        known = set(Chunk.objects.filter(hash__in=hashes).values_list('hash', flat=True))
+        for hash_hex, (path, mtime) in zip(hashes, batch):
+            # Незаконченные временные файлы write_chunk тоже попадают сюда по возрасту
+            if hash_hex not in known and mtime < self.grace:
+                self.report_orphan(path)
+
+    def report_orphan(self, path):
+        self.counts['orphans'] += 1
+        if self.options['quarantine']:
+            target = os.path.join(self.quarantine_dir, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(os.path.join(settings.MEDIA_ROOT, path), target)
+            self.stdout.write(f'ORPHAN {path} -> {os.path.relpath(target, settings.MEDIA_ROOT)}')
+        else:
+            self.stdout.write(f'ORPHAN {path}')
+
+    # Пакеты записей по первичному ключу (keyset), без OFFSET
+    def keyset(self, queryset, key, fields):
+        last = None
+        while True:
+            page = queryset.order_by(key)
+            if last is not None:
+                page = page.filter(**{f'{key}__gt': last})
+            rows = list(page.values(key, *fields)[:self.batch_size])
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][key]
+
+    def scan_storage_rows(self):
+        queryset = Storage.all_objects.filter(chunked=False)
+        for rows in self.keyset(queryset, 'id_file', ('file', 'size', 'encrypted', 'checksum')):
+            self.counts['rows'] += len(rows)
+            dangling, filled = [], []
+            for row, result in zip(rows, self.executor.map(self.check_storage_row, rows)):
+                if result == 'missing':
+                    dangling.append(row['id_file'])
+                    self.stdout.write(f'DANGLING storage id_file={row["id_file"]} {row["file"]}')
+                elif result == 'size':
+                    self.counts['size_mismatch'] += 1
+                    self.stdout.write(f'SIZE_MISMATCH storage id_file={row["id_file"]} {row["file"]}')
+                elif result == 'corrupt':
+                    self.counts['corrupt'] += 1
+                    self.stdout.write(f'CORRUPT storage id_file={row["id_file"]} {row["file"]}')
+                elif result:
+                    filled.append(Storage(id_file=row['id_file'], checksum=result))
+            self.counts['dangling'] += len(dangling)
+            if filled:
+                Storage.all_objects.bulk_update(filled, ['checksum'])
+                self.counts['filled'] += len(filled)
+            if dangling and self.options['delete_dangling']:
+                Storage.all_objects.filter(id_file__in=dangling).delete_files()
+
+    def check_storage_row(self, row):
+        """None - в порядке, 'missing' / 'size' / 'corrupt' - проблема, иначе - вычисленная контрольная сумма для заполнения"""
+        path = os.path.join(settings.MEDIA_ROOT, row['file'])
+        try:
+            disk_size = os.stat(path).st_size
+        except FileNotFoundError:
+            return 'missing'
+        if not row['encrypted'] and disk_size != row['size']:
+            return 'size'
+        if not self.options['verify'] or (row['encrypted'] and not self.master_key):
+            return None
+        checksum = hashlib.sha256()
+        try:
+            for data in self.read_content(path, row['encrypted']):
+                checksum.update(data)
+        except Exception:
+            # Для зашифрованных файлов - ошибка проверки тега (InvalidTag): файл поврежден
+            return 'corrupt'
+        if row['checksum'] is None:
+            return checksum.hexdigest()
+        return None if checksum.hexdigest() == row['checksum'] else 'corrupt'
+
+    def read_content(self, path, encrypted):
+        if encrypted:
+            parts = iter_decrypted(path, self.master_key)
+        else:
+            parts = self.read_file(path)
+        for data in parts:
+            self.limiter.consume(len(data))
+            yield data
+
+    def read_file(self, path):
+        with open(path, 'rb') as f:
+            while data := f.read(READ_SIZE):
+                yield data
+
+    def scan_chunk_rows(self):
+        for rows in self.keyset(Chunk.objects.all(), 'hash', ('size',)):
+            self.counts['chunks'] += len(rows)
+            for row, result in zip(rows, self.executor.map(self.check_chunk_row, rows)):
+                if result == 'missing':
+                    self.counts['dangling'] += 1
+                    self.stdout.write(f'DANGLING chunk {row["hash"]}')
+                elif result:
+                    self.counts[result] += 1
+                    self.stdout.write(f'{result.upper()} chunk {row["hash"]}')
+
+    def check_chunk_row(self, row):
+        path = chunk_path(row['hash'])
+        try:
+            if os.stat(path).st_size != row['size']:
+                return 'size_mismatch'
+        except FileNotFoundError:
+            return 'missing'
+        if self.options['verify']:
+            checksum = hashlib.sha256()
+            for data in self.read_content(path, False):
+                checksum.update(data)
+            if checksum.hexdigest() != row['hash']:
+                return 'corrupt'
+        return None
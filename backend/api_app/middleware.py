@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import random
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+
+from .authentication import AccessTokenAuthentication
+from .models import ProfileReport
+from .profiling import RequestProfiler
+from .routers import has_written, use_replica
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Разрешает чтение с реплики для GET/HEAD-запросов по путям из DATABASE_REPLICA_PATHS.
+    После запроса с записью клиент на DATABASE_REPLICA_STICKY_SECONDS секунд "прилипает" к основной БД,
+    чтобы сразу видеть свои изменения (загрузка, переименование и т.п.).
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths = [re.compile(path) for path in settings.DATABASE_REPLICA_PATHS]
+
+    def client_key(self, request):
+        # Клиента определяем по токену/сессии, без обращения к БД
+        ident = (
+            request.META.get('HTTP_AUTHORIZATION')
+            or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+            or request.META.get('REMOTE_ADDR', '')
+        )
+        return 'db_sticky:' + hashlib.sha256(ident.encode()).hexdigest()
+
+    def __call__(self, request):
+        if 'replica' not in settings.DATABASES:
+            return self.get_response(request)
+
+        key = self.client_key(request)
+        replica_allowed = (
+            request.method in ('GET', 'HEAD')
+            and any(path.match(request.path) for path in self.paths)
+            and not cache.get(key)
+        )
+        replica_token = use_replica.set(replica_allowed)
+        written_token = has_written.set(False)
+        try:
+            response = self.get_response(request)
+            if has_written.get():
+                cache.set(key, True, settings.DATABASE_REPLICA_STICKY_SECONDS)
+            return response
+        finally:
+            use_replica.reset(replica_token)
+            has_written.reset(written_token)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование запросов по требованию (PROFILING_ENABLED):
+    - запросы с заголовком X-Profile: 1 - только с токеном staff/администратора в заголовке Authorization
+      (проверяется до выполнения запроса, чтобы анонимный клиент не мог включить профилирование);
+    - случайная доля запросов PROFILING_SAMPLE_RATE.
+    В процессе одновременно профилируется не больше одного запроса, ошибки профилировщика не ломают ответ.
+    Отчеты хранятся в ProfileReport, не больше PROFILING_MAX_REPORTS последних.
+    """
+    authentication_classes = (AccessTokenAuthentication,)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_staff(self, user):
+        return bool(user and user.is_authenticated and (user.is_staff or user.is_superuser or user.role == 'admin'))
+
+    def header_user(self, request):
+        """Пользователь по токену из заголовка Authorization (None - заголовка нет или токен недействителен)"""
+        if not request.headers.get('Authorization'):
+            return None
+        drf_request = Request(request)
+        for authentication_class in self.authentication_classes:
+            try:
+                result = authentication_class().authenticate(drf_request)
+            except AuthenticationFailed:
+                return None
+            if result:
+                return result[0]
+        return None
+
+    def __call__(self, request):
+        if not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+
+        requested = request.headers.get('X-Profile') == '1' and self.is_staff(self.header_user(request))
+        sampled = not requested and random.random() < settings.PROFILING_SAMPLE_RATE
+        if not (requested or sampled):
+            return self.get_response(request)
+
+        profiler = RequestProfiler()
+        try:
+            started = profiler.start()
+        except Exception:
+            logger.exception('Не удалось включить профилирование: %s', request.path)
+            started = False
+        if not started:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            try:
+                profiler.stop()
+            except Exception:
+                logger.exception('Ошибка при остановке профилирования: %s', request.path)
+
+        try:
+            report = self.save_report(request, response, profiler, sampled)
+            if requested:
+                response['X-Profile-Id'] = str(report.id_report)
+        except Exception:
+            # Ошибка сохранения отчета не должна ломать ответ
+            logger.exception('Не удалось сохранить отчет профилирования: %s', request.path)
+        return response
+
+    def save_report(self, request, response, profiler, sampled):
+        user = getattr(request, 'user', None)
+        # Отчет пишем явно в основную БД (мимо роутера), чтобы не включать "прилипание" к ней
+        report = ProfileReport(
+            method=request.method,
+            path=request.get_full_path()[:512],
+            status_code=response.status_code,
+            id_user=user if user and user.is_authenticated else None,
+            sampled=sampled,
+            duration_ms=profiler.duration * 1000,
+            query_count=profiler.collector.count,
+            query_time_ms=profiler.collector.total * 1000,
+            profile=profiler.stats_text(settings.PROFILING_TOP_FUNCTIONS),
+            queries=profiler.collector.queries,
+        )
+        report.save(using='default')
+        ProfileReport.prune(settings.PROFILING_MAX_REPORTS)
+        logger.info('Отчет профилирования %s: %s %s, %.1f мс, SQL: %s',
+                    report.id_report, request.method, request.path, report.duration_ms, report.query_count)
+        return report
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-19 08:58
+
+import api_app.operations
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0007_alter_storage_token'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='storage',
+            index=models.Index(fields=['id_user', '-upload_date'], name='storage_user_upload_idx'),
+        ),
+        # Trigram-индексы по UPPER(...): Django генерирует icontains/istartswith как UPPER(col) LIKE UPPER(...)
+        api_app.operations.PostgresRunSQL(
+            sql='CREATE INDEX storage_name_trgm_idx ON storage USING gin (UPPER(original_name) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS storage_name_trgm_idx',
+        ),
+        api_app.operations.PostgresRunSQL(
+            sql='CREATE INDEX storage_comment_trgm_idx ON storage USING gin (UPPER(comment) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS storage_comment_trgm_idx',
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.7 on 2026-10-19 08:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0008_storage_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Folder',
+            fields=[
+                ('id_folder', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=128)),
+                ('path', models.CharField(blank=True, default='', max_length=1024)),
+                ('depth', models.PositiveIntegerField(default=0)),
+                ('files_total', models.BigIntegerField(default=0)),
+                ('size_total', models.BigIntegerField(default=0)),
+                ('created_date', models.DateTimeField(auto_now_add=True, db_column='createddate')),
+                ('id_user', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, related_name='folders', to=settings.AUTH_USER_MODEL)),
+                ('parent', models.ForeignKey(blank=True, db_column='parent_id', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='api_app.folder')),
+            ],
+            options={
+                'db_table': 'folders',
+            },
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='folder',
+            field=models.ForeignKey(blank=True, db_column='folder_id', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='files', to='api_app.folder'),
+        ),
+        migrations.AddIndex(
+            model_name='storage',
+            index=models.Index(fields=['id_user', 'folder', '-upload_date'], name='storage_user_folder_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['path'], name='folder_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddConstraint(
+            model_name='folder',
+            constraint=models.UniqueConstraint(fields=('parent', 'name'), name='folder_unique_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='folder',
+            constraint=models.UniqueConstraint(condition=models.Q(('parent__isnull', True)), fields=('id_user', 'name'), name='folder_unique_root_name'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0009_folders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storage',
+            name='token_rate_limit',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0010_storage_token_rate_limit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Chunk',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.IntegerField()),
+                ('created_date', models.DateTimeField(auto_now_add=True, db_column='createddate')),
+            ],
+            options={
+                'db_table': 'chunks',
+            },
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='chunked',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='StorageChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('chunk', models.ForeignKey(db_column='chunk_hash', on_delete=django.db.models.deletion.PROTECT, related_name='refs', to='api_app.chunk')),
+                ('storage', models.ForeignKey(db_column='file_id', on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api_app.storage')),
+            ],
+            options={
+                'db_table': 'storage_chunks',
+                'constraints': [models.UniqueConstraint(fields=('storage', 'position'), name='storage_chunk_position')],
+            },
+        ),
+    ]
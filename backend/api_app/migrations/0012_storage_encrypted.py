@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0011_chunk_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storage',
+            name='encrypted',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0012_storage_encrypted'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=8)),
+                ('period_start', models.DateTimeField()),
+                ('id_file', models.IntegerField(db_column='file_id')),
+                ('channel', models.CharField(max_length=8)),
+                ('downloads', models.BigIntegerField(default=0)),
+                ('bytes_sent', models.BigIntegerField(default=0)),
+                ('id_user', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, related_name='download_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'download_stats',
+                'indexes': [models.Index(fields=['period', 'period_start'], name='download_stat_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start', 'id_file', 'channel'), name='download_stat_bucket')],
+            },
+        ),
+    ]
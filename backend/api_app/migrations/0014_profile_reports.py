@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0013_download_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileReport',
+            fields=[
+                ('id_report', models.AutoField(primary_key=True, serialize=False)),
+                ('created_date', models.DateTimeField(auto_now_add=True, db_column='createddate')),
+                ('method', models.CharField(max_length=8)),
+                ('path', models.CharField(max_length=512)),
+                ('status_code', models.IntegerField()),
+                ('sampled', models.BooleanField(default=False)),
+                ('duration_ms', models.FloatField()),
+                ('query_count', models.IntegerField()),
+                ('query_time_ms', models.FloatField()),
+                ('profile', models.TextField()),
+                ('queries', models.JSONField(default=list)),
+                ('id_user', models.ForeignKey(blank=True, db_column='user_id', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profile_reports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'profile_reports',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0014_profile_reports'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storage',
+            name='checksum',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
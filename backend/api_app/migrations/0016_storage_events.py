@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:18
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0015_storage_checksum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=16)),
+                ('id_file', models.IntegerField(blank=True, db_column='file_id', null=True)),
+                ('payload', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_date', models.DateTimeField(auto_now_add=True, db_column='createddate')),
+                ('id_user', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, related_name='events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'storage_events',
+                'indexes': [models.Index(fields=['id_user', 'id'], name='storage_event_cursor_idx')],
+            },
+        ),
+    ]
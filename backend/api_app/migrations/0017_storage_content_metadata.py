@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0016_storage_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storage',
+            name='charset',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='content_type',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='file_mtime',
+            field=models.DateTimeField(blank=True, db_column='filemtime', null=True),
+        ),
+        migrations.AlterField(
+            model_name='storage',
+            name='token',
+            field=models.CharField(blank=True, db_index=True, max_length=128, null=True),
+        ),
+    ]
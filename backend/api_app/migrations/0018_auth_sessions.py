@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0017_storage_content_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthSession',
+            fields=[
+                ('id_session', models.BigAutoField(primary_key=True, serialize=False)),
+                ('refresh_hash', models.CharField(max_length=64, unique=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True, db_column='createddate')),
+                ('expires', models.DateTimeField()),
+                ('id_user', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, related_name='auth_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'auth_sessions',
+                'indexes': [models.Index(fields=['id_user', 'expires'], name='auth_session_user_idx')],
+            },
+        ),
+    ]
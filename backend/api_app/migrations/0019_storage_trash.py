@@ -0,0 +1,54 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0018_auth_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurgeItem',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('file', models.CharField(blank=True, default='', max_length=255)),
+                ('chunk_hash', models.CharField(blank=True, default='', max_length=64)),
+                ('created_date', models.DateTimeField(auto_now_add=True, db_column='createddate')),
+            ],
+            options={
+                'db_table': 'purge_queue',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='storage',
+            name='storage_user_upload_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='storage',
+            name='storage_user_folder_idx',
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_column='deletedat', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='storage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['id_user', '-upload_date'], name='storage_user_upload_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['id_user', 'folder', '-upload_date'], name='storage_user_folder_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['id_user', '-deleted_at'], name='storage_user_trash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='storage_trash_purge_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0019_storage_trash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateTimeField(auto_now_add=True, db_column='createddate')),
+                ('chunk', models.ForeignKey(db_column='chunk_hash', on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='api_app.chunk')),
+                ('id_user', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, related_name='chunk_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'chunk_uploads',
+                'constraints': [models.UniqueConstraint(fields=('id_user', 'chunk'), name='chunk_upload_user_chunk')],
+            },
+        ),
+    ]
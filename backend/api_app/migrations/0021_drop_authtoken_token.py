@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Бессрочные токены DRF (rest_framework.authtoken) больше не принимаются, приложение удалено из INSTALLED_APPS.
+    Таблицу удаляем здесь: иначе ее внешний ключ на users мешал бы удалять пользователей со старыми токенами
+    """
+
+    dependencies = [
+        ('api_app', '0020_chunk_uploads'),
+    ]
+
+    operations = [
+        migrations.RunSQL('DROP TABLE IF EXISTS authtoken_token', reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -1,10 +1,14 @@
 import os
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from cryptography.fernet import Fernet
 from django.conf import settings
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 import base64
 
+from .chunking import chunk_hash, chunk_path, iter_chunks, write_chunk
+
 class UserManager(BaseUserManager):
     def create_user(self, email, username, password=None, **extra_fields):
         if not email:
@@ -45,9 +49,189 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.username
 
+class Folder(models.Model):
+    """
+    Папка пользователя. Иерархия хранится в виде материализованного пути из id папок:
+    path = "/<id корня>/.../<id папки>/". Поддерево выбирается одним запросом path LIKE '<path>%',
+    а перемещение папки - одним UPDATE префиксов путей, файлы на диске при этом не трогаются.
+    В files_total и size_total хранятся рекурсивные количество и размер файлов (с учетом вложенных папок).
+    """
+    id_folder = models.AutoField(primary_key=True)
+    id_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="folders", db_column="user_id")
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name="children", db_column="parent_id")
+    name = models.CharField(max_length=128, null=False)
+    path = models.CharField(max_length=1024, blank=True, default='')
+    depth = models.PositiveIntegerField(default=0)
+    files_total = models.BigIntegerField(default=0)
+    size_total = models.BigIntegerField(default=0)
+    created_date = models.DateTimeField(auto_now_add=True, db_column="createddate")
+
+    class Meta:
+        db_table = "folders"
+        indexes = [
+            # varchar_pattern_ops позволяет использовать btree-индекс для LIKE 'prefix%' в PostgreSQL
+            models.Index(fields=['path'], name='folder_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['parent', 'name'], name='folder_unique_name'),
+            models.UniqueConstraint(fields=['id_user', 'name'], condition=models.Q(parent__isnull=True), name='folder_unique_root_name'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def ids_from_path(path):
+        """Возвращает список id папок из материализованного пути (от корня к самой папке)"""
+        return [int(part) for part in path.strip('/').split('/') if part]
+
+    def ancestor_ids(self):
+        """id самой папки и всех ее родителей"""
+        return self.ids_from_path(self.path)
+
+    def subtree(self):
+        """Папка и все вложенные папки (один запрос по индексу path)"""
+        return Folder.objects.filter(id_user=self.id_user_id, path__startswith=self.path)
+
+    @classmethod
+    def adjust_totals(cls, path, files_delta, size_delta):
+        """Изменяет рекурсивные счетчики папки с путем path и всех ее родителей одним UPDATE"""
+        ids = cls.ids_from_path(path or '')
+        if ids and (files_delta or size_delta):
+            cls.objects.filter(id_folder__in=ids).update(
+                files_total=models.F('files_total') + files_delta,
+                size_total=models.F('size_total') + size_delta,
+            )
+
+    def move_to(self, new_parent):
+        """
+        Перемещает папку вместе с поддеревом в new_parent (None - в корень):
+        пути всех вложенных папок меняются одним UPDATE, счетчики переносятся на новых родителей.
+        """
+        old_path = self.path
+        new_path = f"{new_parent.path if new_parent else '/'}{self.id_folder}/"
+        depth_delta = (new_parent.depth + 1 if new_parent else 0) - self.depth
+        old_parent_path = self.parent.path if self.parent_id else ''
+
+        with transaction.atomic():
+            Folder.adjust_totals(old_parent_path, -self.files_total, -self.size_total)
+            self.subtree().update(
+                path=Concat(models.Value(new_path), Substr('path', len(old_path) + 1), output_field=models.CharField()),
+                depth=models.F('depth') + depth_delta,
+            )
+            Folder.objects.filter(id_folder=self.id_folder).update(parent=new_parent)
+            Folder.adjust_totals(new_parent.path if new_parent else '', self.files_total, self.size_total)
+        self.refresh_from_db()
+
+    def save(self, *args, **kwargs):
+        # Путь строится из id, поэтому у новой папки он заполняется после первой вставки
+        super().save(*args, **kwargs)
+        expected_path = f"{self.parent.path if self.parent_id else '/'}{self.id_folder}/"
+        if self.path != expected_path:
+            self.path = expected_path
+            self.depth = self.parent.depth + 1 if self.parent_id else 0
+            super().save(update_fields=['path', 'depth'])
+
+class StorageQuerySet(models.QuerySet):
+    def adjust_folder_totals(self, sign):
+        """Изменяет счетчики папок на количество и размер файлов набора (sign = -1 или 1), один UPDATE на папку"""
+        folders = self.filter(folder__isnull=False).values('folder__path').annotate(
+            files=models.Count('id_file'), size=models.Sum('size'),
+        )
+        for folder in folders:
+            Folder.adjust_totals(folder['folder__path'], sign * folder['files'], sign * folder['size'])
+
+    def trash(self):
+        """
+        Переносит файлы в корзину: один UPDATE deleted_at по первичному ключу и счетчики папок.
+        Диск не трогается: содержимое удалит команда purge_trash через TRASH_RETENTION_DAYS.
+        Возвращает количество файлов
+        """
+        # Импорт здесь: events импортирует модели
+        from .events import DELETE, emit_many
+        with transaction.atomic():
+            live = self.filter(deleted_at__isnull=True)
+            # Блокировка строк: из двух одновременных удалений одного файла счетчики изменит только одно
+            rows = list(live.select_for_update().values_list('id_file', 'id_user'))
+            if not rows:
+                return 0
+            live.adjust_folder_totals(-1)
+            Storage.all_objects.filter(id_file__in=[id_file for id_file, _ in rows]).update(deleted_at=timezone.now())
+            emit_many([
+                StorageEvent(id_user_id=id_user, kind=DELETE, id_file=id_file, payload={'id_file': id_file})
+                for id_file, id_user in rows
+            ])
+        return len(rows)
+
+    def restore(self):
+        """
+        Возвращает файлы из корзины в их папку (в корень, если папку удалили); при совпадении имени
+        с существующим файлом подбирается свободное (name(1)...). Возвращает восстановленные файлы
+        """
+        # Импорт здесь: events и uploads импортируют модели
+        from .events import UPLOAD, emit_many, file_payload
+        from .uploads import resolve_names
+        with transaction.atomic():
+            files = list(self.filter(deleted_at__isnull=False).select_for_update().order_by('id_file'))
+            by_user = {}
+            for file in files:
+                by_user.setdefault(file.id_user_id, []).append(file)
+            for id_user, user_files in by_user.items():
+                for file, name in zip(user_files, resolve_names(id_user, [file.original_name for file in user_files])):
+                    file.original_name = name
+                    file.deleted_at = None
+            Storage.all_objects.bulk_update(files, ['original_name', 'deleted_at'], batch_size=1000)
+            Storage.objects.filter(id_file__in=[file.id_file for file in files]).adjust_folder_totals(1)
+            emit_many([
+                StorageEvent(id_user_id=file.id_user_id, kind=UPLOAD, id_file=file.id_file, payload=file_payload(file))
+                for file in files
+            ])
+        return files
+
+    def queue_purge(self):
+        """
+        Перед удалением строк каскадом (вместе с пользователем): файлы на диске и блоки ставятся
+        в очередь PurgeItem, их удалит purge_trash. В запросе - только запись в БД, без работы с диском
+        """
+        names = self.exclude(file='').values_list('file', flat=True)
+        hashes = StorageChunk.objects.filter(storage__in=self.filter(chunked=True)).values_list('chunk_id', flat=True).distinct()
+        PurgeItem.objects.bulk_create([PurgeItem(file=name) for name in names.iterator()], batch_size=1000)
+        PurgeItem.objects.bulk_create([PurgeItem(chunk_hash=hash_hex) for hash_hex in hashes.iterator()], batch_size=1000)
+
+    def delete_files(self):
+        """
+        Удаляет набор файлов пакетно: один DELETE в БД, одно обновление счетчиков на папку,
+        затем файлы с диска и освободившиеся блоки. Возвращает количество удаленных файлов.
+        Файлы из корзины уже не учтены в счетчиках папок и уже исчезли из ленты событий
+        """
+        # Импорт здесь: events импортирует модели
+        from .events import DELETE, emit_many
+        with transaction.atomic():
+            rows = list(self.values_list('id_file', 'id_user', 'file', 'deleted_at'))
+            self.filter(deleted_at__isnull=True).adjust_folder_totals(-1)
+            hashes = list(StorageChunk.objects.filter(storage__in=self.filter(chunked=True)).values_list('chunk_id', flat=True).distinct())
+            deleted = self.delete()[1].get(Storage._meta.label, 0)
+            emit_many([
+                StorageEvent(id_user_id=id_user, kind=DELETE, id_file=id_file, payload={'id_file': id_file})
+                for id_file, id_user, _, deleted_at in rows if deleted_at is None
+            ])
+        for _, _, name, _ in rows:
+            path = os.path.join(settings.MEDIA_ROOT, name) if name else None
+            if path and os.path.isfile(path):
+                os.remove(path)
+        if hashes:
+            Chunk.release(hashes)
+        return deleted
+
+class StorageManager(models.Manager.from_queryset(StorageQuerySet)):
+    """Файлы без перенесенных в корзину: списки, поиск, скачивание, связанные менеджеры (user.storages)"""
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 class Storage(models.Model):
     id_file = models.AutoField(primary_key=True)
     id_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="storages", db_column="user_id")
+    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, null=True, blank=True, related_name="files", db_column="folder_id")
     original_name = models.CharField(max_length=128, null=False)
     new_name = models.CharField(max_length=128, null=True, blank=True)
     comment = models.CharField(max_length=128, null=False)
@@ -55,11 +239,35 @@ class Storage(models.Model):
     upload_date = models.DateTimeField(auto_now_add=True, db_column="uploaddate")
     last_download_date = models.DateTimeField(null=True, auto_now=False, blank=True, db_column="lastdownloaddate")
     file = models.FileField(upload_to='uploads/')
-    token = models.CharField(max_length=128, null=True, blank=True)  # увеличил размер для зашифрованного токена
+    token = models.CharField(max_length=128, null=True, blank=True, db_index=True)  # увеличил размер для зашифрованного токена
     token_expiration = models.DateTimeField(null=True, blank=True)
+    token_rate_limit = models.BigIntegerField(null=True, blank=True)  # ограничение скорости скачивания по ссылке, байт/сек
+    chunked = models.BooleanField(default=False)  # содержимое хранится блоками (StorageChunk), а не в file
+    encrypted = models.BooleanField(default=False)  # файл на диске зашифрован (см. encryption.py)
+    checksum = models.CharField(max_length=64, null=True, blank=True)  # sha256 содержимого (для проверки scan_storage --verify)
+    # Метаданные, определенные при загрузке (sniffing.py): отдача файла не угадывает тип по расширению и не обращается к диску заранее
+    content_type = models.CharField(max_length=128, null=True, blank=True)
+    charset = models.CharField(max_length=32, null=True, blank=True)  # кодировка текста, None - не текст
+    file_mtime = models.DateTimeField(null=True, blank=True, db_column="filemtime")
+    deleted_at = models.DateTimeField(null=True, blank=True, db_column="deletedat")  # в корзине с этого времени, None - не удален
+
+    objects = StorageManager()
+    # Все файлы, включая корзину (очистка корзины, проверка диска)
+    all_objects = StorageQuerySet.as_manager()
 
     class Meta:
         db_table = "storage"
+        indexes = [
+            # Список файлов пользователя, отсортированный по дате загрузки (частичный: без корзины)
+            models.Index(fields=['id_user', '-upload_date'], name='storage_user_upload_idx', condition=models.Q(deleted_at__isnull=True)),
+            # Содержимое одной папки (folder_id IS NULL - корень)
+            models.Index(fields=['id_user', 'folder', '-upload_date'], name='storage_user_folder_idx', condition=models.Q(deleted_at__isnull=True)),
+            # Корзина пользователя и очистка корзины по сроку (в индексах только удаленные файлы)
+            models.Index(fields=['id_user', '-deleted_at'], name='storage_user_trash_idx', condition=models.Q(deleted_at__isnull=False)),
+            models.Index(fields=['deleted_at'], name='storage_trash_purge_idx', condition=models.Q(deleted_at__isnull=False)),
+            # Trigram-индексы для поиска storage_name_trgm_idx и storage_comment_trgm_idx (только PostgreSQL)
+            # создаются в миграции 0008 через PostgresRunSQL
+        ]
 
     def __str__(self):
         return self.original_name
@@ -95,9 +303,215 @@ class Storage(models.Model):
             return self.decrypt_token(self.token)
         return None
 
+    def chunk_hashes(self):
+        """Хэши блоков файла по порядку (для файлов в хранилище блоков)"""
+        return self.chunks.order_by('position').values_list('chunk_id', flat=True)
+
+    def set_chunks(self, hashes):
+        """Заменяет список блоков файла; возвращает хэши прежних блоков (для Chunk.release)"""
+        old_hashes = list(self.chunk_hashes())
+        self.chunks.all().delete()
+        StorageChunk.objects.bulk_create(
+            (StorageChunk(storage=self, position=position, chunk_id=hash_hex) for position, hash_hex in enumerate(hashes)),
+            batch_size=1000,
+        )
+        return old_hashes
+
     def delete(self, *args, **kwargs):
-        # Удаляем файл из файловой системы
-        if self.file:
-            if os.path.isfile(self.file.path):
-                os.remove(self.file.path)
-        super(Storage, self).delete(*args, **kwargs)
+        # Как и пакетное удаление (админка, purge_trash): строка, счетчики папок, событие, файл на диске и блоки
+        deleted = Storage.all_objects.filter(pk=self.pk).delete_files()
+        return deleted, {Storage._meta.label: deleted}
+
+class Chunk(models.Model):
+    """Блок содержимого в хранилище блоков, адресуется SHA-256 и хранится на диске один раз"""
+    hash = models.CharField(max_length=64, primary_key=True)
+    size = models.IntegerField()
+    created_date = models.DateTimeField(auto_now_add=True, db_column="createddate")
+
+    class Meta:
+        db_table = "chunks"
+
+    def __str__(self):
+        return self.hash
+
+    @classmethod
+    def store_stream(cls, fileobj):
+        """
+        Разбивает поток на блоки по содержимому и сохраняет только новые блоки.
+        Возвращает хэши блоков по порядку
+        """
+        hashes = []
+        for data in iter_chunks(fileobj):
+            hash_hex = chunk_hash(data)
+            write_chunk(hash_hex, data)
+            cls.objects.bulk_create([cls(hash=hash_hex, size=len(data))], ignore_conflicts=True)
+            hashes.append(hash_hex)
+        return hashes
+
+    @classmethod
+    def owned_by(cls, id_user, hashes):
+        """
+        Блоки из hashes, содержимое которых есть у пользователя: в его файлах или загруженные им самим (ChunkUpload).
+        Блоки других пользователей считаются отсутствующими - знание хэша не дает доступа к их содержимому
+        """
+        hashes = set(hashes)
+        owned = set(StorageChunk.objects.filter(storage__id_user=id_user, chunk_id__in=hashes).values_list('chunk_id', flat=True))
+        owned.update(ChunkUpload.objects.filter(id_user=id_user, chunk_id__in=hashes - owned).values_list('chunk_id', flat=True))
+        return owned
+
+    @classmethod
+    def release(cls, hashes=None, older_than=None):
+        """
+        Удаляет блоки, на которые больше не ссылается ни один файл (из БД и с диска).
+        hashes - проверить только эти блоки, older_than - только блоки, созданные раньше этой даты
+        (свежие блоки могут быть загружены клиентом, но еще не привязаны к файлу).
+        """
+        unused = cls.objects.filter(refs__isnull=True)
+        if hashes is not None:
+            unused = unused.filter(hash__in=hashes)
+        if older_than is not None:
+            unused = unused.filter(created_date__lt=older_than)
+        released = 0
+        for hash_hex in list(unused.values_list('hash', flat=True)):
+            # Сначала строка в БД: если блок успели привязать к файлу, он останется и на диске
+            try:
+                deleted = cls.objects.filter(hash=hash_hex, refs__isnull=True).delete()[0]
+            except models.ProtectedError:
+                continue
+            if deleted:
+                path = chunk_path(hash_hex)
+                if os.path.isfile(path):
+                    os.remove(path)
+                released += 1
+        return released
+
+class StorageChunk(models.Model):
+    """Позиция блока в файле: файл собирается из блоков по возрастанию position"""
+    storage = models.ForeignKey(Storage, on_delete=models.CASCADE, related_name="chunks", db_column="file_id")
+    position = models.IntegerField()
+    chunk = models.ForeignKey(Chunk, on_delete=models.PROTECT, related_name="refs", db_column="chunk_hash")
+
+    class Meta:
+        db_table = "storage_chunks"
+        constraints = [
+            models.UniqueConstraint(fields=['storage', 'position'], name='storage_chunk_position'),
+        ]
+
+class ChunkUpload(models.Model):
+    """
+    Блок, содержимое которого пользователь сам передал (PUT): подтверждение владения для сборки файла.
+    Удаляется после сборки файла (дальше владение подтверждает StorageChunk) или командой collect_chunks
+    """
+    id_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chunk_uploads", db_column="user_id")
+    chunk = models.ForeignKey(Chunk, on_delete=models.CASCADE, related_name="uploads", db_column="chunk_hash")
+    created_date = models.DateTimeField(auto_now_add=True, db_column="createddate")
+
+    class Meta:
+        db_table = "chunk_uploads"
+        constraints = [
+            models.UniqueConstraint(fields=['id_user', 'chunk'], name='chunk_upload_user_chunk'),
+        ]
+
+class DownloadStat(models.Model):
+    """
+    Сводная статистика скачиваний за час или сутки по файлу и каналу (прямое скачивание или по ссылке).
+    Заполняется пакетно из буфера stats.py, а не отдельной записью на каждое скачивание.
+    id_file хранится без внешнего ключа, чтобы статистика оставалась после удаления файла
+    """
+    PERIOD_HOUR = 'hour'
+    PERIOD_DAY = 'day'
+    CHANNEL_DIRECT = 'direct'
+    CHANNEL_LINK = 'link'
+
+    period = models.CharField(max_length=8)
+    period_start = models.DateTimeField()
+    id_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="download_stats", db_column="user_id")  # владелец файла
+    id_file = models.IntegerField(db_column="file_id")
+    channel = models.CharField(max_length=8)
+    downloads = models.BigIntegerField(default=0)
+    bytes_sent = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "download_stats"
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start', 'id_file', 'channel'], name='download_stat_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start'], name='download_stat_period_idx'),
+        ]
+
+class ProfileReport(models.Model):
+    """Отчет профилирования запроса (ProfilingMiddleware): профиль cProfile и SQL-запросы с временем"""
+    id_report = models.AutoField(primary_key=True)
+    created_date = models.DateTimeField(auto_now_add=True, db_column="createddate")
+    method = models.CharField(max_length=8)
+    path = models.CharField(max_length=512)
+    status_code = models.IntegerField()
+    id_user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="profile_reports", db_column="user_id")
+    sampled = models.BooleanField(default=False)  # True - выбран случайно, False - по заголовку X-Profile
+    duration_ms = models.FloatField()
+    query_count = models.IntegerField()
+    query_time_ms = models.FloatField()
+    profile = models.TextField()
+    queries = models.JSONField(default=list)
+
+    class Meta:
+        db_table = "profile_reports"
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration_ms:.0f} мс)'
+
+    @classmethod
+    def prune(cls, keep):
+        """Оставляет только keep последних отчетов"""
+        cutoff = cls.objects.order_by('-id_report').values_list('id_report', flat=True)[keep:keep + 1].first()
+        if cutoff is not None:
+            cls.objects.filter(id_report__lte=cutoff).delete()
+
+class StorageEvent(models.Model):
+    """
+    Журнал изменений хранилища пользователя для ленты событий (/api/events/).
+    id - курсор: клиент продолжает чтение с последнего полученного события
+    """
+    id = models.BigAutoField(primary_key=True)
+    id_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="events", db_column="user_id")
+    kind = models.CharField(max_length=16)  # upload, update, rename, move, delete, link, folder, logout
+    id_file = models.IntegerField(null=True, blank=True, db_column="file_id")
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_date = models.DateTimeField(auto_now_add=True, db_column="createddate")
+
+    class Meta:
+        db_table = "storage_events"
+        indexes = [
+            models.Index(fields=['id_user', 'id'], name='storage_event_cursor_idx'),
+        ]
+
+class AuthSession(models.Model):
+    """
+    Сессия входа (api_app/authentication.py): хранится только sha256 refresh-токена и срок его действия.
+    Access-токены подписаны HMAC и ссылаются на сессию: выход удаляет ее, и токены сразу перестают действовать
+    """
+    id_session = models.BigAutoField(primary_key=True)
+    id_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="auth_sessions", db_column="user_id")
+    refresh_hash = models.CharField(max_length=64, unique=True)
+    created_date = models.DateTimeField(auto_now_add=True, db_column="createddate")
+    expires = models.DateTimeField()
+
+    class Meta:
+        db_table = "auth_sessions"
+        indexes = [
+            models.Index(fields=['id_user', 'expires'], name='auth_session_user_idx'),
+        ]
+
+class PurgeItem(models.Model):
+    """
+    Очередь на удаление с диска: файл в uploads/ или блок, строки которых уже удалены каскадом
+    (вместе с пользователем). Обрабатывается командой purge_trash
+    """
+    id = models.BigAutoField(primary_key=True)
+    file = models.CharField(max_length=255, blank=True, default='')
+    chunk_hash = models.CharField(max_length=64, blank=True, default='')
+    created_date = models.DateTimeField(auto_now_add=True, db_column="createddate")
+
+    class Meta:
+        db_table = "purge_queue"
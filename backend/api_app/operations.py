@@ -0,0 +1,18 @@
+from django.db.migrations.operations import RunSQL
+
+
+class PostgresRunSQL(RunSQL):
+    """
+    SQL только для PostgreSQL (GIN, trigram-индексы и т.п.), на SQLite операция пропускается.
+    Такие индексы не описываются в Meta.indexes: иначе SQLite при пересоздании таблицы
+    (AddField, AlterField) попытается создать их заново и упадет на синтаксисе PostgreSQL.
+    """
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        super().database_backwards(app_label, schema_editor, from_state, to_state)
@@ -0,0 +1,48 @@
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+
+
+class StoragePagination(PageNumberPagination):
+    """Постраничный вывод списков файлов: ?page=2&page_size=100"""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+def estimate_count(queryset):
+    """
+    Оценка количества строк по статистике PostgreSQL без COUNT(*):
+    для запроса без фильтров - pg_class.reltuples, с фильтрами - оценка планировщика из EXPLAIN.
+    На других СУБД (и для таблиц без статистики) возвращает None
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        estimate = row[0] if row else -1
+    else:
+        plan = json.loads(queryset.explain(format='json'))
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц в админке: точный COUNT(*) только если по оценке строк
+    меньше exact_limit, иначе используется оценка estimate_count
+    """
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < self.exact_limit:
+            return super().count
+        return estimate
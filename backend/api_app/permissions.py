@@ -18,4 +18,10 @@ class IsAuthenticatedOrViewFile(BasePermission):
                 return True  # Разрешаем, если это метод view_file или download_file_by_token
 
         # Если не view_file или download_file_by_token, проверяем аутентификацию
-        return request.user.is_authenticated
\ No newline at end of file
+        return request.user.is_authenticated
+
+class IsAdminRole(BasePermission):
+    """Доступ только администраторам: роль 'admin' или суперпользователь"""
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (user.role == 'admin' or user.is_superuser))
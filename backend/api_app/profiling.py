@@ -0,0 +1,82 @@
+"""
+Профилирование запросов по требованию: cProfile и список SQL-запросов с временем выполнения.
+Используется в ProfilingMiddleware, отчеты сохраняются в ProfileReport.
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+# Не больше стольких SQL-запросов в отчете (остальные только считаются)
+MAX_QUERIES = 500
+
+# cProfile может быть активен только один на процесс (Python 3.12+: ValueError во втором потоке),
+# поэтому одновременно профилируется не больше одного запроса
+_active = threading.Lock()
+
+
+class QueryCollector:
+    """execute_wrapper для всех соединений: собирает SQL-запросы и их время"""
+    def __init__(self):
+        self.queries = []
+        self.count = 0
+        self.total = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.total += duration
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({
+                    'alias': context['connection'].alias,
+                    'sql': sql,
+                    'time_ms': round(duration * 1000, 3),
+                })
+
+
+class RequestProfiler:
+    """
+    Профилирует код между start() и stop() и собирает SQL-запросы всех БД.
+    start() возвращает False, если в процессе уже идет профилирование - запрос выполняется без него
+    """
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.collector = QueryCollector()
+        self.duration = 0.0
+
+    def start(self):
+        if not _active.acquire(blocking=False):
+            return False
+        try:
+            self.stack = ExitStack()
+            for alias in connections:
+                self.stack.enter_context(connections[alias].execute_wrapper(self.collector))
+            self.start_time = time.perf_counter()
+            self.profiler.enable()
+        except BaseException:
+            self.stack.close()
+            _active.release()
+            raise
+        return True
+
+    def stop(self):
+        try:
+            self.profiler.disable()
+            self.duration = time.perf_counter() - self.start_time
+        finally:
+            self.stack.close()
+            _active.release()
+
+    def stats_text(self, limit):
+        """Текстовый отчет pstats: limit функций по суммарному времени"""
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
@@ -0,0 +1,31 @@
+import orjson
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON-рендерер на orjson: в несколько раз быстрее стандартного json для больших списков.
+    Типы, которые orjson не умеет сериализовать (Decimal, ленивые строки и т.п.),
+    передаются стандартному JSONEncoder из DRF.
+    """
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = self.options
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=JSONEncoder().default, option=options)
+
+
+class EventStreamRenderer(ORJSONRenderer):
+    """
+    Позволяет запрашивать ленту событий с Accept: text/event-stream.
+    Сам поток отдается StreamingHttpResponse; через рендерер проходят только ответы
+    с ошибками (403 и т.п.), они отдаются как JSON
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
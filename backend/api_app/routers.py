@@ -0,0 +1,36 @@
+import contextvars
+
+from django.conf import settings
+
+# Состояние текущего запроса: можно ли читать с реплики и была ли в запросе запись
+use_replica = contextvars.ContextVar('use_replica', default=False)
+has_written = contextvars.ContextVar('has_written', default=False)
+
+# Модели, которые всегда читаются с основной БД: сессия, созданная при входе,
+# должна быть видна сразу, без задержки репликации
+PRIMARY_ONLY_MODELS = ('api_app.authsession',)
+
+
+class ReplicaRouter:
+    """
+    Маршрутизатор БД: запись всегда в 'default', чтение - в 'replica' только если
+    ReplicaRoutingMiddleware разрешил это для запроса (путь только для чтения, не было недавней записи)
+    и в этом запросе еще ничего не записывалось (read-your-writes).
+    """
+    def db_for_read(self, model, **hints):
+        if 'replica' not in settings.DATABASES or model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return 'default'
+        if use_replica.get() and not has_written.get():
+            return 'replica'
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        has_written.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема на реплику приходит через репликацию
+        return db == 'default'
@@ -0,0 +1,60 @@
+from datetime import datetime, time
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+SEARCH_MODES = ('substring', 'prefix')
+
+
+def search_storage(queryset, query, mode='substring'):
+    """
+    Фильтрует файлы по имени (original_name) и комментарию (comment).
+    mode='substring' - поиск подстроки (ILIKE '%q%'), mode='prefix' - поиск по началу (ILIKE 'q%').
+    На PostgreSQL оба варианта используют trigram GIN-индексы по UPPER(original_name) и UPPER(comment),
+    на SQLite выполняется обычный LIKE без индекса.
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    if mode not in SEARCH_MODES:
+        raise ValueError(f'Неизвестный режим поиска: {mode}')
+
+    lookup = 'istartswith' if mode == 'prefix' else 'icontains'
+    return queryset.filter(
+        Q(**{f'original_name__{lookup}': query}) | Q(**{f'comment__{lookup}': query})
+    )
+
+
+def parse_bound(value, end_of_day=False):
+    """Разбирает дату (YYYY-MM-DD) или дату-время (ISO 8601) из параметров запроса"""
+    # Сначала дата: parse_datetime принимает и YYYY-MM-DD (как полночь), и конец дня терялся бы
+    parsed_date = parse_date(value)
+    if parsed_date is not None:
+        parsed = datetime.combine(parsed_date, time.max if end_of_day else time.min)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f'Неправильный формат даты: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_storage(queryset, params):
+    """
+    Применяет фильтры из параметров запроса: q, mode, size_min, size_max, date_from, date_to.
+    При неправильных значениях параметров выбрасывает ValueError.
+    """
+    queryset = search_storage(queryset, params.get('q'), params.get('mode') or 'substring')
+
+    if params.get('size_min'):
+        queryset = queryset.filter(size__gte=int(params['size_min']))
+    if params.get('size_max'):
+        queryset = queryset.filter(size__lte=int(params['size_max']))
+    if params.get('date_from'):
+        queryset = queryset.filter(upload_date__gte=parse_bound(params['date_from']))
+    if params.get('date_to'):
+        queryset = queryset.filter(upload_date__lte=parse_bound(params['date_to'], end_of_day=True))
+
+    return queryset
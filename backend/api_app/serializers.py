@@ -1,11 +1,62 @@
 from rest_framework import serializers
-from .models import User, Storage
+from .models import User, Storage, Folder
 import re
 
 class StorageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Storage
-        fields = "__all__"
+        exclude = ["token"]  # токен ссылки хранится в зашифрованном виде и клиенту не нужен
+
+class ValuesListSerializer:
+    """
+    Быстрый сериализатор только для чтения: выбирает из БД только нужные колонки через .values()
+    и отдает готовые словари, без создания экземпляров моделей и полей DRF на каждую строку.
+    Интерфейс как у сериализаторов DRF: Serializer(queryset).data
+    """
+    fields = ()
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*cls.fields)
+
+    @property
+    def data(self):
+        return list(self.values(self.queryset))
+
+class StorageListSerializer(ValuesListSerializer):
+    # Внутренние поля (token, путь файла на диске) в списки не попадают
+    fields = ("id_file", "id_user", "folder", "original_name", "new_name", "comment", "size",
+              "upload_date", "last_download_date", "token_expiration")
+
+class TrashListSerializer(ValuesListSerializer):
+    fields = ("id_file", "id_user", "folder", "original_name", "comment", "size", "upload_date", "deleted_at")
+
+class FolderListSerializer(ValuesListSerializer):
+    fields = ("id_folder", "name", "parent", "path", "depth", "files_total", "size_total", "created_date")
+
+class UserListSerializer(ValuesListSerializer):
+    """Список пользователей с файлами: два запроса вместо одного запроса файлов на каждого пользователя"""
+    fields = ("id_user", "username", "fullname", "email", "role")
+
+    @property
+    def data(self):
+        users = list(self.values(self.queryset))
+        storages = {user["id_user"]: [] for user in users}
+        files = Storage.objects.filter(id_user__in=storages.keys()).order_by('id_file')
+        for file in StorageListSerializer.values(files).iterator():
+            storages[file["id_user"]].append(file)
+        for user in users:
+            user["storages"] = storages[user["id_user"]]
+        return users
+
+class FolderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Folder
+        fields = ["id_folder", "name", "parent", "path", "depth", "files_total", "size_total", "created_date"]
+        read_only_fields = ["path", "depth", "files_total", "size_total", "created_date"]
 
 class UserSerializer(serializers.ModelSerializer):
     storages = StorageSerializer(many=True, read_only=True)  # связь с файлами
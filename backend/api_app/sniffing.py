@@ -0,0 +1,104 @@
+"""
+Определение типа содержимого и кодировки текста по первым байтам файла (при загрузке),
+чтобы при отдаче файла не угадывать их по расширению.
+"""
+import codecs
+import mimetypes
+
+# Сколько первых байт файла нужно для определения типа и кодировки
+SNIFF_SIZE = 8192
+
+# Сигнатуры (смещение, байты, MIME-тип); для zip-контейнеров тип уточняется по расширению
+MAGIC_NUMBERS = (
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+    (0, b'\x00\x00\x01\x00', 'image/x-icon'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'BZh', 'application/x-bzip2'),
+    (0, b'\xfd7zXZ\x00', 'application/x-xz'),
+    (0, b"7z\xbc\xaf'\x1c", 'application/x-7z-compressed'),
+    (0, b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),
+    (0, b'SQLite format 3\x00', 'application/vnd.sqlite3'),
+    (0, b'\x7fELF', 'application/x-executable'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'fLaC', 'audio/flac'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'\xff\xfb', 'audio/mpeg'),
+    (0, b'\x1aE\xdf\xa3', 'video/webm'),
+    (4, b'ftyp', 'video/mp4'),
+    (0, b'%!PS', 'application/postscript'),
+    (0, b'{\\rtf', 'application/rtf'),
+)
+
+# Короткие сигнатуры, с которых может начинаться и обычный текст: проверяются, только если содержимое не текст
+WEAK_MAGIC_NUMBERS = (
+    (0, b'BM', 'image/bmp'),
+    (0, b'MZ', 'application/vnd.microsoft.portable-executable'),
+)
+
+# RIFF-контейнеры различаются типом в байтах 8-12
+RIFF_TYPES = {b'WEBP': 'image/webp', b'WAVE': 'audio/wav', b'AVI ': 'video/x-msvideo'}
+
+# Для zip- и OLE-контейнеров (docx, xlsx, odt, doc, xls...) расширение точнее сигнатуры
+CONTAINER_TYPES = ('application/zip', 'application/x-ole-storage')
+
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def detect_charset(head):
+    """Кодировка текста (utf-8, utf-16, windows-1251) или None, если содержимое не похоже на текст"""
+    for bom, charset in BOMS:
+        if head.startswith(bom):
+            return charset
+    if b'\x00' in head:
+        return None
+    try:
+        head.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # Многобайтовый символ мог оборваться на границе прочитанного фрагмента
+        if e.start >= len(head) - 3 and e.reason == 'unexpected end of data':
+            return 'utf-8'
+    # Русский текст в windows-1251: почти все байты - печатные ASCII, пробелы или кириллица
+    text = head.decode('windows-1251', errors='replace')
+    printable = sum(1 for char in text if char.isprintable() or char in '\r\n\t')
+    if printable >= len(text) * 0.95:
+        return 'windows-1251'
+    return None
+
+
+def sniff(head, name):
+    """
+    Тип содержимого и кодировка по первым байтам (head) и имени файла: (content_type, charset).
+    Сначала сигнатуры, затем проверка на текст, в конце - угадывание по расширению
+    """
+    guessed, _ = mimetypes.guess_type(name)
+    if head[:4] == b'RIFF' and head[8:12] in RIFF_TYPES:
+        return RIFF_TYPES[head[8:12]], None
+    for offset, magic, content_type in MAGIC_NUMBERS:
+        if head[offset:offset + len(magic)] == magic:
+            if content_type in CONTAINER_TYPES and guessed:
+                return guessed, None
+            return content_type, None
+
+    charset = detect_charset(head)
+    if charset:
+        # Текст: тип по расширению, если он текстовый (text/csv, application/json...), иначе text/plain
+        if guessed and (guessed.startswith('text/') or guessed in ('application/json', 'application/xml', 'application/javascript')):
+            return guessed, charset
+        return 'text/plain', charset
+    for offset, magic, content_type in WEAK_MAGIC_NUMBERS:
+        if head[offset:offset + len(magic)] == magic:
+            return content_type, None
+    return guessed or 'application/octet-stream', None
@@ -0,0 +1,177 @@
+"""
+Статистика скачиваний без записи в БД на каждый запрос.
+
+Счетчики (количество скачиваний, отданные байты, время последнего скачивания) копятся
+в памяти процесса и раз в STATS_FLUSH_INTERVAL секунд (или при STATS_FLUSH_MAX_KEYS ключах)
+сбрасываются пакетом в таблицу DownloadStat (часовые и суточные строки) и в Storage.last_download_date.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import DownloadStat, Storage
+from .search import parse_bound
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# Запись в БД выполняется вне _lock: скачивания не ждут транзакцию, друг друга ждут только сбросы
+_write_lock = threading.Lock()
+_counters = defaultdict(lambda: [0, 0])  # (id_user, id_file, channel) -> [downloads, bytes_sent] за текущий час
+_counters_hour = None
+_last_download = {}  # id_file -> время последнего скачивания
+_last_flush = time.monotonic()
+
+
+def record_download(file, channel, bytes_sent=0, downloads=1):
+    """Учитывает скачивание файла (или отданные байты при downloads=0). Записи в БД не делает"""
+    global _counters_hour
+    now = timezone.now()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    batches = []
+    with _lock:
+        if _counters_hour is not None and _counters_hour != hour and _counters:
+            # Начался новый час - накопленное относится к прошлому
+            batches.append(_take_locked())
+        _counters_hour = hour
+        counter = _counters[(file.id_user_id, file.id_file, channel)]
+        counter[0] += downloads
+        counter[1] += bytes_sent
+        if downloads:
+            _last_download[file.id_file] = now
+        if (time.monotonic() - _last_flush >= settings.STATS_FLUSH_INTERVAL
+                or len(_counters) >= settings.STATS_FLUSH_MAX_KEYS):
+            batches.append(_take_locked())
+    for batch in batches:
+        _write_batch(batch)
+
+
+def counting_iterator(iterator, file, channel):
+    """Оборачивает поток содержимого файла и учитывает фактически отданные байты (в том числе при обрыве)"""
+    sent = 0
+    try:
+        for data in iterator:
+            sent += len(data)
+            yield data
+    finally:
+        record_download(file, channel, bytes_sent=sent, downloads=0)
+
+
+def flush():
+    """Сбрасывает накопленные счетчики текущего процесса в БД"""
+    with _lock:
+        batch = _take_locked()
+    _write_batch(batch)
+
+
+def _take_locked():
+    """Забирает накопленные счетчики (вызывается под _lock): (час, счетчики, даты скачивания) или None"""
+    global _last_flush
+    _last_flush = time.monotonic()
+    if not _counters and not _last_download:
+        return None
+    batch = (_counters_hour, dict(_counters), dict(_last_download))
+    _counters.clear()
+    _last_download.clear()
+    return batch
+
+
+def _write_batch(batch):
+    if batch is None:
+        return
+    with _write_lock:
+        try:
+            _write(*batch)
+        except Exception:
+            # Статистика не должна ломать скачивание: при ошибке БД теряем накопленное и пишем в лог
+            logger.exception('Не удалось сохранить статистику скачиваний (%s ключей)', len(batch[1]))
+
+
+def _write(hour, counters, last_download):
+    buckets = [(DownloadStat.PERIOD_HOUR, hour), (DownloadStat.PERIOD_DAY, hour.replace(hour=0))]
+    with transaction.atomic():
+        # 1. Гарантируем наличие строк (конфликты с уже существующими игнорируются)
+        DownloadStat.objects.bulk_create([
+            DownloadStat(period=period, period_start=start, id_user_id=id_user, id_file=id_file, channel=channel)
+            for period, start in buckets
+            for (id_user, id_file, channel) in counters
+        ], ignore_conflicts=True)
+
+        # 2. Прибавляем счетчики к заблокированным строкам и сохраняем одним bulk_update
+        match = Q()
+        for period, start in buckets:
+            match |= Q(period=period, period_start=start)
+        rows = DownloadStat.objects.select_for_update().filter(
+            match, id_file__in={id_file for _, id_file, _ in counters}
+        )
+        changed = []
+        for row in rows:
+            counter = counters.get((row.id_user_id, row.id_file, row.channel))
+            if counter:
+                row.downloads += counter[0]
+                row.bytes_sent += counter[1]
+                changed.append(row)
+        DownloadStat.objects.bulk_update(changed, ['downloads', 'bytes_sent'])
+
+        # 3. Дата последнего скачивания файлов
+        files = [Storage(id_file=id_file, last_download_date=date) for id_file, date in last_download.items()]
+        Storage.objects.bulk_update(files, ['last_download_date'])
+    logger.info('Статистика скачиваний сохранена: %s ключей, %s файлов', len(counters), len(files))
+
+
+# Группировки для summarize_downloads: поля values() и дополнительный фильтр
+STATS_GROUPS = {
+    'file': (('id_file', 'id_user'), {}),
+    'user': (('id_user',), {}),
+    'link': (('id_file', 'id_user'), {'channel': DownloadStat.CHANNEL_LINK}),
+    'time': (('period_start',), {}),
+}
+
+
+def summarize_downloads(params):
+    """
+    Сводка по таблице DownloadStat. Параметры: period (hour|day), group (file|user|link|time),
+    date_from, date_to, id_user (владелец), limit. При неправильных параметрах - ValueError
+    """
+    period = params.get('period', DownloadStat.PERIOD_DAY)
+    if period not in (DownloadStat.PERIOD_HOUR, DownloadStat.PERIOD_DAY):
+        raise ValueError(f'Неизвестный период: {period}')
+    group = params.get('group', 'file')
+    if group not in STATS_GROUPS:
+        raise ValueError(f'Неизвестная группировка: {group}')
+    try:
+        limit = min(int(params.get('limit', 100)), 1000)
+    except (TypeError, ValueError):
+        raise ValueError('limit должен быть целым числом')
+
+    fields, extra_filter = STATS_GROUPS[group]
+    queryset = DownloadStat.objects.filter(period=period, **extra_filter)
+    if params.get('date_from'):
+        queryset = queryset.filter(period_start__gte=parse_bound(params['date_from']))
+    if params.get('date_to'):
+        queryset = queryset.filter(period_start__lte=parse_bound(params['date_to'], end_of_day=True))
+    if params.get('id_user'):
+        queryset = queryset.filter(id_user=params['id_user'])
+
+    totals = queryset.aggregate(downloads=Sum('downloads'), bytes_sent=Sum('bytes_sent'))
+    order = 'period_start' if group == 'time' else '-bytes_sent'
+    results = queryset.values(*fields).annotate(
+        downloads=Sum('downloads'), bytes_sent=Sum('bytes_sent'),
+    ).order_by(order)[:limit]
+    return {
+        'period': period,
+        'group': group,
+        'downloads': totals['downloads'] or 0,
+        'bytes_sent': totals['bytes_sent'] or 0,
+        'results': list(results),
+    }
+
+
+atexit.register(flush)
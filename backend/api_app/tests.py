@@ -1,3 +1,1541 @@
-from django.test import TestCase
+import base64
+import hashlib
+import os
+import random
+import secrets
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock, skipIf
 
-# Create your tests here.
+import orjson
+from asgiref.sync import sync_to_async
+from cryptography.exceptions import InvalidTag
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from . import chunking, events, stats, throttling
+from .authentication import refresh_session, start_session
+from .chunking import AVG_CHUNK_SIZE, MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, chunk_hash, iter_chunks
+from .encryption import HEADER_SIZE, MAGIC, EncryptedFile, encrypt_stream, iter_decrypted
+from .middleware import ReplicaRoutingMiddleware
+from .models import AuthSession, Chunk, DownloadStat, Folder, ProfileReport, PurgeItem, Storage, StorageEvent, User
+from .pagination import EstimatedCountPaginator
+from .profiling import RequestProfiler
+from .renderers import ORJSONRenderer
+from .routers import ReplicaRouter
+from .serializers import StorageListSerializer
+from .throttling import BandwidthLimiter, TokenBucket
+from .views import StorageView
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def download(client, id_file, **headers):
+    response = client.get(f'/api/storage/download/{id_file}/', **headers)
+    assert response.status_code in (200, 206), response.status_code
+    return b''.join(response.streaming_content) if response.streaming else response.content
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ApiTestCase(TestCase):
+    """Общая подготовка: пустой кэш (лимиты, версии списков), пользователь и клиент с его access-токеном"""
+
+    def setUp(self):
+        cache.clear()
+        # Счетчики скачиваний сохраняются в транзакции теста, а не при выходе, когда пользователей уже нет
+        self.addCleanup(stats.flush)
+        self.user = self.create_user('alice')
+        self.client = self.client_for(self.user)
+
+    @staticmethod
+    def create_user(username, **extra):
+        return User.objects.create_user(f'{username}@example.com', username, 'Passw0rd!', **extra)
+
+    @staticmethod
+    def client_for(user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + start_session(user)['access'])
+        return client
+
+    def assertTotals(self, folder, files, size):
+        folder.refresh_from_db()
+        self.assertEqual((folder.files_total, folder.size_total), (files, size))
+
+    def upload(self, name, content=b'hello', comment='', folder=None):
+        data = {'file': SimpleUploadedFile(name, content), 'comment': comment}
+        if folder is not None:
+            data['folder'] = folder.id_folder
+        response = self.client.post(f'/api/storage/{self.user.id_user}/', data, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        return Storage.objects.get(id_user=self.user, original_name=name)
+
+
+class AuthTokenTests(ApiTestCase):
+    """Вход, проверка access-токена и обмен refresh-токена (api_app/authentication.py)"""
+
+    def test_login_returns_working_access_token(self):
+        response = APIClient().post('/api/auth/login/', {'username': 'alice', 'password': 'Passw0rd!'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + response.data['access'])
+        self.assertEqual(client.get('/api/users/user_info/').status_code, 200)
+
+    def test_wrong_password(self):
+        response = APIClient().post('/api/auth/login/', {'username': 'alice', 'password': 'wrong'}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_tampered_access_token(self):
+        access = start_session(self.user)['access']
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + access[:-1] + ('A' if access[-1] != 'A' else 'B'))
+        self.assertEqual(client.get('/api/users/user_info/').status_code, 401)
+
+    @override_settings(AUTH_ACCESS_TOKEN_LIFETIME=60)
+    def test_expired_access_token(self):
+        # Токен подписан на 61 секунду раньше текущего времени
+        with mock.patch('django.core.signing.time.time', return_value=time.time() - 61):
+            access = start_session(self.user)['access']
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+        self.assertEqual(client.get('/api/users/user_info/').status_code, 401)
+
+    def test_legacy_drf_tokens_not_accepted(self):
+        response = APIClient().post('/api/v1/auth/token/login/', {'username': 'alice', 'password': 'Passw0rd!'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + secrets.token_hex(20))
+        self.assertEqual(client.get('/api/users/user_info/').status_code, 401)
+
+    def test_logout_ends_session(self):
+        tokens = start_session(self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + tokens['access'])
+        self.assertEqual(client.post('/api/auth/logout/').status_code, 204)
+        self.assertEqual(client.get('/api/users/user_info/').status_code, 401)
+        self.assertIsNone(refresh_session(tokens['refresh']))
+
+    def test_refresh_rotates_token(self):
+        tokens = start_session(self.user)
+        response = APIClient().post('/api/auth/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], tokens['refresh'])
+        self.assertEqual(response.data['session'], tokens['session'])
+        # Старый refresh-токен после обмена не действует, новый действует
+        old = APIClient().post('/api/auth/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(old.status_code, 401)
+        new = APIClient().post('/api/auth/refresh/', {'refresh': response.data['refresh']}, format='json')
+        self.assertEqual(new.status_code, 200)
+
+    def test_concurrent_refresh_only_one_succeeds(self):
+        tokens = start_session(self.user)
+        token_urlsafe = secrets.token_urlsafe
+        concurrent = []
+
+        def exchange_in_between(nbytes):
+            # Второй обмен того же токена проходит, когда первый уже прочитал сессию, но еще не обновил ее
+            if not concurrent:
+                concurrent.append(None)
+                concurrent[0] = refresh_session(tokens['refresh'])
+            return token_urlsafe(nbytes)
+
+        with mock.patch('api_app.authentication.secrets.token_urlsafe', side_effect=exchange_in_between):
+            first = refresh_session(tokens['refresh'])
+        self.assertIsNone(first)
+        self.assertIsNotNone(concurrent[0])
+        # Действует токен того обмена, который успел обновить сессию
+        self.assertIsNotNone(refresh_session(concurrent[0]['refresh']))
+
+    def test_expired_refresh_token(self):
+        tokens = start_session(self.user)
+        AuthSession.objects.filter(pk=tokens['session']).update(expires=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(refresh_session(tokens['refresh']))
+
+
+class SearchTests(ApiTestCase):
+    """Поиск по имени и комментарию с фильтрами (/api/storage/search/) и поиск в админке"""
+
+    def setUp(self):
+        super().setUp()
+        self.report = self.upload('Report-2024.pdf', b'x' * 100, comment='annual')
+        self.notes = self.upload('notes.txt', b'x' * 10, comment='draft report')
+        self.photo = self.upload('photo.jpg', b'x' * 1000)
+
+    def search(self, **params):
+        response = self.client.get(f'/api/storage/search/{self.user.id_user}/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {item['id_file'] for item in response.data['results']}
+
+    def test_substring_matches_name_and_comment(self):
+        self.assertEqual(self.search(q='REPORT'), {self.report.id_file, self.notes.id_file})
+
+    def test_prefix_mode(self):
+        self.assertEqual(self.search(q='report', mode='prefix'), {self.report.id_file})
+
+    def test_size_and_date_filters(self):
+        self.assertEqual(self.search(size_min=50, size_max=500), {self.report.id_file})
+        today = timezone.localdate().isoformat()
+        self.assertEqual(len(self.search(date_from=today, date_to=today)), 3)
+        self.assertEqual(self.search(date_to='2000-01-01'), set())
+
+    def test_invalid_parameters(self):
+        url = f'/api/storage/search/{self.user.id_user}/'
+        self.assertEqual(self.client.get(url, {'date_from': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'mode': 'regex', 'q': 'a'}).status_code, 400)
+
+    def test_foreign_user_forbidden(self):
+        bob = self.create_user('bob')
+        self.assertEqual(self.client_for(bob).get(f'/api/storage/search/{self.user.id_user}/').status_code, 403)
+
+    def test_admin_search_by_owner(self):
+        bob = self.create_user('bob')
+        Storage.objects.filter(pk=self.photo.pk).update(id_user=bob)
+        admin = User.objects.create_superuser('root@example.com', 'root', 'Passw0rd!')
+        client = Client()
+        client.force_login(admin)
+
+        def found(term):
+            response = client.get('/admindjango/api_app/storage/', {'q': term})
+            self.assertEqual(response.status_code, 200)
+            return {file.pk for file in response.context['cl'].result_list}
+
+        self.assertEqual(found('bo'), {self.photo.id_file})
+        self.assertEqual(found('annual'), {self.report.id_file})
+        self.assertEqual(found('^report'), {self.report.id_file})
+
+
+class FolderTests(ApiTestCase):
+    """Папки: материализованный путь и рекурсивные files_total и size_total"""
+
+    def create_folder(self, name, parent=None):
+        data = {'name': name}
+        if parent is not None:
+            data['parent'] = parent.id_folder
+        response = self.client.post(f'/api/folders/{self.user.id_user}/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Folder.objects.get(pk=response.data['id_folder'])
+
+    def test_totals(self):
+        top = self.create_folder('top')
+        nested = self.create_folder('nested', parent=top)
+        other = self.create_folder('other')
+        file = self.upload('a.txt', b'12345', folder=nested)
+        self.assertTotals(top, 1, 5)
+        self.assertTotals(nested, 1, 5)
+
+        # Перемещение папки переносит итоги в новую родительскую папку
+        response = self.client.patch(f'/api/folders/{self.user.id_user}/{nested.id_folder}/',
+                                     {'parent': other.id_folder}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTotals(top, 0, 0)
+        self.assertTotals(other, 1, 5)
+
+        # Перемещение файла в корень
+        response = self.client.patch(f'/api/storage/{self.user.id_user}/{file.id_file}/', {'folder': 'root'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTotals(other, 0, 0)
+        self.assertTotals(nested, 0, 0)
+
+    def test_non_numeric_folder(self):
+        self.assertEqual(self.client.get(f'/api/storage/{self.user.id_user}/?folder=abc').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/folders/{self.user.id_user}/abc/').status_code, 404)
+
+    def test_paths_and_listing(self):
+        top = self.create_folder('top')
+        nested = self.create_folder('nested', parent=top)
+        self.assertEqual(nested.path, f'/{top.id_folder}/{nested.id_folder}/')
+        self.upload('a.txt', folder=nested)
+        self.upload('b.txt')
+        response = self.client.get(f'/api/folders/{self.user.id_user}/{nested.id_folder}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['original_name'] for item in response.data['files']], ['a.txt'])
+        response = self.client.get(f'/api/storage/{self.user.id_user}/', {'folder': 'root'})
+        self.assertEqual([item['original_name'] for item in response.data], ['b.txt'])
+
+    def test_cannot_move_into_own_subtree(self):
+        top = self.create_folder('top')
+        nested = self.create_folder('nested', parent=top)
+        response = self.client.patch(f'/api/folders/{self.user.id_user}/{top.id_folder}/',
+                                     {'parent': nested.id_folder}, format='json')
+        self.assertEqual(response.status_code, 400)
+        top.refresh_from_db()
+        self.assertEqual(top.path, f'/{top.id_folder}/')
+
+    def test_duplicate_name(self):
+        self.create_folder('docs')
+        response = self.client.post(f'/api/folders/{self.user.id_user}/', {'name': 'docs'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_foreign_folder_forbidden(self):
+        folder = self.create_folder('docs')
+        bob = self.create_user('bob')
+        response = self.client_for(bob).get(f'/api/folders/{self.user.id_user}/{folder.id_folder}/')
+        self.assertEqual(response.status_code, 403)
+
+
+class ListSerializerTests(ApiTestCase):
+    """Списки через values() (ValuesListSerializer) и рендерер orjson"""
+
+    def test_file_list_fields(self):
+        self.upload('a.txt')
+        Storage.objects.update(token='secret', token_expiration=timezone.now())
+        response = self.client.get(f'/api/storage/{self.user.id_user}/')
+        self.assertEqual(response.status_code, 200)
+        item = response.json()[0]
+        # Внутренние поля (токен ссылки, путь на диске) в список не попадают
+        self.assertEqual(list(item), list(StorageListSerializer.fields))
+        self.assertEqual(item['original_name'], 'a.txt')
+        self.assertTrue(item['upload_date'].endswith('Z'))
+
+    def test_user_list_query_count_does_not_grow(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = APIClient().get('/api/users/')
+            self.assertEqual(response.status_code, 200)
+            return len(queries), response.json()
+
+        self.upload('a.txt')
+        before, users = count_queries()
+        self.assertEqual(users[0]['storages'][0]['original_name'], 'a.txt')
+        for index in range(5):
+            self.create_user(f'user{index}')
+        after, users = count_queries()
+        self.assertEqual(len(users), 6)
+        self.assertEqual(before, after)
+
+    def test_renderer_falls_back_for_unknown_types(self):
+        rendered = ORJSONRenderer().render({'size': Decimal('1.5'), 'when': datetime(2024, 1, 2, tzinfo=dt_timezone.utc)})
+        self.assertEqual(orjson.loads(rendered), {'size': 1.5, 'when': '2024-01-02T00:00:00Z'})
+
+
+class SessionBootstrapTests(ApiTestCase):
+    """Данные для старта сессии (/api/users/me/) с ETag и ответом 304"""
+
+    def test_payload(self):
+        self.upload('a.txt', b'12345')
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'alice')
+        self.assertEqual(response.data['quota']['files'], 1)
+        self.assertEqual(response.data['quota']['used'], 5)
+        self.assertEqual(response.data['files']['count'], 1)
+        self.assertEqual([item['original_name'] for item in response.data['files']['results']], ['a.txt'])
+
+    def test_not_modified_until_files_change(self):
+        response = self.client.get('/api/users/me/')
+        etag = response['ETag']
+        response = self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        self.upload('a.txt')
+        response = self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_is_per_user(self):
+        bob = self.create_user('bob')
+        etag = self.client.get('/api/users/me/')['ETag']
+        self.assertEqual(self.client_for(bob).get('/api/users/me/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get('/api/users/me/').status_code, 401)
+        self.assertEqual(APIClient().get('/api/users/user_info/').status_code, 401)
+
+
+class BandwidthLimiterTests(TestCase):
+    """Ограничение скорости скачивания (TokenBucket, BandwidthLimiter) в кэше процесса"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reserve_is_atomic_across_threads(self):
+        bucket = TokenBucket('test', 1000)
+
+        def work():
+            for _ in range(100):
+                bucket.reserve(10)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 8000 байт при 1000 байт/с: следующая отдача через ~8 с минус всплеск в 1 с
+        self.assertAlmostEqual(bucket.delay(), 7, delta=0.5)
+
+    def test_idle_bucket_allows_burst(self):
+        bucket = TokenBucket('burst', 1000)
+        self.assertAlmostEqual(bucket.reserve(1000), 0.0, places=3)
+        self.assertGreater(bucket.reserve(1000), 0.0)
+
+    @override_settings(DOWNLOAD_RATE_GLOBAL=10000, DOWNLOAD_RATE_PER_USER=5000, DOWNLOAD_RATE_PER_LINK=1000)
+    def test_link_bucket_by_channel(self):
+        user = User.objects.create_user('alice@example.com', 'alice', 'Passw0rd!')
+        request = SimpleNamespace(user=user)
+        file = SimpleNamespace(pk=1, token_rate_limit=None)
+        # Скачивание по ссылке ограничивается ведром ссылки и для вошедшего пользователя
+        keys = [bucket.key for bucket in BandwidthLimiter.for_download(request, file, DownloadStat.CHANNEL_LINK).buckets]
+        self.assertEqual(keys, ['bandwidth:global', f'bandwidth:user:{user.pk}', 'bandwidth:link:1'])
+        keys = [bucket.key for bucket in BandwidthLimiter.for_download(request, file, DownloadStat.CHANNEL_DIRECT).buckets]
+        self.assertNotIn('bandwidth:link:1', keys)
+
+
+@skipIf(fakeredis is None, 'нужен пакет fakeredis')
+@override_settings(REDIS_URL='redis://bandwidth-test')
+class RedisBandwidthLimiterTests(BandwidthLimiterTests):
+    """Те же проверки со скриптом резервирования в Redis (fakeredis вместо сервера)"""
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=server)
+        patcher = mock.patch('api_app.throttling.redis.Redis.from_url', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Скрипт регистрируется один раз на процесс: для теста - заново на новом сервере
+        throttling._reserve_script = None
+        self.addCleanup(setattr, throttling, '_reserve_script', None)
+
+    def test_state_is_raw_integer(self):
+        bucket = TokenBucket('raw', 1000)
+        bucket.reserve(5000)
+        tat = self.redis.get(bucket.key)
+        # Целое число микросекунд без сериализации кэша Django и без потери точности
+        self.assertRegex(tat, rb'^\d{16}$')
+        self.assertAlmostEqual(bucket.delay(), 4, delta=0.5)
+        self.assertGreater(self.redis.pttl(bucket.key), 60 * 1000)
+
+    def test_script_registered_once(self):
+        self.assertIs(throttling.get_reserve_script(), throttling.get_reserve_script())
+
+
+class DownloadBandwidthTests(ApiTestCase):
+    """Скачивание отклоняется с 429, если очередь ведра длиннее DOWNLOAD_MAX_WAIT"""
+
+    @override_settings(DOWNLOAD_RATE_PER_USER=100, DOWNLOAD_MAX_WAIT=5)
+    def test_busy_user_bucket(self):
+        file = self.upload('a.txt')
+        TokenBucket(f'user:{self.user.pk}', 100).reserve(1000)
+        response = self.client.get(f'/api/storage/download/{file.id_file}/')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 8)
+
+    @override_settings(DOWNLOAD_RATE_PER_LINK=100, DOWNLOAD_MAX_WAIT=5)
+    def test_busy_link_bucket_applies_to_logged_in_user(self):
+        file = self.upload('a.txt')
+        link = self.client.post(f'/api/storage/link/{self.user.id_user}/{file.id_file}/').data['link']
+        TokenBucket(f'link:{file.pk}', 100).reserve(1000)
+        self.assertEqual(self.client.get(link).status_code, 429)
+        self.assertEqual(APIClient().get(link).status_code, 429)
+
+    def test_invalid_link_rate_limit(self):
+        file = self.upload('a.txt')
+        response = self.client.post(f'/api/storage/link/{self.user.id_user}/{file.id_file}/', {'rate_limit': -1})
+        self.assertEqual(response.status_code, 400)
+
+
+@mock.patch.dict(settings.DATABASES, {'replica': {}})
+class ReplicaRoutingTests(TestCase):
+    """Чтение с реплики (ReplicaRoutingMiddleware, ReplicaRouter): только разрешенные пути и без недавней записи"""
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, request, write=False):
+        """Выполняет запрос через middleware и возвращает базу, выбранную для чтения файлов"""
+        def get_response(request):
+            if write:
+                self.router.db_for_write(Storage)
+            self.read_db = self.router.db_for_read(Storage)
+            self.token_db = self.router.db_for_read(AuthSession)
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(get_response)(request)
+        return self.read_db
+
+    def test_read_only_paths(self):
+        self.assertEqual(self.route(self.factory.get('/api/users/me/')), 'replica')
+        self.assertEqual(self.route(self.factory.get('/api/storage/7/')), 'replica')
+        self.assertEqual(self.route(self.factory.get('/api/trash/7/')), 'default')
+        self.assertEqual(self.route(self.factory.post('/api/storage/7/')), 'default')
+
+    def test_sessions_always_from_primary(self):
+        self.route(self.factory.get('/api/users/me/'))
+        self.assertEqual(self.token_db, 'default')
+
+    def test_client_sticks_to_primary_after_write(self):
+        headers = {'HTTP_AUTHORIZATION': 'Bearer alice'}
+        self.route(self.factory.post('/api/storage/7/', **headers), write=True)
+        self.assertEqual(self.route(self.factory.get('/api/storage/7/', **headers)), 'default')
+        # Другой клиент по-прежнему читает с реплики
+        self.assertEqual(self.route(self.factory.get('/api/storage/7/', HTTP_AUTHORIZATION='Bearer bob')), 'replica')
+
+    def test_read_your_writes_within_request(self):
+        def get_response(request):
+            before = self.router.db_for_read(Storage)
+            self.router.db_for_write(Storage)
+            return HttpResponse(f'{before},{self.router.db_for_read(Storage)}')
+
+        response = ReplicaRoutingMiddleware(get_response)(self.factory.get('/api/users/me/'))
+        self.assertEqual(response.content, b'replica,default')
+
+    def test_outside_request_reads_primary(self):
+        self.assertEqual(self.router.db_for_read(Storage), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'api_app'))
+
+
+class ChunkUploadTests(ApiTestCase):
+    """Загрузка блоками: докачка недостающих блоков, новая версия файла, чужие блоки только после загрузки"""
+
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(5000)
+        self.hash = chunk_hash(self.data)
+
+    def missing(self, client, user):
+        response = client.post(f'/api/storage/chunks/{user.id_user}/missing/', {'hashes': [self.hash]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['missing']
+
+    def put(self, client, user):
+        return client.put(f'/api/storage/chunks/{user.id_user}/{self.hash}/', self.data,
+                          content_type='application/octet-stream')
+
+    def commit(self, client, user):
+        return client.post(f'/api/storage/chunks/{user.id_user}/commit/',
+                           {'chunks': [self.hash], 'name': 'doc.bin'}, format='json')
+
+    def test_upload_and_commit(self):
+        self.assertEqual(self.missing(self.client, self.user), [self.hash])
+        self.assertEqual(self.put(self.client, self.user).status_code, 204)
+        self.assertEqual(self.missing(self.client, self.user), [])
+        self.assertEqual(self.commit(self.client, self.user).status_code, 201)
+        file = Storage.objects.get(id_user=self.user, original_name='doc.bin')
+        self.assertEqual(file.size, len(self.data))
+
+    def test_other_user_chunk_requires_upload(self):
+        self.put(self.client, self.user)
+        self.assertEqual(self.commit(self.client, self.user).status_code, 201)
+
+        bob = self.create_user('bob')
+        bob_client = self.client_for(bob)
+        # Знание хеша не дает доступа к чужому содержимому
+        self.assertEqual(self.missing(bob_client, bob), [self.hash])
+        self.assertEqual(self.commit(bob_client, bob).status_code, 400)
+        self.assertFalse(Storage.objects.filter(id_user=bob).exists())
+        # После загрузки самих байтов блок можно использовать
+        self.assertEqual(self.put(bob_client, bob).status_code, 204)
+        self.assertEqual(self.missing(bob_client, bob), [])
+        self.assertEqual(self.commit(bob_client, bob).status_code, 201)
+
+    def test_new_version_of_existing_file(self):
+        self.put(self.client, self.user)
+        file_id = self.commit(self.client, self.user).data['id_file']
+        data = os.urandom(3000)
+        self.client.put(f'/api/storage/chunks/{self.user.id_user}/{chunk_hash(data)}/', data,
+                        content_type='application/octet-stream')
+        response = self.client.post(f'/api/storage/chunks/{self.user.id_user}/commit/',
+                                    {'chunks': [self.hash, chunk_hash(data)], 'id_file': file_id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['size'], 8000)
+        self.assertEqual(download(self.client, file_id), self.data + data)
+
+    def test_chunk_hash_must_match(self):
+        response = self.client.put(f'/api/storage/chunks/{self.user.id_user}/{"0" * 64}/', self.data,
+                                   content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rename_chunked_file(self):
+        self.put(self.client, self.user)
+        file_id = self.commit(self.client, self.user).data['id_file']
+        self.upload('taken.txt')
+        url = f'/api/storage/{self.user.id_user}/{file_id}/'
+        self.assertEqual(self.client.patch(url, {'name': 'taken.txt'}, format='json').status_code, 400)
+        response = self.client.patch(url, {'name': 'renamed.bin'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Storage.objects.get(pk=file_id).original_name, 'renamed.bin')
+
+    def test_rename_foreign_chunked_file(self):
+        self.put(self.client, self.user)
+        file_id = self.commit(self.client, self.user).data['id_file']
+        bob = self.create_user('bob')
+        # Свой id в пути не дает доступа к файлу другого пользователя
+        response = self.client_for(bob).patch(f'/api/storage/{bob.id_user}/{file_id}/', {'name': 'x'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Storage.objects.get(pk=file_id).original_name, 'doc.bin')
+
+    @override_settings(STORAGE_CHUNK_MODE=True)
+    def test_chunk_mode_upload_deduplicates(self):
+        data = os.urandom(3 * MIN_CHUNK_SIZE)
+        first = self.upload('a.bin', data)
+        chunks = Chunk.objects.count()
+        second = self.upload('b.bin', data)
+        self.assertTrue(first.chunked)
+        self.assertEqual(Chunk.objects.count(), chunks)
+        self.assertEqual(download(self.client, second.id_file), data)
+
+
+class ContentDefinedChunkingTests(TestCase):
+    """Разбиение по содержимому (chunking.py)"""
+
+    def test_chunks_reassemble(self):
+        data = os.urandom(6 * 1024 * 1024)
+        chunks = list(iter_chunks(BytesIO(data)))
+        self.assertEqual(b''.join(chunks), data)
+        self.assertTrue(all(len(chunk) <= MAX_CHUNK_SIZE for chunk in chunks))
+        self.assertTrue(all(len(chunk) >= MIN_CHUNK_SIZE for chunk in chunks[:-1]))
+
+    def test_insertion_keeps_other_chunks(self):
+        data = os.urandom(8 * 1024 * 1024)
+        before = {chunk_hash(chunk) for chunk in iter_chunks(BytesIO(data))}
+        after = [chunk_hash(chunk) for chunk in iter_chunks(BytesIO(data[:100] + b'inserted' + data[100:]))]
+        # Меняется только блок со вставкой, границы остальных блоков сдвигаются вместе с содержимым
+        self.assertGreaterEqual(sum(hash_hex in before for hash_hex in after), len(after) - 2)
+
+    @skipIf(chunking.numpy is None, 'нужен пакет numpy')
+    def test_vectorized_scan_matches_byte_loop(self):
+        low_entropy = bytes(random.Random(1).choice(b'ab') for _ in range(2 * 1024 * 1024))
+        for data in (os.urandom(2 * 1024 * 1024), bytes(2 * 1024 * 1024), low_entropy):
+            for start in (0, 12345):
+                length = len(data) - start
+                end, normal = min(length, MAX_CHUNK_SIZE), min(AVG_CHUNK_SIZE, length)
+                self.assertEqual(chunking.cut_point(data, start), chunking._cut_point_python(data, start, normal, end))
+
+
+class EncryptionFormatTests(TestCase):
+    """Потоковый формат AES-GCM с произвольным доступом (encryption.py)"""
+
+    key = os.urandom(32)
+
+    def encrypt(self, data, segment_size=1000):
+        path = os.path.join(MEDIA_ROOT, f'encrypted-{secrets.token_hex(4)}')
+        with open(path, 'wb') as dst:
+            # Части разного размера, не кратные сегменту
+            size = encrypt_stream((data[i:i + 777] for i in range(0, len(data), 777)), dst, self.key, segment_size)
+        self.addCleanup(os.remove, path)
+        self.assertEqual(size, len(data))
+        return path
+
+    def read(self, path, start=0, end=None):
+        return b''.join(iter_decrypted(path, self.key, start, end))
+
+    def test_ranges_across_segments(self):
+        data = os.urandom(10500)
+        path = self.encrypt(data)
+        self.assertEqual(self.read(path), data)
+        for start, end in ((0, 1), (999, 1001), (1000, 2000), (2500, 9999), (10000, None), (10499, 20000)):
+            self.assertEqual(self.read(path, start, end), data[start:end], (start, end))
+        self.assertEqual(self.read(path, 20000), b'')
+
+    def test_sizes_on_segment_boundary(self):
+        for data in (b'', os.urandom(1000), os.urandom(3000)):
+            path = self.encrypt(data)
+            with EncryptedFile(path, self.key) as encrypted:
+                self.assertEqual(encrypted.size, len(data))
+            self.assertEqual(self.read(path), data)
+
+    def test_tampering_is_detected(self):
+        path = self.encrypt(os.urandom(3500))
+        with open(path, 'r+b') as f:
+            f.seek(HEADER_SIZE + 1500)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 1]))
+        self.assertEqual(len(self.read(path, 0, 1000)), 1000)
+        with self.assertRaises(InvalidTag):
+            self.read(path, 1000, 2000)
+
+    def test_truncation_is_detected(self):
+        path = self.encrypt(os.urandom(3500))
+        with open(path, 'r+b') as f:
+            # Отрезаем последний сегмент целиком: предпоследний не помечен как последний
+            f.truncate(HEADER_SIZE + 3 * (1000 + 16))
+        with self.assertRaises(InvalidTag):
+            self.read(path)
+
+    def test_wrong_key(self):
+        path = self.encrypt(b'secret')
+        with self.assertRaises(InvalidTag):
+            b''.join(iter_decrypted(path, os.urandom(32)))
+
+
+@override_settings(STORAGE_ENCRYPTION_KEY=base64.urlsafe_b64encode(b'k' * 32).decode())
+class EncryptedStorageTests(ApiTestCase):
+    """Файлы на диске зашифрованы, скачивание и диапазоны отдают открытый текст"""
+
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(200 * 1024)
+        self.file = self.upload('secret.bin', self.data)
+
+    def test_stored_encrypted(self):
+        self.assertTrue(self.file.encrypted)
+        with open(self.file.file.path, 'rb') as f:
+            stored = f.read()
+        self.assertTrue(stored.startswith(MAGIC))
+        self.assertNotIn(self.data[:64], stored)
+        self.assertEqual(self.file.size, len(self.data))
+
+    def test_download(self):
+        self.assertEqual(download(self.client, self.file.id_file), self.data)
+
+    def test_range_requests(self):
+        for header, expected in (('bytes=70000-140000', self.data[70000:140001]),
+                                 ('bytes=-100', self.data[-100:]),
+                                 ('bytes=204000-', self.data[204000:])):
+            response = self.client.get(f'/api/storage/download/{self.file.id_file}/', HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(b''.join(response.streaming_content), expected, header)
+            self.assertEqual(int(response['Content-Length']), len(expected))
+
+
+class DownloadStatsTests(ApiTestCase):
+    """Счетчики скачиваний в памяти, сброс пакетом в часовые и суточные строки и сводка для администратора"""
+
+    def setUp(self):
+        super().setUp()
+        self.file = self.upload('a.txt', b'x' * 1000)
+
+    def stat(self, period):
+        return DownloadStat.objects.get(period=period, id_file=self.file.id_file, channel=DownloadStat.CHANNEL_DIRECT)
+
+    def test_rollups(self):
+        download(self.client, self.file.id_file)
+        download(self.client, self.file.id_file)
+        # До сброса в БД ничего не пишется
+        self.assertFalse(DownloadStat.objects.exists())
+        stats.flush()
+        for period in (DownloadStat.PERIOD_HOUR, DownloadStat.PERIOD_DAY):
+            row = self.stat(period)
+            self.assertEqual((row.downloads, row.bytes_sent), (2, 2000))
+        self.file.refresh_from_db()
+        self.assertIsNotNone(self.file.last_download_date)
+
+        download(self.client, self.file.id_file)
+        stats.flush()
+        self.assertEqual(self.stat(DownloadStat.PERIOD_DAY).downloads, 3)
+
+    def test_only_full_and_leading_ranges_count(self):
+        url = f'/api/storage/download/{self.file.id_file}/'
+        b''.join(self.client.get(url, HTTP_RANGE='bytes=0-99').streaming_content)
+        b''.join(self.client.get(url, HTTP_RANGE='bytes=100-').streaming_content)
+        self.client.get(url, HTTP_RANGE='bytes=5000-')
+        stats.flush()
+        row = self.stat(DownloadStat.PERIOD_DAY)
+        self.assertEqual((row.downloads, row.bytes_sent), (1, 1000))
+
+    def test_link_channel(self):
+        link = self.client.post(f'/api/storage/link/{self.user.id_user}/{self.file.id_file}/').data['link']
+        b''.join(APIClient().get(link).streaming_content)
+        stats.flush()
+        row = DownloadStat.objects.get(period=DownloadStat.PERIOD_DAY, channel=DownloadStat.CHANNEL_LINK)
+        self.assertEqual((row.id_file, row.downloads), (self.file.id_file, 1))
+
+    def test_write_outside_counter_lock(self):
+        stats.record_download(self.file, DownloadStat.CHANNEL_DIRECT)
+        with mock.patch('api_app.stats._write', side_effect=lambda *batch: self.assertFalse(stats._lock.locked())) as write:
+            stats.flush()
+        write.assert_called_once()
+
+    def test_admin_summary(self):
+        download(self.client, self.file.id_file)
+        admin = self.create_user('admin', role='admin')
+        client = self.client_for(admin)
+        response = client.get('/api/admin/stats/downloads/', {'group': 'user'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['downloads'], 1)
+        self.assertEqual(response.data['results'], [{'id_user': self.user.id_user, 'downloads': 1, 'bytes_sent': 1000}])
+        today = timezone.localdate().isoformat()
+        response = client.get('/api/admin/stats/downloads/', {'group': 'time', 'period': 'hour', 'date_to': today})
+        self.assertEqual(response.data['downloads'], 1)
+        self.assertEqual(client.get('/api/admin/stats/downloads/', {'group': 'owner'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/stats/downloads/').status_code, 403)
+
+
+class AdminScaleTests(ApiTestCase):
+    """Админка для больших таблиц: оценка количества, итоги пользователей подзапросами, фильтр по владельцу"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('root@example.com', 'root', 'Passw0rd!')
+        self.site = Client()
+        self.site.force_login(self.admin)
+
+    def test_estimated_count(self):
+        queryset = Storage.objects.order_by('pk')
+        with mock.patch('api_app.pagination.estimate_count', return_value=50000):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 50000)
+            self.assertEqual(len(queries), 0)
+        # Для небольших таблиц и СУБД без статистики - точный COUNT(*)
+        self.upload('a.txt')
+        for estimate in (5, None):
+            with mock.patch('api_app.pagination.estimate_count', return_value=estimate):
+                self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 1)
+
+    def test_user_changelist_totals(self):
+        self.upload('a.txt', b'12345')
+        self.upload('b.txt', b'123')
+
+        def changelist():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.site.get('/admindjango/api_app/user/')
+            self.assertEqual(response.status_code, 200)
+            return len(queries), {user.username: (user.files_count, user.files_size) for user in response.context['cl'].result_list}
+
+        before, totals = changelist()
+        self.assertEqual(totals['alice'], (2, 8))
+        self.assertEqual(totals['root'], (0, 0))
+        for index in range(5):
+            self.create_user(f'user{index}')
+        after, totals = changelist()
+        self.assertEqual(len(totals), 7)
+        self.assertEqual(before, after)
+
+    def test_owner_filter(self):
+        file = self.upload('a.txt')
+        bob = self.create_user('bob')
+        Storage.objects.create(id_user=bob, original_name='b.txt', comment='', size=0)
+        response = self.site.get('/admindjango/api_app/storage/', {'user': self.user.pk})
+        self.assertEqual([item.pk for item in response.context['cl'].result_list], [file.pk])
+        # Нечисловое значение фильтра не ломает список
+        response = self.site.get('/admindjango/api_app/storage/', {'user': 'abc'})
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+
+    def test_expire_links_action(self):
+        file = self.upload('a.txt')
+        self.client.post(f'/api/storage/link/{self.user.id_user}/{file.id_file}/')
+        response = self.site.post('/admindjango/api_app/storage/', {'action': 'expire_links', '_selected_action': [file.pk]})
+        self.assertEqual(response.status_code, 302)
+        file.refresh_from_db()
+        self.assertIsNone(file.token)
+
+    def test_delete_user_queues_files(self):
+        file = self.upload('a.txt')
+        response = self.site.post(f'/admindjango/api_app/user/{self.user.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        # Файл на диске удалит purge_trash по очереди, а не запрос админки
+        self.assertTrue(os.path.isfile(file.file.path))
+        self.assertEqual(list(PurgeItem.objects.values_list('file', flat=True)), [file.file.name])
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0.0)
+class ProfilingTests(ApiTestCase):
+    """Профилирование по требованию: доступ по заголовку X-Profile, выборка и отчеты администратора"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('root', role='admin')
+        self.admin_client = self.client_for(self.admin)
+
+    def test_requested_by_admin(self):
+        response = self.admin_client.get('/api/users/user_info/', HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        report = ProfileReport.objects.get(id_report=response['X-Profile-Id'])
+        self.assertFalse(report.sampled)
+        self.assertEqual(report.id_user, self.admin)
+        self.assertEqual(report.path, '/api/users/user_info/')
+        self.assertGreater(report.query_count, 0)
+        self.assertEqual(len(report.queries), report.query_count)
+        self.assertIn('cumulative', report.profile)
+
+    def test_requested_without_staff_token(self):
+        for client, headers in ((APIClient(), {}),
+                                (self.client, {}),
+                                (APIClient(), {'HTTP_AUTHORIZATION': 'Bearer junk'})):
+            response = client.get('/api/users/user_info/', HTTP_X_PROFILE='1', **headers)
+            self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertFalse(ProfileReport.objects.exists())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_REPORTS=2)
+    def test_sampling_keeps_last_reports(self):
+        for _ in range(3):
+            response = self.client.get('/api/users/user_info/')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('X-Profile-Id'))
+        reports = ProfileReport.objects.order_by('id_report')
+        self.assertEqual(reports.count(), 2)
+        self.assertTrue(all(report.sampled for report in reports))
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled(self):
+        response = self.admin_client.get('/api/users/user_info/', HTTP_X_PROFILE='1')
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_one_profiler_per_process(self):
+        first, second = RequestProfiler(), RequestProfiler()
+        self.assertTrue(first.start())
+        try:
+            self.assertFalse(second.start())
+        finally:
+            first.stop()
+        self.assertTrue(second.start())
+        second.stop()
+
+    def test_report_views(self):
+        id_report = self.admin_client.get('/api/users/user_info/', HTTP_X_PROFILE='1')['X-Profile-Id']
+        self.assertEqual(self.client.get('/api/admin/profiles/').status_code, 403)
+
+        response = self.admin_client.get('/api/admin/profiles/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id_report'] for item in response.data['results']], [int(id_report)])
+        self.assertNotIn('profile', response.data['results'][0])
+        self.assertEqual(self.admin_client.get('/api/admin/profiles/', {'ordering': 'path'}).status_code, 400)
+
+        response = self.admin_client.get(f'/api/admin/profiles/{id_report}/')
+        self.assertIn('cumulative', response.data['profile'])
+        self.assertEqual(self.admin_client.delete(f'/api/admin/profiles/{id_report}/').status_code, 204)
+        self.assertEqual(self.admin_client.get(f'/api/admin/profiles/{id_report}/').status_code, 404)
+
+
+class StorageScanTests(ApiTestCase):
+    """Сверка диска и БД (scan_storage) и сборка неиспользуемых блоков (collect_chunks)"""
+
+    def setUp(self):
+        super().setUp()
+        # Отдельный каталог: файлы других тестов остаются на диске без записей в БД
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media_override = self.settings(MEDIA_ROOT=self.media)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def scan(self, *args):
+        output = StringIO()
+        call_command('scan_storage', '--grace-minutes', '0', '--workers', '2', *args, stdout=output)
+        return output.getvalue()
+
+    def test_consistent_tree(self):
+        self.upload('a.txt')
+        output = self.scan('--verify')
+        self.assertNotIn('ORPHAN', output)
+        self.assertNotIn('DANGLING', output)
+        self.assertIn('files: 1, rows: 1', output)
+        self.assertIn('corrupt: 0', output)
+
+    def test_orphans_and_dangling_rows(self):
+        self.upload('a.txt')
+        missing = self.upload('b.txt')
+        os.remove(missing.file.path)
+        with open(os.path.join(self.media, 'uploads', 'stray.bin'), 'wb') as f:
+            f.write(b'stray')
+
+        output = self.scan()
+        self.assertIn('ORPHAN uploads/stray.bin', output)
+        self.assertIn(f'DANGLING storage id_file={missing.pk}', output)
+        # Без флагов команда только сообщает
+        self.assertTrue(os.path.isfile(os.path.join(self.media, 'uploads', 'stray.bin')))
+        self.assertTrue(Storage.objects.filter(pk=missing.pk).exists())
+
+        self.scan('--quarantine', '--delete-dangling')
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'uploads', 'stray.bin')))
+        quarantined = [name for _, _, names in os.walk(os.path.join(self.media, 'quarantine')) for name in names]
+        self.assertEqual(quarantined, ['stray.bin'])
+        self.assertFalse(Storage.all_objects.filter(pk=missing.pk).exists())
+        self.assertNotIn('ORPHAN', self.scan())
+
+    def test_grace_period_skips_fresh_files(self):
+        os.makedirs(os.path.join(self.media, 'uploads'))
+        with open(os.path.join(self.media, 'uploads', 'stray.bin'), 'wb') as f:
+            f.write(b'stray')
+        output = StringIO()
+        call_command('scan_storage', stdout=output)
+        self.assertNotIn('ORPHAN', output.getvalue())
+
+    def test_verify_detects_corruption(self):
+        file = self.upload('a.txt', b'hello')
+        self.assertIsNotNone(file.checksum)
+        with open(file.file.path, 'wb') as f:
+            f.write(b'jello')
+        self.assertNotIn('CORRUPT', self.scan())
+        self.assertIn(f'CORRUPT storage id_file={file.pk}', self.scan('--verify'))
+
+    def test_verify_fills_missing_checksum(self):
+        file = self.upload('a.txt', b'hello')
+        expected = file.checksum
+        Storage.objects.filter(pk=file.pk).update(checksum=None)
+        self.assertIn('filled: 1', self.scan('--verify'))
+        file.refresh_from_db()
+        self.assertEqual(file.checksum, expected)
+
+    def test_collect_unreferenced_chunks(self):
+        data = os.urandom(5000)
+        hash_hex = chunk_hash(data)
+        response = self.client.put(f'/api/storage/chunks/{self.user.id_user}/{hash_hex}/', data,
+                                   content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 204)
+        # Свежие блоки не трогаем: клиент еще может собрать из них файл
+        call_command('collect_chunks', stdout=StringIO())
+        self.assertTrue(Chunk.objects.filter(hash=hash_hex).exists())
+
+        call_command('collect_chunks', grace_hours=0, stdout=StringIO())
+        self.assertFalse(Chunk.objects.filter(hash=hash_hex).exists())
+        self.assertFalse(os.path.exists(chunking.chunk_path(hash_hex)))
+
+
+class BatchUploadTests(ApiTestCase):
+    """Пакетная загрузка: много файлов или архив одним запросом, ограничения архива и квота"""
+
+    def batch(self, **data):
+        return self.client.post(f'/api/storage/batch/{self.user.id_user}/', data, format='multipart')
+
+    @staticmethod
+    def zip_archive(members):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            for name, content in members.items():
+                zf.writestr(name, content)
+        return SimpleUploadedFile('batch.zip', buffer.getvalue())
+
+    def test_files(self):
+        self.upload('a.txt')
+        response = self.client.post(f'/api/folders/{self.user.id_user}/', {'name': 'docs'}, format='json')
+        folder = Folder.objects.get(pk=response.data['id_folder'])
+        response = self.batch(files=[SimpleUploadedFile('a.txt', b'one'), SimpleUploadedFile('b.txt', b'two!')],
+                              folder=folder.pk, comment='batch')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        names = [result['original_name'] for result in response.data['results']]
+        # Конфликт имен разрешается так же, как при обычной загрузке
+        self.assertEqual(names[1], 'b.txt')
+        self.assertNotEqual(names[0], 'a.txt')
+        for result, content in zip(response.data['results'], (b'one', b'two!')):
+            file = Storage.objects.get(pk=result['id_file'])
+            self.assertEqual((file.folder, file.comment, file.size), (folder, 'batch', len(content)))
+            self.assertEqual(download(self.client, file.pk), content)
+        folder.refresh_from_db()
+        self.assertEqual((folder.files_total, folder.size_total), (2, 7))
+
+    def test_zip_archive(self):
+        archive = self.zip_archive({'dir/one.txt': b'one', 'two.txt': b'two', 'empty/': b''})
+        response = self.batch(archive=archive)
+        self.assertEqual(response.status_code, 201)
+        # Каталоги пропускаются, пути внутри архива отбрасываются
+        self.assertEqual(sorted(result['original_name'] for result in response.data['results']), ['one.txt', 'two.txt'])
+
+    def test_tar_archive(self):
+        buffer = BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tf:
+            info = tarfile.TarInfo('one.txt')
+            info.size = 3
+            tf.addfile(info, BytesIO(b'one'))
+        response = self.batch(archive=SimpleUploadedFile('batch.tar.gz', buffer.getvalue()))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(download(self.client, response.data['results'][0]['id_file']), b'one')
+
+    def test_bad_archive(self):
+        response = self.batch(archive=SimpleUploadedFile('batch.zip', b'not an archive'))
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(STORAGE_ARCHIVE_MAX_BYTES=1000)
+    def test_archive_limit_checked_before_unpacking(self):
+        archive = self.zip_archive({'zeros.bin': bytes(5000)})
+        with mock.patch('api_app.views.batch_upload') as batch_upload:
+            response = self.batch(archive=archive)
+        self.assertEqual(response.status_code, 413)
+        batch_upload.assert_not_called()
+
+    @override_settings(STORAGE_QUOTA_BYTES=10)
+    def test_quota(self):
+        self.upload('a.txt', b'hello')
+        response = self.batch(files=[SimpleUploadedFile('b.txt', b'hello!')])
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(Storage.objects.filter(id_user=self.user).count(), 1)
+
+    @override_settings(STORAGE_BATCH_MAX_FILES=1)
+    def test_max_files(self):
+        response = self.batch(files=[SimpleUploadedFile('a.txt', b'a'), SimpleUploadedFile('b.txt', b'b')])
+        self.assertEqual(response.status_code, 400)
+
+    def test_foreign_user(self):
+        bob = self.create_user('bob')
+        response = self.client.post(f'/api/storage/batch/{bob.id_user}/', {'files': [SimpleUploadedFile('a.txt', b'a')]},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(EVENTS_STREAM_SECONDS=0.3, EVENTS_POLL_INTERVAL=0.05)
+class EventFeedTests(ApiTestCase):
+    """Лента изменений: курсор JSON и SSE, reset для устаревшего курсора, закрытие потока при выходе из сессии"""
+
+    def feed(self, **params):
+        response = self.client.get(f'/api/events/{self.user.id_user}/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def stream(self, cursor):
+        response = self.client.get(f'/api/events/{self.user.id_user}/', {'cursor': cursor},
+                                   HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return b''.join(response.streaming_content).decode()
+
+    def event(self, **fields):
+        return StorageEvent.objects.create(id_user=self.user, kind=events.UPDATE, **fields)
+
+    def test_json_cursor(self):
+        data = self.feed()
+        self.assertEqual(data['events'], [])
+        cursor = data['cursor']
+        file = self.upload('a.txt')
+        data = self.feed(cursor=cursor)
+        self.assertEqual([(event['kind'], event['id_file']) for event in data['events']], [(events.UPLOAD, file.pk)])
+        self.assertEqual(data['cursor'], data['events'][-1]['id'])
+        self.assertEqual(self.feed(cursor=data['cursor'])['events'], [])
+
+    def test_other_users_events(self):
+        bob = self.create_user('bob')
+        cursor = self.feed()['cursor']
+        self.client_for(bob).post(f'/api/storage/{bob.id_user}/', {'file': SimpleUploadedFile('b.txt', b'b'), 'comment': ''})
+        data = self.feed(cursor=cursor)
+        self.assertEqual(data['events'], [])
+        # Курсор сдвигается и без событий этого пользователя
+        self.assertGreater(data['cursor'], cursor)
+        self.assertEqual(self.client.get(f'/api/events/{bob.id_user}/').status_code, 403)
+
+    def test_bad_and_expired_cursor(self):
+        self.assertEqual(self.client.get(f'/api/events/{self.user.id_user}/', {'cursor': 'abc'}).status_code, 400)
+        first, second, third = self.event(), self.event(), self.event()
+        StorageEvent.objects.filter(pk=first.pk).delete()
+        data = self.feed(cursor=first.id - 1)
+        self.assertTrue(data['reset'])
+        self.assertEqual((data['cursor'], data['events']), (third.id, []))
+        data = self.feed(cursor=first.id)
+        self.assertFalse(data['reset'])
+        self.assertEqual([event['id'] for event in data['events']], [second.id, third.id])
+
+    def test_waits_for_uncommitted_lower_ids(self):
+        first = self.event()
+        # id first.id + 1 выдан транзакции, которая еще не зафиксирована
+        third = self.event(id=first.id + 2)
+        data = self.feed(cursor=first.id - 1)
+        self.assertEqual(([event['id'] for event in data['events']], data['cursor']), ([first.id], first.id))
+        second = self.event(id=first.id + 1)
+        data = self.feed(cursor=data['cursor'])
+        self.assertEqual([event['id'] for event in data['events']], [second.id, third.id])
+
+    def test_old_gap_treated_as_rolled_back(self):
+        first = self.event()
+        third = self.event(id=first.id + 2)
+        StorageEvent.objects.filter(pk=third.pk).update(created_date=timezone.now() - timedelta(minutes=5))
+        data = self.feed(cursor=first.id)
+        self.assertEqual(([event['id'] for event in data['events']], data['cursor']), ([third.id], third.id))
+
+    def test_sse(self):
+        cursor = self.feed()['cursor']
+        file = self.upload('a.txt')
+        body = self.stream(cursor)
+        self.assertTrue(body.startswith('retry: '))
+        event_id = StorageEvent.objects.get(id_file=file.pk).id
+        self.assertIn(f'id: {event_id}\nevent: upload\n', body)
+        self.assertEqual(self.stream(event_id).count('event: upload'), 0)
+
+    def test_sse_reset(self):
+        first, second = self.event(), self.event()
+        StorageEvent.objects.filter(pk=first.pk).delete()
+        self.assertIn(f'id: {second.id}\nevent: reset\n', self.stream(first.id - 1))
+
+    @override_settings(EVENTS_STREAM_SECONDS=30)
+    def test_logout_closes_own_stream(self):
+        cursor = self.feed()['cursor']
+        session = AuthSession.objects.get(id_user=self.user)
+        events.emit(self.user.id_user, events.LOGOUT, payload={'session': session.id_session})
+        started = time.monotonic()
+        self.assertIn('event: logout', self.stream(cursor))
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_logout_of_other_session_keeps_stream(self):
+        cursor = self.feed()['cursor']
+        # Выход с другого устройства (своя сессия) не закрывает этот поток
+        self.assertEqual(self.client_for(self.user).post('/api/auth/logout/').status_code, 204)
+        started = time.monotonic()
+        self.assertIn('event: logout', self.stream(cursor))
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+    async def test_sse_asgi(self):
+        session = await sync_to_async(start_session)(self.user)
+        headers = {'Authorization': 'Bearer ' + session['access']}
+        response = await self.async_client.get(f'/api/events/{self.user.id_user}/', headers=headers)
+        cursor = response.json()['cursor']
+        await sync_to_async(self.event)()
+        response = await self.async_client.get(f'/api/events/{self.user.id_user}/', {'cursor': cursor},
+                                               headers={**headers, 'Accept': 'text/event-stream'})
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('event: update', body)
+
+
+class ContentMetadataTests(ApiTestCase):
+    """Метаданные содержимого сохраняются при загрузке и используются при отдаче: тип, кодировка, ETag, Range"""
+
+    def test_sniffed_at_upload(self):
+        png = self.upload('picture.txt', b'\x89PNG\r\n\x1a\n' + bytes(32))
+        self.assertEqual((png.content_type, png.charset), ('image/png', None))
+        csv = self.upload('table.csv', 'имя;размер\n'.encode('windows-1251'))
+        self.assertEqual((csv.content_type, csv.charset), ('text/csv', 'windows-1251'))
+        text = self.upload('notes', 'привет'.encode())
+        self.assertEqual((text.content_type, text.charset), ('text/plain', 'utf-8'))
+        self.assertEqual(text.checksum, hashlib.sha256('привет'.encode()).hexdigest())
+        self.assertIsNotNone(text.file_mtime)
+
+    def test_headers_from_stored_metadata(self):
+        file = self.upload('notes', 'привет'.encode())
+        with mock.patch('api_app.views.mimetypes.guess_type') as guess_type:
+            response = self.client.get(f'/api/storage/view/{self.user.id_user}/{file.id_file}/')
+            self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+            response = self.client.get(f'/api/storage/download/{file.id_file}/')
+            self.assertEqual(response['Content-Type'], 'text/plain')
+        guess_type.assert_not_called()
+        self.assertEqual(response['ETag'], f'"{file.checksum}"')
+        self.assertEqual(response['Last-Modified'], http_date(file.file_mtime.timestamp()))
+
+    def test_not_modified(self):
+        file = self.upload('a.txt')
+        for url in (f'/api/storage/download/{file.id_file}/', f'/api/storage/view/{self.user.id_user}/{file.id_file}/'):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"{file.checksum}"')
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], f'"{file.checksum}"')
+        self.assertEqual(self.client.get(f'/api/storage/download/{file.id_file}/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_range_and_if_range(self):
+        file = self.upload('a.txt', b'0123456789')
+        response = self.client.get(f'/api/storage/download/{file.id_file}/', HTTP_RANGE='bytes=2-4',
+                                   HTTP_IF_RANGE=f'"{file.checksum}"')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        self.assertEqual(download(self.client, file.id_file, HTTP_RANGE='bytes=-3'), b'789')
+        # Файл изменился (другой ETag) - отдается целиком
+        response = self.client.get(f'/api/storage/download/{file.id_file}/', HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+    def test_unsatisfiable_range_does_not_open_file(self):
+        file = self.upload('a.txt', b'01234')
+        with mock.patch.object(StorageView, 'open_file') as open_file:
+            response = self.client.get(f'/api/storage/download/{file.id_file}/', HTTP_RANGE='bytes=10-20')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */5')
+        open_file.assert_not_called()
+
+    def test_backfill(self):
+        file = self.upload('picture.bin', b'GIF89a' + bytes(16))
+        expected = Storage.objects.filter(pk=file.pk).values('content_type', 'checksum').get()
+        Storage.objects.filter(pk=file.pk).update(content_type=None, charset=None, checksum=None, file_mtime=None)
+        call_command('backfill_metadata', stdout=StringIO())
+        file.refresh_from_db()
+        self.assertEqual({'content_type': file.content_type, 'checksum': file.checksum}, expected)
+        self.assertIsNotNone(file.file_mtime)
+
+
+class TransferTests(ApiTestCase):
+    """Перенос между серверами: export_storage и import_storage в каталог и tar, повторный импорт"""
+
+    def setUp(self):
+        super().setUp()
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output, ignore_errors=True)
+        response = self.client.post(f'/api/folders/{self.user.id_user}/', {'name': 'docs'}, format='json')
+        self.folder = Folder.objects.get(pk=response.data['id_folder'])
+        self.upload('a.txt', b'first file', comment='note', folder=self.folder)
+        self.upload('b.bin', os.urandom(3000))
+        self.other = self.create_user('bob')
+        Storage.objects.create(id_user=self.other, original_name='bob.txt', comment='', size=0)
+
+    def snapshot(self, user):
+        return sorted(
+            (file.original_name, file.comment, file.size, file.checksum, file.content_type, file.folder.name if file.folder else None)
+            for file in Storage.objects.filter(id_user=user)
+        )
+
+    def transfer(self, output):
+        expected = self.snapshot(self.user)
+        contents = {file.original_name: download(self.client, file.pk) for file in Storage.objects.filter(id_user=self.user)}
+        call_command('export_storage', output, '--user', 'alice', '--workers', '2', stdout=StringIO(), stderr=StringIO())
+        # Накопленные счетчики скачиваний пишем в БД до удаления пользователя
+        stats.flush()
+        User.objects.filter(pk=self.user.pk).delete()
+
+        call_command('import_storage', output, '--workers', '2', stdout=StringIO(), stderr=StringIO())
+        user = User.objects.get(username='alice')
+        self.assertTrue(user.check_password('Passw0rd!'))
+        self.assertEqual(self.snapshot(user), expected)
+        client = self.client_for(user)
+        for file in Storage.objects.filter(id_user=user):
+            self.assertEqual(download(client, file.pk), contents[file.original_name])
+        folder = Folder.objects.get(id_user=user)
+        self.assertEqual((folder.name, folder.files_total, folder.size_total), ('docs', 1, 10))
+        # Выгружен только указанный пользователь
+        self.assertEqual(User.objects.filter(username='bob').count(), 1)
+        return user
+
+    def test_directory(self):
+        user = self.transfer(self.output)
+        # Повторный запуск ничего не дублирует
+        output = StringIO()
+        call_command('import_storage', self.output, stdout=output, stderr=StringIO())
+        self.assertIn('skipped: 2', output.getvalue())
+        self.assertEqual(Storage.objects.filter(id_user=user).count(), 2)
+        self.assertEqual(Folder.objects.filter(id_user=user).count(), 1)
+
+    def test_tar(self):
+        self.transfer(os.path.join(self.output, 'dump.tar.gz'))
+
+    def test_missing_source(self):
+        with self.assertRaises(CommandError):
+            call_command('import_storage', os.path.join(self.output, 'missing.tar'), stdout=StringIO())
+
+
+class HealthTests(ApiTestCase):
+    """Проверки состояния: live без БД и аутентификации, ready - список недоступных зависимостей"""
+
+    def test_live(self):
+        with self.assertNumQueries(0):
+            response = APIClient().get('/api/health/live/', HTTP_AUTHORIZATION='Bearer junk')
+        self.assertEqual((response.status_code, response.data), (200, {'status': 'ok'}))
+
+    def test_ready(self):
+        response = APIClient().get('/api/health/ready/')
+        self.assertEqual((response.status_code, response.data), (200, {'status': 'ok'}))
+
+    def test_ready_failures(self):
+        failing = mock.MagicMock()
+        failing.__getitem__.return_value.cursor.side_effect = OSError('connection refused')
+        with mock.patch('api_app.views.connections', failing), \
+                mock.patch('api_app.views.cache.set', side_effect=OSError('cache down')), \
+                self.settings(MEDIA_ROOT=os.path.join(MEDIA_ROOT, 'missing')):
+            response = APIClient().get('/api/health/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data, {'status': 'fail', 'failed': ['database', 'cache', 'media']})
+
+    def test_asgi_disables_persistent_connections(self):
+        """backend_project.asgi включает SERVING_ASGI до загрузки настроек (в отдельном процессе)"""
+        env = {key: value for key, value in os.environ.items() if key != 'DJANGO_ASGI'}
+        env['DATABASE_CONN_MAX_AGE'] = '60'
+        code = 'import backend_project.{}; from django.conf import settings; print(settings.SERVING_ASGI, settings.DATABASE_CONN_MAX_AGE)'
+        for module, expected in (('asgi', 'True 0'), ('wsgi', 'False 60')):
+            result = subprocess.run([sys.executable, '-c', code.format(module)], cwd=settings.BASE_DIR, env=env,
+                                    capture_output=True, text=True, timeout=60)
+            self.assertEqual(result.stdout.strip().splitlines()[-1], expected, result.stderr)
+
+
+class FileTransferTests(ApiTestCase):
+    """Копирование и перемещение файлов на сервере, в том числе другому пользователю"""
+
+    def setUp(self):
+        super().setUp()
+        self.bob = self.create_user('bob')
+        response = self.client.post(f'/api/folders/{self.user.id_user}/', {'name': 'docs'}, format='json')
+        self.folder = Folder.objects.get(pk=response.data['id_folder'])
+
+    def transfer(self, action, data, client=None, id_user=None):
+        return (client or self.client).post(f'/api/storage/{action}/{id_user or self.user.id_user}/', data, format='json')
+
+    def test_copy_into_folder(self):
+        file = self.upload('a.txt', b'hello')
+        self.upload('a.txt', b'other', folder=self.folder)
+        response = self.transfer('copy', {'files': [file.pk], 'folder': self.folder.pk})
+        self.assertEqual(response.status_code, 201)
+        result = response.data['results'][0]
+        self.assertEqual(result['method'], 'link')
+        self.assertNotEqual(result['original_name'], 'a.txt')
+        copy = Storage.objects.get(pk=result['new_id_file'])
+        self.assertEqual((copy.folder, copy.checksum, copy.content_type), (self.folder, file.checksum, file.content_type))
+        self.assertEqual(download(self.client, copy.pk), b'hello')
+        self.assertTotals(self.folder, 2, 10)
+
+    @override_settings(STORAGE_COPY_HARDLINKS=False)
+    def test_copy_without_hardlinks(self):
+        file = self.upload('a.txt', b'hello')
+        result = self.transfer('copy', {'files': [file.pk]}).data['results'][0]
+        self.assertIn(result['method'], ('reflink', 'copy_file_range', 'copy'))
+        copy = Storage.objects.get(pk=result['new_id_file'])
+        self.assertFalse(os.path.samefile(file.file.path, copy.file.path))
+        self.assertEqual(download(self.client, copy.pk), b'hello')
+
+    def test_copy_chunked_file(self):
+        data = os.urandom(5000)
+        hash_hex = chunk_hash(data)
+        self.client.put(f'/api/storage/chunks/{self.user.id_user}/{hash_hex}/', data, content_type='application/octet-stream')
+        response = self.client.post(f'/api/storage/chunks/{self.user.id_user}/commit/', {'chunks': [hash_hex], 'name': 'doc.bin'}, format='json')
+        source = Storage.objects.get(pk=response.data['id_file'])
+        result = self.transfer('copy', {'files': [source.pk]}).data['results'][0]
+        self.assertEqual(result['method'], 'chunks')
+        self.assertEqual(download(self.client, result['new_id_file']), data)
+
+    def test_copy_reports_missing_content(self):
+        file = self.upload('a.txt')
+        os.remove(file.file.path)
+        response = self.transfer('copy', {'files': [file.pk]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(Storage.objects.filter(id_user=self.user).count(), 1)
+
+    def test_move_into_folder(self):
+        file = self.upload('a.txt', b'hello')
+        response = self.transfer('move', {'files': [file.pk], 'folder': self.folder.pk})
+        self.assertEqual((response.status_code, response.data['moved']), (200, 1))
+        file.refresh_from_db()
+        self.assertEqual(file.folder, self.folder)
+        self.assertTotals(self.folder, 1, 5)
+        # Обратно в корень
+        self.transfer('move', {'files': [file.pk]})
+        self.assertTotals(self.folder, 0, 0)
+
+    def test_other_user_requires_admin(self):
+        file = self.upload('a.txt')
+        self.assertEqual(self.transfer('copy', {'files': [file.pk], 'user': self.bob.pk}).status_code, 403)
+        self.assertEqual(self.transfer('move', {'files': [file.pk], 'user': self.bob.pk}).status_code, 403)
+        self.assertFalse(Storage.objects.filter(id_user=self.bob).exists())
+
+    def test_admin_moves_to_other_user(self):
+        admin = self.client_for(self.create_user('root', role='admin'))
+        file = self.upload('a.txt', b'hello')
+        self.client.post(f'/api/storage/link/{self.user.id_user}/{file.id_file}/')
+        Storage.objects.create(id_user=self.bob, original_name='a.txt', comment='', size=0)
+        cursor = StorageEvent.objects.order_by('-id').values_list('id', flat=True).first()
+
+        response = self.transfer('move', {'files': [file.pk], 'user': self.bob.pk}, client=admin)
+        self.assertEqual(response.status_code, 200)
+        file.refresh_from_db()
+        self.assertEqual(file.id_user, self.bob)
+        self.assertNotEqual(file.original_name, 'a.txt')
+        # Публичная ссылка прежнего владельца сбрасывается
+        self.assertIsNone(file.token)
+        kinds = set(StorageEvent.objects.filter(id__gt=cursor).values_list('id_user', 'kind'))
+        self.assertEqual(kinds, {(self.user.pk, events.DELETE), (self.bob.pk, events.UPLOAD)})
+
+        response = self.transfer('copy', {'files': [file.pk], 'user': self.user.pk}, client=admin, id_user=self.bob.pk)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(download(self.client, response.data['results'][0]['new_id_file']), b'hello')
+
+    def test_validation(self):
+        file = self.upload('a.txt')
+        self.assertEqual(self.transfer('copy', {'files': str(file.pk)}).status_code, 400)
+        self.assertEqual(self.transfer('copy', {'files': []}).status_code, 400)
+        response = self.transfer('copy', {'files': [file.pk, file.pk + 100]})
+        self.assertEqual((response.status_code, response.data['missing']), (404, [file.pk + 100]))
+        # Чужие файлы не находятся по id
+        bob_file = Storage.objects.create(id_user=self.bob, original_name='b.txt', comment='', size=0)
+        self.assertEqual(self.transfer('move', {'files': [bob_file.pk]}).status_code, 404)
+        self.assertEqual(self.transfer('move', {'files': [file.pk], 'folder': 9999}).status_code, 404)
+
+    @override_settings(STORAGE_QUOTA_BYTES=8)
+    def test_copy_quota(self):
+        file = self.upload('a.txt', b'hello')
+        self.assertEqual(self.transfer('copy', {'files': [file.pk]}).status_code, 413)
+        # Перемещение у того же владельца места не добавляет
+        self.assertEqual(self.transfer('move', {'files': [file.pk], 'folder': self.folder.pk}).status_code, 200)
+
+
+class TrashTests(ApiTestCase):
+    """Корзина: мягкое удаление, восстановление и окончательное удаление (purge_trash)"""
+
+    def test_delete_moves_file_to_trash(self):
+        file = self.upload('a.txt')
+        response = self.client.delete(f'/api/storage/{self.user.id_user}/{file.id_file}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Storage.objects.filter(pk=file.pk).exists())
+        self.assertTrue(os.path.isfile(Storage.all_objects.get(pk=file.pk).file.path))
+        self.assertEqual(self.client.get(f'/api/storage/download/{file.id_file}/').status_code, 404)
+        response = self.client.get(f'/api/trash/{self.user.id_user}/')
+        self.assertEqual([item['id_file'] for item in response.data['results']], [file.id_file])
+
+    def test_restore(self):
+        file = self.upload('a.txt')
+        self.client.delete(f'/api/storage/{self.user.id_user}/{file.id_file}/')
+        response = self.client.post(f'/api/trash/{self.user.id_user}/restore/', {'files': [file.id_file]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['restored'], 1)
+        self.assertTrue(Storage.objects.filter(pk=file.pk).exists())
+        self.assertEqual(self.client.get(f'/api/storage/download/{file.id_file}/').status_code, 200)
+
+    def test_foreign_trash_forbidden(self):
+        bob = self.create_user('bob')
+        self.assertEqual(self.client.get(f'/api/trash/{bob.id_user}/').status_code, 403)
+
+    def test_purge_removes_expired_files(self):
+        old, recent = self.upload('old.txt'), self.upload('recent.txt')
+        for file in (old, recent):
+            self.client.delete(f'/api/storage/{self.user.id_user}/{file.id_file}/')
+        Storage.all_objects.filter(pk=old.pk).update(deleted_at=timezone.now() - timedelta(days=40))
+        call_command('purge_trash', days=30, pause=0, stdout=StringIO())
+        self.assertFalse(Storage.all_objects.filter(pk=old.pk).exists())
+        self.assertFalse(os.path.isfile(old.file.path))
+        self.assertTrue(Storage.all_objects.filter(pk=recent.pk).exists())
+        self.assertTrue(os.path.isfile(recent.file.path))
+
+
+    def test_trash_and_restore_update_totals(self):
+        response = self.client.post(f'/api/folders/{self.user.id_user}/', {'name': 'docs'}, format='json')
+        folder = Folder.objects.get(pk=response.data['id_folder'])
+        file = self.upload('a.txt', b'12345', folder=folder)
+        self.client.delete(f'/api/storage/{self.user.id_user}/{file.id_file}/')
+        self.assertTotals(folder, 0, 0)
+        self.client.post(f'/api/trash/{self.user.id_user}/restore/', {'files': [file.id_file]}, format='json')
+        self.assertTotals(folder, 1, 5)
+        # Папку удалили вместе с файлом: файл восстанавливается в корень
+        self.client.delete(f'/api/folders/{self.user.id_user}/{folder.id_folder}/')
+        self.client.post(f'/api/trash/{self.user.id_user}/restore/', {'files': [file.id_file]}, format='json')
+        file.refresh_from_db()
+        self.assertIsNone(file.folder)
+        self.assertIsNone(file.deleted_at)
+
+    def test_model_delete(self):
+        response = self.client.post(f'/api/folders/{self.user.id_user}/', {'name': 'docs'}, format='json')
+        folder = Folder.objects.get(pk=response.data['id_folder'])
+        file = self.upload('a.txt', b'12345', folder=folder)
+        trashed = self.upload('b.txt', b'123', folder=folder)
+        self.client.delete(f'/api/storage/{self.user.id_user}/{trashed.id_file}/')
+        cursor = StorageEvent.objects.order_by('-id').values_list('id', flat=True).first()
+
+        self.assertEqual(file.delete(), (1, {'api_app.Storage': 1}))
+        self.assertFalse(Storage.all_objects.filter(pk=file.pk).exists())
+        self.assertFalse(os.path.isfile(file.file.path))
+        self.assertTotals(folder, 0, 0)
+        self.assertEqual(list(StorageEvent.objects.filter(id__gt=cursor).values_list('kind', 'id_file')), [(events.DELETE, file.pk)])
+        # Файл из корзины уже не учтен в счетчиках папки
+        Storage.all_objects.get(pk=trashed.pk).delete()
+        self.assertTotals(folder, 0, 0)
+        self.assertFalse(os.path.isfile(trashed.file.path))
+
+    def test_user_delete_queues_content(self):
+        admin = self.client_for(self.create_user('root', role='admin'))
+        file = self.upload('a.txt')
+        response = admin.delete(f'/api/users/{self.user.id_user}/')
+        self.assertEqual(response.status_code, 204)
+        # В запросе - только строки БД, файл удалит purge_trash
+        self.assertTrue(os.path.isfile(file.file.path))
+        self.assertEqual(list(PurgeItem.objects.values_list('file', flat=True)), [file.file.name])
+        call_command('purge_trash', pause=0, stdout=StringIO())
+        self.assertFalse(os.path.isfile(file.file.path))
+        self.assertFalse(PurgeItem.objects.exists())
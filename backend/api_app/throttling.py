@@ -0,0 +1,127 @@
+import threading
+import time
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import SimpleRateThrottle
+
+from .models import DownloadStat
+
+# Атомарное tat = max(tat, now) + cost в Redis: параллельные скачивания в разных процессах не затирают резервы друг друга
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+tat = tat + tonumber(ARGV[2])
+-- Явно целым числом: Lua 5.1 в Redis превращает число в строку как %.14g, и 16 цифр микросекунд теряются
+redis.call('SET', KEYS[1], string.format('%.0f', tat), 'PX', string.format('%.0f', math.floor((tat - now) / 1000) + tonumber(ARGV[3])))
+return tat
+"""
+# Для кэша в памяти процесса (LocMemCache) достаточно блокировки внутри процесса
+_reserve_lock = threading.Lock()
+_reserve_script = None
+
+
+def get_reserve_script():
+    """
+    Скрипт резервирования в Redis (REDIS_URL) или None, если общего Redis нет.
+    Клиент создается и скрипт регистрируется один раз на процесс (после fork воркера gunicorn)
+    """
+    global _reserve_script
+    if not settings.REDIS_URL:
+        return None
+    if _reserve_script is None:
+        with _reserve_lock:
+            if _reserve_script is None:
+                _reserve_script = redis.Redis.from_url(settings.REDIS_URL).register_script(RESERVE_SCRIPT)
+    return _reserve_script
+
+
+class TokenBucket:
+    """
+    Ограничитель скорости (байт/сек) по алгоритму token bucket в форме GCRA.
+    Состояние (теоретическое время прихода следующего байта, целые микросекунды) хранится в Redis (REDIS_URL),
+    поэтому лимит действует для всех процессов gunicorn, а без Redis - в кэше Django процесса.
+    Резервирование атомарно: скрипт Lua в Redis, блокировка процесса для LocMemCache.
+    В Redis значение читается и пишется только напрямую (целое число), без сериализации кэша Django
+    """
+    TTL_MS = 60 * 1000
+
+    def __init__(self, key, rate, burst=None):
+        self.key = f'bandwidth:{key}'
+        self.rate = rate
+        self.burst = burst or rate  # по умолчанию допускается всплеск в 1 секунду трафика
+
+    def delay(self):
+        """Через сколько секунд ведро сможет отдать следующие байты"""
+        now = time.time()
+        script = get_reserve_script()
+        tat = script.registered_client.get(self.key) if script else cache.get(self.key)
+        tat = int(tat) / 1e6 if tat is not None else now
+        return max(0.0, tat - now - self.burst / self.rate)
+
+    def reserve(self, amount):
+        """Резервирует amount байт и возвращает, сколько секунд нужно подождать перед отправкой"""
+        now = time.time()
+        now_us, cost_us = int(now * 1e6), int(amount * 1e6 / self.rate)
+        script = get_reserve_script()
+        if script:
+            tat_us = script(keys=[self.key], args=[now_us, cost_us, self.TTL_MS])
+        else:
+            with _reserve_lock:
+                tat_us = max(cache.get(self.key, now_us), now_us) + cost_us
+                cache.set(self.key, tat_us, timeout=(tat_us - now_us) // 1000000 + self.TTL_MS // 1000)
+        return max(0.0, tat_us / 1e6 - now - self.burst / self.rate)
+
+
+class BandwidthLimiter:
+    """Несколько ведер сразу (ссылка, пользователь, общий лимит): ждем самое медленное"""
+    def __init__(self, buckets):
+        self.buckets = [bucket for bucket in buckets if bucket.rate]
+
+    def delay(self):
+        return max((bucket.delay() for bucket in self.buckets), default=0.0)
+
+    def consume(self, amount):
+        wait = max((bucket.reserve(amount) for bucket in self.buckets), default=0.0)
+        if wait > 0:
+            time.sleep(wait)
+
+    @classmethod
+    def for_download(cls, request, file, channel):
+        """
+        Ограничитель для скачивания файла: общий, по пользователю (если вошел) и по ссылке -
+        для любого скачивания по ссылке (channel - DownloadStat.CHANNEL_*), в том числе вошедшим пользователем
+        """
+        buckets = [TokenBucket('global', settings.DOWNLOAD_RATE_GLOBAL)]
+        if request.user.is_authenticated:
+            buckets.append(TokenBucket(f'user:{request.user.pk}', settings.DOWNLOAD_RATE_PER_USER))
+        if channel == DownloadStat.CHANNEL_LINK:
+            buckets.append(TokenBucket(f'link:{file.pk}', file.token_rate_limit or settings.DOWNLOAD_RATE_PER_LINK))
+        return cls(buckets)
+
+
+class TokenDownloadRateThrottle(SimpleRateThrottle):
+    """Ограничение частоты скачиваний по публичной ссылке (по IP клиента)"""
+    scope = 'token_download'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class UploadRateThrottle(SimpleRateThrottle):
+    """Ограничение частоты загрузок файлов (по пользователю)"""
+    scope = 'upload'
+
+    def get_cache_key(self, request, view):
+        ident = request.user.pk if request.user.is_authenticated else self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class LoginRateThrottle(SimpleRateThrottle):
+    """Ограничение частоты попыток входа по паролю (по IP клиента): подбор пароля и нагрузка PBKDF2"""
+    scope = 'login'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
@@ -0,0 +1,268 @@
+"""
+Перенос пользователей и файлов между серверами (команды export_storage и import_storage).
+
+Выгрузка - каталог или tar-поток с записями в таком порядке:
+    manifest.json
+    users/000001.ndjson, users/000002.ndjson ...     пользователи, пакетами
+    folders/000001.ndjson ...                        папки (родительская папка всегда раньше вложенных)
+    files/000001.ndjson, files/000001/<id_file> ...  метаданные пакета файлов, затем содержимое этих файлов
+Содержимое выгружается расшифрованным и собранным из блоков: на новом сервере оно записывается заново,
+с его ключом шифрования и режимом хранения. Целиком в память ничего не читается: записи идут пакетами,
+содержимое - частями через ограниченные очереди (Pipe).
+"""
+import glob
+import io
+import os
+import queue
+import tarfile
+
+import orjson
+from django.utils.dateparse import parse_datetime
+
+FORMAT = 1
+READ_SIZE = 1024 * 1024
+# Сколько частей по READ_SIZE может ждать в очереди одного файла
+PIPE_DEPTH = 8
+
+USER_FIELDS = ('id_user', 'username', 'email', 'fullname', 'role', 'password', 'is_active', 'is_staff', 'is_superuser', 'last_login')
+FOLDER_FIELDS = ('id_folder', 'parent', 'name', 'path')
+FILE_FIELDS = (
+    'id_file', 'folder', 'original_name', 'comment', 'size', 'upload_date', 'last_download_date',
+    'checksum', 'content_type', 'charset', 'file_mtime',
+)
+DATE_FIELDS = ('last_login', 'upload_date', 'last_download_date', 'file_mtime')
+
+TABLES = ('users', 'folders', 'files')
+
+
+class PipeAborted(Exception):
+    pass
+
+
+class Pipe:
+    """
+    Ограниченная очередь частей содержимого между двумя потоками с интерфейсом файла (read).
+    Пишущий поток блокируется, пока читающий не заберет части: в памяти не больше PIPE_DEPTH частей
+    """
+    END = object()
+
+    def __init__(self, depth=PIPE_DEPTH):
+        self.queue = queue.Queue(maxsize=depth)
+        self.current = b''
+        self.offset = 0
+        self.done = False
+        self.aborted = False
+
+    def put(self, item):
+        while True:
+            if self.aborted:
+                raise PipeAborted
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def feed(self, parts):
+        """Передает части в очередь; ошибка чтения передается читающему потоку"""
+        try:
+            for data in parts:
+                self.put(data)
+        except PipeAborted:
+            raise
+        except Exception as e:
+            self.put(e)
+            raise
+        self.put(self.END)
+
+    def abort(self):
+        """Читающая сторона отказалась от содержимого: пишущий поток получит PipeAborted"""
+        self.aborted = True
+
+    def read(self, size=-1):
+        parts = []
+        wanted = size
+        while size < 0 or wanted > 0:
+            if self.offset >= len(self.current):
+                if self.done:
+                    break
+                item = self.queue.get()
+                if item is self.END:
+                    self.done = True
+                    break
+                if isinstance(item, Exception):
+                    self.done = True
+                    raise item
+                self.current, self.offset = item, 0
+                continue
+            end = len(self.current) if size < 0 else self.offset + wanted
+            data = self.current[self.offset:end]
+            self.offset += len(data)
+            parts.append(data)
+            wanted -= len(data)
+        return b''.join(parts)
+
+
+def batch_name(table, number):
+    return f'{table}/{number:06d}.ndjson'
+
+
+def body_name(batch, id_file):
+    """Имя содержимого файла внутри выгрузки: files/000001/<id_file>"""
+    return f'{batch[:-len(".ndjson")]}/{id_file}'
+
+
+def encode_rows(rows):
+    return b''.join(orjson.dumps(row, option=orjson.OPT_UTC_Z) + b'\n' for row in rows)
+
+
+def decode_rows(data):
+    rows = []
+    for line in data.splitlines():
+        if line.strip():
+            row = orjson.loads(line)
+            for field in DATE_FIELDS:
+                if row.get(field):
+                    row[field] = parse_datetime(row[field])
+            rows.append(row)
+    return rows
+
+
+def iter_read(fileobj, size=READ_SIZE):
+    while data := fileobj.read(size):
+        yield data
+
+
+class DirectoryWriter:
+    """Выгрузка в каталог: каждая запись пишется через временный файл, поэтому существующий файл всегда полный"""
+    parallel = True
+
+    def __init__(self, root):
+        self.root = root
+
+    def __enter__(self):
+        os.makedirs(self.root, exist_ok=True)
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def write_parts(self, name, parts):
+        """Пишет содержимое частями (можно вызывать из нескольких потоков); возвращает размер"""
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = 0
+        with open(f'{path}.part', 'wb') as f:
+            for data in parts:
+                f.write(data)
+                size += len(data)
+        os.replace(f'{path}.part', path)
+        return size
+
+    def write_bytes(self, name, data):
+        self.write_parts(name, [data])
+
+    def resume_point(self, table):
+        """(количество готовых пакетов, последняя строка последнего пакета) для продолжения выгрузки"""
+        names = sorted(glob.glob(os.path.join(self.root, table, '*.ndjson')))
+        if not names:
+            return 0, None
+        with open(names[-1], 'rb') as f:
+            rows = decode_rows(f.read())
+        return len(names), rows[-1] if rows else None
+
+
+class TarWriter:
+    """Выгрузка в tar-поток (файл или stdout); .gz в имени - со сжатием"""
+    parallel = False
+
+    def __init__(self, fileobj, compress=False, close_file=False):
+        self.fileobj = fileobj
+        self.close_file = close_file
+        self.tar = tarfile.open(fileobj=fileobj, mode='w|gz' if compress else 'w|')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.tar.close()
+        if self.close_file:
+            self.fileobj.close()
+        return False
+
+    def write_file(self, name, size, fileobj):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mode = 0o600
+        self.tar.addfile(info, fileobj)
+        # tarfile запоминает заголовки всех записей: при сотнях тысяч файлов это заметная память
+        self.tar.members.clear()
+
+    def write_bytes(self, name, data):
+        self.write_file(name, len(data), io.BytesIO(data))
+
+
+class DirectorySource:
+    """Чтение выгрузки из каталога: содержимое файлов можно открывать в нескольких потоках"""
+    parallel = True
+
+    def __init__(self, root):
+        self.root = root
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        """(имя, содержимое) для manifest.json и пакетов *.ndjson в порядке выгрузки"""
+        names = ['manifest.json']
+        for table in TABLES:
+            names += sorted(f'{table}/{os.path.basename(path)}' for path in glob.glob(os.path.join(self.root, table, '*.ndjson')))
+        for name in names:
+            with open(os.path.join(self.root, *name.split('/')), 'rb') as f:
+                yield name, f.read()
+
+    def bodies(self, batch, records):
+        """(запись, функция открытия содержимого) для файлов пакета"""
+        for record in records:
+            path = os.path.join(self.root, *body_name(batch, record['id_file']).split('/'))
+            yield record, lambda path=path: open(path, 'rb')
+
+
+class TarSource:
+    """Чтение выгрузки из tar-потока: записи читаются строго по порядку, один раз"""
+    parallel = False
+
+    def __init__(self, fileobj, close_file=False):
+        self.fileobj = fileobj
+        self.close_file = close_file
+        self.tar = tarfile.open(fileobj=fileobj, mode='r|*')
+        self.members = iter(self.tar)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.tar.close()
+        if self.close_file:
+            self.fileobj.close()
+        return False
+
+    def __iter__(self):
+        for member in self.members:
+            # tarfile запоминает заголовки всех прочитанных записей: в потоке они не нужны
+            self.tar.members.clear()
+            if member.isfile():
+                yield member.name, self.tar.extractfile(member).read()
+
+    def bodies(self, batch, records):
+        for record in records:
+            member = next(self.members)
+            if member.name != body_name(batch, record['id_file']):
+                raise ValueError(f'Ожидалось содержимое {body_name(batch, record["id_file"])}, в потоке {member.name}')
+            yield record, lambda member=member: self.tar.extractfile(member)
@@ -0,0 +1,312 @@
+"""
+Запись загружаемых файлов: подбор свободных имен, запись на диск (с шифрованием и контрольной суммой)
+и пакетная загрузка многих файлов за один запрос.
+"""
+import hashlib
+import logging
+import os
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import Q, Sum
+
+from . import events
+from .encryption import encrypt_stream, get_master_key
+from .models import Chunk, Folder, Storage, StorageChunk, StorageEvent
+from .sniffing import SNIFF_SIZE, sniff
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+
+
+def resolve_names(id_user, names):
+    """
+    Свободные имена для новых файлов пользователя по правилу name, name(1), name(2)...
+    Для всего пакета - не больше двух запросов (вместо запроса на каждую попытку)
+    """
+    taken = set(Storage.objects.filter(id_user=id_user, original_name__in=set(names)).values_list('original_name', flat=True))
+    seen, stems = set(), set()
+    for name in names:
+        if name in taken or name in seen:
+            stems.add(os.path.splitext(name)[0])
+        seen.add(name)
+    if stems:
+        variants = Q()
+        for stem in stems:
+            variants |= Q(original_name__startswith=f'{stem}(')
+        taken.update(Storage.objects.filter(variants, id_user=id_user).values_list('original_name', flat=True))
+
+    result = []
+    for name in names:
+        name_without_ext, ext = os.path.splitext(name)
+        final_name, counter = name, 1
+        while final_name in taken:
+            final_name = f"{name_without_ext}({counter}){ext}"
+            counter += 1
+        taken.add(final_name)
+        result.append(final_name)
+    return result
+
+
+class UploadTooLarge(ValueError):
+    """Файл или пакет больше допустимого: лимит распаковки архива или квота пользователя"""
+
+
+def quota_exceeded(id_user, size):
+    """Превысит ли пользователь STORAGE_QUOTA_BYTES, добавив size байт (0 в настройке - без ограничения)"""
+    if not settings.STORAGE_QUOTA_BYTES:
+        return False
+    used = Storage.objects.filter(id_user=id_user).aggregate(used=Sum('size'))['used'] or 0
+    return used + size > settings.STORAGE_QUOTA_BYTES
+
+
+class LimitedReader:
+    """Обертка над файлом из архива: чтение больше limit байт - UploadTooLarge (заявленный размер не совпал с содержимым)"""
+
+    def __init__(self, fileobj, limit):
+        self.fileobj = fileobj
+        self.limit = limit
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.size += len(data)
+        if self.size > self.limit:
+            raise UploadTooLarge(f'Содержимое файла больше заявленного размера {self.limit} байт')
+        return data
+
+    def seekable(self):
+        return self.fileobj.seekable()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        position = self.fileobj.seek(offset, whence)
+        self.size = position
+        return position
+
+    def close(self):
+        self.fileobj.close()
+
+
+def iter_fileobj(fileobj):
+    """Содержимое файла (UploadedFile или файла из архива) частями"""
+    if hasattr(fileobj, 'chunks'):
+        yield from fileobj.chunks()
+        return
+    while data := fileobj.read(READ_SIZE):
+        yield data
+
+
+def set_content_metadata(storage_file, head, name, path=None):
+    """Заполняет content_type и charset по первым байтам файла, file_mtime - по файлу на диске"""
+    storage_file.content_type, storage_file.charset = sniff(head, name)
+    if path:
+        storage_file.file_mtime = datetime.fromtimestamp(os.stat(path).st_mtime, tz=timezone.utc)
+
+
+def read_head(fileobj):
+    """Первые байты файла для определения типа; файл перематывается в начало (если это возможно)"""
+    if not hasattr(fileobj, 'seek') or (hasattr(fileobj, 'seekable') and not fileobj.seekable()):
+        return None
+    fileobj.seek(0)
+    head = fileobj.read(SNIFF_SIZE)
+    fileobj.seek(0)
+    return head
+
+
+def write_file(storage_file, fileobj, name, master_key=None):
+    """
+    Записывает содержимое в uploads/ (с шифрованием, если передан master_key) и заполняет
+    file, encrypted, checksum, size и метаданные содержимого у storage_file. Запись в БД не выполняется
+    """
+    checksum = hashlib.sha256()
+    size = 0
+    head = bytearray()
+
+    def hashing():
+        nonlocal size
+        for data in iter_fileobj(fileobj):
+            checksum.update(data)
+            size += len(data)
+            if len(head) < SNIFF_SIZE:
+                head.extend(data[:SNIFF_SIZE - len(head)])
+            yield data
+
+    generated = storage_file.file.field.generate_filename(storage_file, name)
+    while True:
+        # Имя может занять параллельная загрузка: тогда берем следующее свободное
+        file_name = default_storage.get_available_name(generated)
+        path = default_storage.path(file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            dst = open(path, 'xb')
+            break
+        except FileExistsError:
+            continue
+    try:
+        with dst:
+            if master_key:
+                encrypt_stream(hashing(), dst, master_key)
+            else:
+                for data in hashing():
+                    dst.write(data)
+    except Exception:
+        os.remove(path)
+        raise
+    storage_file.file.name = file_name
+    storage_file.encrypted = bool(master_key)
+    storage_file.checksum = checksum.hexdigest()
+    storage_file.size = size
+    set_content_metadata(storage_file, bytes(head), name, path)
+
+
+class HashingReader:
+    """Обертка над файловым объектом: считает sha256 и размер прочитанного содержимого"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.checksum = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.checksum.update(data)
+        self.size += len(data)
+        return data
+
+
+def store_content(storage_file, fileobj, name, master_key=None, chunk_mode=False):
+    """
+    Записывает содержимое файла в хранилище блоков (chunk_mode) или в uploads/ (write_file)
+    и заполняет size, checksum и метаданные у storage_file. Возвращает хэши блоков (для chunk_mode) или None.
+    Запись строки storage в БД не выполняется
+    """
+    if not chunk_mode:
+        write_file(storage_file, fileobj, name, master_key)
+        return None
+    head = read_head(fileobj)
+    if head is not None:
+        set_content_metadata(storage_file, head, name)
+    reader = HashingReader(fileobj)
+    hashes = Chunk.store_stream(reader)
+    storage_file.chunked = True
+    storage_file.size = reader.size
+    storage_file.checksum = reader.checksum.hexdigest()
+    return hashes
+
+
+def archive_members(archive):
+    """
+    Файлы из zip/tar-архива: список (имя, функция открытия), признак, можно ли читать файлы параллельно,
+    и общий размер после распаковки. Каталоги и ссылки пропускаются, пути внутри архива отбрасываются
+    (остается только имя файла). Размеры из заголовков архива проверяются до распаковки
+    (STORAGE_ARCHIVE_MAX_FILE_BYTES, STORAGE_ARCHIVE_MAX_BYTES - UploadTooLarge), при чтении файл
+    не может оказаться больше заявленного размера
+    """
+    if zipfile.is_zipfile(archive):
+        archive.seek(0)
+        zf = zipfile.ZipFile(archive)
+        infos = [info for info in zf.infolist() if not info.is_dir() and os.path.basename(info.filename)]
+        members = [
+            (os.path.basename(info.filename), info.file_size, lambda info=info: LimitedReader(zf.open(info), info.file_size))
+            for info in infos
+        ]
+        parallel = True
+    else:
+        archive.seek(0)
+        tf = tarfile.open(fileobj=archive, mode='r:*')
+        members = [
+            (os.path.basename(member.name), member.size, lambda member=member: LimitedReader(tf.extractfile(member), member.size))
+            for member in tf.getmembers() if member.isfile() and os.path.basename(member.name)
+        ]
+        # tar читается последовательно из одного потока
+        parallel = False
+
+    total = 0
+    for name, size, _ in members:
+        if size > settings.STORAGE_ARCHIVE_MAX_FILE_BYTES:
+            raise UploadTooLarge(f'Файл {name} в архиве больше {settings.STORAGE_ARCHIVE_MAX_FILE_BYTES} байт')
+        total += size
+    if total > settings.STORAGE_ARCHIVE_MAX_BYTES:
+        raise UploadTooLarge(f'Размер архива после распаковки больше {settings.STORAGE_ARCHIVE_MAX_BYTES} байт')
+    return [(name, open_file) for name, _, open_file in members], parallel, total
+
+
+def batch_upload(user, folder, items, comment='', parallel=True):
+    """
+    Загружает пакет файлов: items - список (имя, функция открытия файла).
+    Содержимое пишется параллельно (не больше STORAGE_BATCH_WORKERS потоков), строки storage
+    добавляются одним bulk_create, счетчики папки обновляются один раз.
+    Возвращает результаты по каждому файлу в порядке items
+    """
+    final_names = resolve_names(user.id_user, [name for name, _ in items])
+    master_key = get_master_key()
+    chunk_mode = settings.STORAGE_CHUNK_MODE
+
+    def store(index):
+        name, open_file = items[index]
+        storage_file = Storage(id_user=user, folder=folder, original_name=final_names[index], comment=comment, size=0)
+        try:
+            fileobj = open_file()
+            try:
+                return storage_file, store_content(storage_file, fileobj, name, master_key, chunk_mode), None
+            finally:
+                fileobj.close()
+        except Exception as e:
+            logger.exception('Ошибка записи файла %s при пакетной загрузке', name)
+            return None, None, str(e)
+
+    def store_in_thread(index):
+        try:
+            return store(index)
+        finally:
+            # В режиме блоков поток работает с БД: закрываем его соединения
+            connections.close_all()
+
+    workers = settings.STORAGE_BATCH_WORKERS if parallel else 1
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            stored = list(executor.map(store_in_thread, range(len(items))))
+    else:
+        stored = [store(index) for index in range(len(items))]
+
+    created = [storage_file for storage_file, _, error in stored if not error]
+    try:
+        with transaction.atomic():
+            Storage.objects.bulk_create(created)
+            StorageChunk.objects.bulk_create([
+                StorageChunk(storage=storage_file, position=position, chunk_id=hash_hex)
+                for storage_file, hashes, error in stored if hashes
+                for position, hash_hex in enumerate(hashes)
+            ])
+            if folder and created:
+                Folder.adjust_totals(folder.path, len(created), sum(storage_file.size for storage_file in created))
+            events.emit_many([
+                StorageEvent(id_user=user, kind=events.UPLOAD, id_file=storage_file.id_file, payload=events.file_payload(storage_file))
+                for storage_file in created
+            ])
+    except Exception:
+        # Строки не добавлены: убираем записанные файлы и блоки без ссылок
+        for storage_file in created:
+            if storage_file.file and os.path.isfile(storage_file.file.path):
+                os.remove(storage_file.file.path)
+        Chunk.release([h for _, hashes, _ in stored if hashes for h in hashes])
+        raise
+
+    results = []
+    for (name, _), (storage_file, _, error) in zip(items, stored):
+        if error:
+            results.append({'name': name, 'detail': error})
+        else:
+            results.append({
+                'name': name,
+                'id_file': storage_file.id_file,
+                'original_name': storage_file.original_name,
+                'size': storage_file.size,
+            })
+    return results
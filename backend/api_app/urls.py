@@ -1,14 +1,35 @@
 from django.urls import path
-from .views import UserView, StorageView
+from .views import AuthTokenView, UserView, StorageView, BatchUploadView, FileTransferView, StorageSearchView, FolderView, TrashView, ChunkView, DownloadStatsView, ProfileReportView, EventFeedView, HealthView
 
 urlpatterns = [
+    path("auth/login/", AuthTokenView.as_view(), {"action": "login"}, name="auth_login"),  # Для POST: вход по паролю, выдача access- и refresh-токенов
+    path("auth/refresh/", AuthTokenView.as_view(), {"action": "refresh"}, name="auth_refresh"),  # Для POST: новая пара токенов по refresh-токену (без пароля)
+    path("auth/logout/", AuthTokenView.as_view(), {"action": "logout"}, name="auth_logout"),  # Для POST: завершение сессии (по access- или refresh-токену)
     path("users/", UserView.as_view(), name="users_list-add_user"),  # Для GET: список пользователей и POST: создание нового пользователя, вход (выход) в(из) личный кабинет
     path("users/user_info/", UserView.as_view(), name="get_user_info"),  # Для GET: получение информации о пользователе
+    path("users/me/", UserView.as_view(), name="get_me"),  # Для GET: данные для старта сессии (пользователь, квота, первая страница файлов)
     path("users/<int:id_user>/", UserView.as_view(), name="user_delete-change_role"),  # Для DELETE: удаление пользователя и PATCH: изменение роли
+    path("storage/batch/<int:id_user>/", BatchUploadView.as_view(), name='files_batch_upload'),  # Для POST: загрузка многих файлов (files или архив archive) одним запросом
+    path("storage/copy/<int:id_user>/", FileTransferView.as_view(), {"action": "copy"}, name='files_copy'),  # Для POST: копирование файлов (в том числе другому пользователю) без передачи содержимого
+    path("storage/move/<int:id_user>/", FileTransferView.as_view(), {"action": "move"}, name='files_move'),  # Для POST: перемещение файлов в папку или другому пользователю
+    path("storage/search/<int:id_user>/", StorageSearchView.as_view(), name='files_search'),  # Для GET: поиск файлов по имени и комментарию с фильтрами и пагинацией
+    path("storage/chunks/<int:id_user>/missing/", ChunkView.as_view(), {"action": "missing"}, name='chunks_missing'),  # Для POST: какие блоки нужно загрузить
+    path("storage/chunks/<int:id_user>/commit/", ChunkView.as_view(), {"action": "commit"}, name='chunks_commit'),  # Для POST: сборка файла из блоков
+    path("storage/chunks/<int:id_user>/<str:chunk_hash_hex>/", ChunkView.as_view(), name='chunk_upload'),  # Для PUT: загрузка блока
     path("storage/<int:id_user>/", StorageView.as_view(), name='files_list-add_file'),  # Для GET: список файлов пользователя и POST: загрузка файла
     path("storage/view/<int:id_user>/<int:id_file>/", StorageView.as_view(), name='file_view'),  # Для GET: просмотр файла
     path("storage/download/<int:id_file>/", StorageView.as_view(), name='file_download'),  # Для GET: скачивание файла
     path("storage/download/<str:token>/", StorageView.as_view(), name='file_download_by_token'),  # Для GET: скачивание файла по уникальному токену
     path("storage/link/<int:id_user>/<int:id_file>/", StorageView.as_view(), name='generate_file_link'),  # Для POST: генерация ссылки
     path("storage/<int:id_user>/<int:id_file>/", StorageView.as_view(), name='delete_file'),  # Для DELETE: удаления файла по его id и PATCH: переименование файла
+    path("trash/<int:id_user>/", TrashView.as_view(), name='trash_list'),  # Для GET: файлы в корзине (последние удаленные первыми)
+    path("trash/<int:id_user>/restore/", TrashView.as_view(), name='trash_restore'),  # Для POST: восстановление файлов из корзины
+    path("folders/<int:id_user>/", FolderView.as_view(), name='folder_root-add_folder'),  # Для GET: содержимое корня и POST: создание папки
+    path("folders/<int:id_user>/<int:id_folder>/", FolderView.as_view(), name='folder_detail'),  # Для GET: содержимое папки, PATCH: переименование/перемещение, DELETE: удаление
+    path("events/<int:id_user>/", EventFeedView.as_view(), name='events'),  # Для GET: лента изменений хранилища (JSON или SSE с Accept: text/event-stream)
+    path("health/live/", HealthView.as_view(), {"check": "live"}, name='health_live'),  # Для GET: процесс отвечает (liveness)
+    path("health/ready/", HealthView.as_view(), {"check": "ready"}, name='health_ready'),  # Для GET: доступны БД, кэш и каталог файлов (readiness)
+    path("admin/stats/downloads/", DownloadStatsView.as_view(), name='download_stats'),  # Для GET: статистика скачиваний (только администратор)
+    path("admin/profiles/", ProfileReportView.as_view(), name='profile_reports'),  # Для GET: список отчетов профилирования и DELETE: удаление всех (только администратор)
+    path("admin/profiles/<int:id_report>/", ProfileReportView.as_view(), name='profile_report'),  # Для GET: отчет с профилем и SQL и DELETE: удаление (только администратор)
 ]
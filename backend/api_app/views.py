@@ -1,12 +1,28 @@
+import asyncio
+import hashlib
+import math
 import mimetypes
 import os
+import tarfile
+import time
 import urllib.parse
+import zipfile
 import logging
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.contrib.auth import authenticate
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections, transaction
+from django.db.models import Count, Sum
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.crypto import get_random_string
 from django.utils import timezone
+from django.utils.http import http_date, parse_etags, quote_etag
+
+import orjson
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -14,15 +30,26 @@ from rest_framework import status
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import AllowAny, IsAuthenticated
 
-from .serializers import UserSerializer, StorageSerializer
-from .models import User, Storage
-from .permissions import IsAuthenticatedOrViewFile
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+from .serializers import (
+    UserSerializer, StorageSerializer, FolderSerializer,
+    UserListSerializer, StorageListSerializer, FolderListSerializer, TrashListSerializer,
 )
+from .authentication import end_session, refresh_session, start_session
+from .copying import copy_files, move_files
+from .chunking import MAX_CHUNK_SIZE, chunk_hash, read_chunks, write_chunk
+from . import events
+from .encryption import get_master_key, iter_decrypted
+from .models import User, Storage, Folder, Chunk, ChunkUpload, StorageChunk, DownloadStat, ProfileReport, StorageEvent, AuthSession
+from .pagination import StoragePagination
+from .renderers import EventStreamRenderer, ORJSONRenderer
+from .permissions import IsAdminRole, IsAuthenticatedOrViewFile
+from .search import filter_storage
+from .stats import counting_iterator, flush as flush_stats, record_download, summarize_downloads
+from .throttling import BandwidthLimiter, LoginRateThrottle, TokenDownloadRateThrottle, UploadRateThrottle
+from .sniffing import SNIFF_SIZE
+from .uploads import UploadTooLarge, archive_members, batch_upload, quota_exceeded, resolve_names, set_content_metadata, store_content
+
+# Логирование настраивается в settings.LOGGING (уровень - LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 class UserView(APIView):
@@ -33,9 +60,11 @@ class UserView(APIView):
         logger.info('GET запрос: %s', request.path)
         if request.path == '/api/users/user_info/':
             return self.get_user_info(request)
+        if request.path == '/api/users/me/':
+            return self.get_me(request)
         
-        queryset = User.objects.all()
-        serializer = UserSerializer(queryset, many=True)
+        queryset = User.objects.order_by('id_user')
+        serializer = UserListSerializer(queryset)
         logger.debug('Список пользователей: %s', queryset)
         return Response(serializer.data, status=status.HTTP_200_OK)
         
@@ -44,8 +73,34 @@ class UserView(APIView):
         self.permission_classes = [IsAuthenticated]
         self.check_permissions(request)
 
-        user = request.user
-        user_data = {
+        user_data = self.get_profile(request.user)
+        logger.debug('Данные о пользователе: %s', user_data)
+        return Response(user_data)
+
+    # Дополнительный метод к get_me и login_user: данные для старта сессии клиента
+    def get_session_payload(self, user, files=None):
+        """
+        Текущий пользователь, его роль, занятое место и первая страница файлов в одном ответе.
+        Количество запросов к БД не зависит от числа пользователей.
+        """
+        usage = Storage.objects.filter(id_user=user).aggregate(files=Count('id_file'), used=Sum('size'))
+        quota = settings.STORAGE_QUOTA_BYTES or None
+        return {
+            **self.get_profile(user),
+            'quota': {
+                'files': usage['files'],
+                'used': usage['used'] or 0,
+                'limit': quota,
+            },
+            'files': {
+                'count': usage['files'],
+                'page_size': StoragePagination.page_size,
+                'results': self.get_first_page(user) if files is None else files,
+            },
+        }
+
+    def get_profile(self, user):
+        return {
             'id_user': user.id_user,
             'email': user.email,
             'username': user.username,
@@ -55,8 +110,33 @@ class UserView(APIView):
             'is_staff': user.is_staff,
             'is_superuser': user.is_superuser,
         }
-        logger.debug('Данные о пользователе: %s', user_data)
-        return Response(user_data)
+
+    def get_first_page(self, user):
+        files = Storage.objects.filter(id_user=user).order_by('-upload_date', '-id_file')[:StoragePagination.page_size]
+        return StorageListSerializer(files).data
+
+    # Метод для обработки GET-запроса: данные для старта сессии (с ETag, повторный запрос может вернуть 304)
+    def get_me(self, request):
+        logger.info('GET запрос: Данные сессии текущего пользователя')
+        self.permission_classes = [IsAuthenticated]
+        self.check_permissions(request)
+
+        user = request.user
+        # ETag считается до подсчета занятого места (агрегат по всем файлам пользователя): количество и объем
+        # файлов меняются только вместе с событием ленты, поэтому достаточно курсора событий и первой страницы
+        # (индексный запрос на page_size строк, в нем же last_download_date)
+        files = self.get_first_page(user)
+        cursor = StorageEvent.objects.filter(id_user=user).order_by('-id').values_list('id', flat=True).first()
+        version = [cursor, self.get_profile(user), settings.STORAGE_QUOTA_BYTES, files]
+        etag = quote_etag(hashlib.md5(orjson.dumps(version, option=orjson.OPT_UTC_Z)).hexdigest())
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = Response(self.get_session_payload(user, files), status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Authorization',))
+        return response
 
     # Метод для обработки POST-запроса: создание нового пользователя, вход и выход в(из) личного кабинета
     def post(self, request):
@@ -76,7 +156,12 @@ class UserView(APIView):
         self.permission_classes = [IsAuthenticated]
         self.check_permissions(request)
 
-        request.user.auth_token.delete()
+        if not isinstance(request.auth, AuthSession):
+            return Response({"detail": "Сессия не найдена."}, status=status.HTTP_401_UNAUTHORIZED)
+        # Завершается только эта сессия: остальные устройства пользователя остаются в системе
+        payload = {'session': end_session(session=request.auth).id_session}
+        # Другие вкладки этой сессии узнают о выходе из ленты событий
+        events.emit(request.user.id_user, events.LOGOUT, payload=payload)
         logger.info('Пользователь вышел: %s', request.user.username)
         return Response(status=204)
 
@@ -104,11 +189,7 @@ class UserView(APIView):
             return Response({"detail": "Пользователь не найден."}, status=status.HTTP_404_NOT_FOUND)
         else:
             logger.info('Пользователь успешно вошел в систему: %s', user.username)
-            return Response({
-                'id_user': user.id_user,
-                'role': user.role,
-                'is_superuser': user.is_superuser,
-            }, status=status.HTTP_200_OK)
+            return Response(self.get_session_payload(user), status=status.HTTP_200_OK)
 
     # Метод для обработки DELETE-запроса: удаление пользователя по ID
     def delete(self, request, **kwargs):
@@ -118,11 +199,10 @@ class UserView(APIView):
         id_user = kwargs.get("id_user")
         try:
             user = User.objects.get(id_user=id_user)
-            # Получаем все связанные записи Storage и удаляем их
-            storages = user.storages.all()
-            for storage in storages:
-                storage.delete()  # вызывется метод delete из Storage, и файл будет удалён из файловой системы
-            user.delete()
+            # Строки файлов (и корзины) удаляются каскадом, содержимое на диске удалит purge_trash по очереди
+            with transaction.atomic():
+                Storage.all_objects.filter(id_user=user).queue_purge()
+                user.delete()
             logger.info('Пользователь и его файлы удалены:: %s', id_user)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except User.DoesNotExist:
@@ -156,16 +236,7 @@ class UserView(APIView):
         return Response({"detail": "Неправильное поле для обновления."}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class StorageView(APIView):
-    permission_classes = [IsAuthenticatedOrViewFile]
-    
-    # Метод для Обновления поля last_download_date
-    def update_last_download_date(self, file: Storage):
-        logger.info(f'Обновление даты последнего скачивания для файла: {file.original_name}')
-        file.last_download_date = timezone.now()
-        file.save(update_fields=['last_download_date'])
-
-    # Метод для очистки истекших токенов для специальных ссылок
+class StorageAccessMixin:
     # Метод для проверки прав доступа пользователя
     def check_user_access(self, request, target_user_id):
         """Проверяет может ли пользователь получить доступ к файлам target_user_id"""
@@ -175,6 +246,39 @@ class StorageView(APIView):
         # Обычные пользователи могут видеть только свои файлы
         return str(request.user.id_user) == str(target_user_id)
 
+    # Метод для получения папки пользователя по id (None или пустое значение - корень)
+    def get_user_folder(self, id_user, id_folder):
+        """Возвращает папку пользователя или None для корня. Если папки нет - Folder.DoesNotExist"""
+        if id_folder in (None, '', 'root'):
+            return None
+        # Нечисловой id (folder=abc) - такой папки нет, а не ошибка ORM (ValueError -> 500)
+        if not str(id_folder).isdigit():
+            raise Folder.DoesNotExist
+        return Folder.objects.get(id_user=id_user, id_folder=id_folder)
+
+
+class StorageView(StorageAccessMixin, APIView):
+    permission_classes = [IsAuthenticatedOrViewFile]
+
+    # Ограничение частоты запросов: скачивание по публичной ссылке и загрузка файлов
+    def get_throttles(self):
+        if self.request.method == 'GET' and self.kwargs.get('token'):
+            return [TokenDownloadRateThrottle()]
+        if self.request.method == 'POST' and not self.kwargs.get('id_file'):
+            return [UploadRateThrottle()]
+        return []
+    
+    # Метод для Обновления поля last_download_date
+    def update_last_download_date(self, file: Storage, channel):
+        """
+        Дата последнего скачивания и счетчик скачиваний копятся в памяти (stats.py)
+        и сохраняются в БД пакетом, без отдельной записи на каждое скачивание
+        """
+        logger.info(f'Обновление даты последнего скачивания для файла: {file.original_name}')
+        file.last_download_date = timezone.now()
+        record_download(file, channel)
+
+    # Метод для очистки истекших токенов для специальных ссылок
     def clean_expired_tokens(self):
         objects = Storage.objects.filter(token_expiration__lt=timezone.now())
         # Обновляем истекшие токены, очищая поля token и token_expiration
@@ -203,36 +307,39 @@ class StorageView(APIView):
             self.clean_expired_tokens()  # удаляем истекшие ссылки
             # получение списка всех файлов
             queryset = Storage.objects.filter(id_user=id_user)
-            serializer = StorageSerializer(queryset, many=True)
+            # ?folder=<id_folder> или ?folder=root - только файлы одной папки
+            if 'folder' in request.query_params:
+                folder_id = request.query_params['folder']
+                if folder_id in ('', 'root'):
+                    queryset = queryset.filter(folder__isnull=True)
+                elif not folder_id.isdigit():
+                    return Response({"detail": "Неправильный id папки"}, status=status.HTTP_400_BAD_REQUEST)
+                else:
+                    queryset = queryset.filter(folder_id=folder_id)
+            serializer = StorageListSerializer(queryset)
             return Response(serializer.data, status=status.HTTP_200_OK)
     
     # Дополнительный метод к view_file, download_file, download_file_by_token
-    def get_file_params(self, id_file=None, token=None, options=None):
+    def get_file_params(self, id_file=None, token=None):
         """
-        Метод для получения файла, путь к нему, MIME-тип, имя файла
+        Метод для получения файла, путь к нему, MIME-тип, имя файла.
+        Нужен один запрос к БД: тип содержимого сохранен при загрузке, наличие файла на диске
+        проверяется при открытии (open_file)
         """
         logger.debug('Получение параметров файла: id_file=%s, token=%s', id_file, token)
         if token:
-            # Ищем файл по расшифрованному токену
-            all_files = Storage.objects.exclude(token__isnull=True)
-            file = None
-            for storage_item in all_files:
-                if storage_item.get_token() == token:
-                    file = storage_item
-                    break
+            # Токен шифруется детерминированно, поэтому файл ищется по индексу, без перебора всех ссылок
+            file = Storage.objects.filter(token__in=[Storage().encrypt_token(token), token]).first()
             if not file:
                 raise Storage.DoesNotExist
         elif id_file: 
             file = Storage.objects.get(id_file=id_file)
 
-        file_path = file.file.path
+        # У файлов в хранилище блоков нет пути на диске, содержимое читается через content_iterator
+        file_path = None if file.chunked else file.file.path
 
-        if options == "os.path" and not os.path.exists(file_path):
-            logger.error('Файл не найден: %s', file_path)
-            raise Http404("Файл не найден")
-
-        # Получаем MIME-тип файла
-        content_type, _ = mimetypes.guess_type(file_path)
+        # MIME-тип определен по содержимому при загрузке; для старых записей (до backfill_metadata) - по имени
+        content_type = file.content_type or mimetypes.guess_type(file_path or file.original_name)[0]
         
         # Если MIME-тип не удалось определить, устанавливаем значение по умолчанию
         if content_type is None:
@@ -240,37 +347,196 @@ class StorageView(APIView):
         encoded_file_name = urllib.parse.quote(file.original_name)
 
         return file_path, content_type, encoded_file_name, file
+
+    # Дополнительный метод к view_file, make_download_response: открывает файл на диске (404, если его нет)
+    def open_file(self, file_path):
+        try:
+            return open(file_path, 'rb')
+        except FileNotFoundError:
+            logger.error('Файл не найден: %s', file_path)
+            raise Http404("Файл не найден")
+
+    # Дополнительный метод к view_file, make_download_response: ETag и Last-Modified из сохраненных метаданных
+    def get_validators(self, file):
+        etag = quote_etag(file.checksum) if file.checksum else None
+        return etag, file.file_mtime or file.upload_date
+
+    # Дополнительный метод к view_file, make_download_response: заголовки для кэширования и 304
+    def apply_validators(self, response, etag, last_modified):
+        if etag:
+            response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+    def is_not_modified(self, request, etag):
+        return bool(etag) and etag in parse_etags(request.headers.get('If-None-Match', ''))
     
     # Дополнительный метод к download_file, download_file_by_token
-    def file_iterator(self, file_name, chunk_size=512):
+    def file_iterator(self, file_name, chunk_size=64 * 1024, limiter=None, start=0, end=None):
         """
         Функция file_iterator позволяtn считывать файлы по частям, 
-        управляя использованием памяти и делая программу более производительной
+        управляя использованием памяти и делая программу более производительной.
+        Если передан limiter (BandwidthLimiter), скорость отдачи ограничивается перед каждой частью.
+        start, end - диапазон байт [start, end) для запросов с Range.
+        file_name - путь или уже открытый файл
         """
         logger.debug('Итерация по файлу: %s', file_name)
-        with open(file_name, 'rb') as f:
-            while True:
-                chunk = f.read(chunk_size)
+        with (file_name if hasattr(file_name, 'read') else open(file_name, 'rb')) as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
                 if not chunk:
                     break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                if limiter:
+                    limiter.consume(len(chunk))
                 yield chunk
 
+    # Дополнительный метод к content_iterator: блоки файла из хранилища блоков в диапазоне [start, end)
+    def chunk_range_iterator(self, file, start=0, end=None):
+        position = 0
+        hashes = []
+        for hash_hex, size in file.chunks.order_by('position').values_list('chunk_id', 'chunk__size').iterator():
+            if end is not None and position >= end:
+                break
+            if position + size > start:
+                hashes.append((hash_hex, position))
+            position += size
+        for hash_hex, chunk_start in hashes:
+            for data in read_chunks([hash_hex]):
+                data_start = chunk_start
+                chunk_start += len(data)
+                if chunk_start <= start:
+                    continue
+                yield data[max(start - data_start, 0):None if end is None else end - data_start]
+                if end is not None and chunk_start >= end:
+                    return
+
+    # Дополнительный метод к view_file, download_file, download_file_by_token
+    def content_iterator(self, file, file_path, limiter=None, start=0, end=None):
+        """
+        Содержимое файла по частям в диапазоне [start, end): с диска, из хранилища блоков
+        или с расшифровкой (расшифровываются только сегменты, попадающие в диапазон)
+        """
+        if not file.chunked and not file.encrypted:
+            return self.file_iterator(file_path, limiter=limiter, start=start, end=end)
+
+        if file.chunked:
+            parts = self.chunk_range_iterator(file, start, end)
+        else:
+            parts = iter_decrypted(file_path, get_master_key(), start, end)
+
+        def limited():
+            for data in parts:
+                if limiter:
+                    limiter.consume(len(data))
+                yield data
+        return limited()
+
+    # Дополнительный метод к download_file, download_file_by_token: разбор заголовка Range
+    def get_byte_range(self, request, size, etag=None):
+        """
+        Возвращает диапазон (start, end) из заголовка "Range: bytes=a-b" (один диапазон) или None.
+        Если If-Range не совпадает с ETag, файл изменился и отдается целиком.
+        Если диапазон не удовлетворим - ValueError
+        """
+        header = request.headers.get('Range', '')
+        if not header.startswith('bytes=') or ',' in header:
+            return None
+        if_range = request.headers.get('If-Range')
+        if if_range and if_range != etag:
+            return None
+        first, _, last = header[len('bytes='):].strip().partition('-')
+        if not first:
+            # bytes=-N: последние N байт
+            start, end = max(size - int(last), 0), size
+        else:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+        if start >= end:
+            raise ValueError(header)
+        return start, end
+
+    # Дополнительный метод к download_file, download_file_by_token: потоковый ответ с поддержкой Range
+    def make_download_response(self, request, file, file_path, content_type, limiter, channel):
+        etag, last_modified = self.get_validators(file)
+        if self.is_not_modified(request, etag):
+            return self.apply_validators(HttpResponseNotModified(), etag, last_modified)
+        # Диапазон разбираем до открытия файла: ответ 416 не держит открытый дескриптор
+        try:
+            byte_range = self.get_byte_range(request, file.size, etag)
+        except ValueError:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{file.size}'
+            return response
+        if not file.chunked and not file.encrypted:
+            # Открываем файл сразу: если его нет на диске, клиент получит 404, а не оборванный поток
+            file_path = self.open_file(file_path)
+
+        # Скачиванием считается ответ 200 и диапазон с начала файла; 304, 416, докачка и следующие
+        # сегменты параллельного скачивания - нет (отданные байты все равно учитывает counting_iterator)
+        if not byte_range or byte_range[0] == 0:
+            self.update_last_download_date(file, channel)
+
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                counting_iterator(self.content_iterator(file, file_path, limiter=limiter, start=start, end=end), file, channel),
+                content_type=content_type, status=status.HTTP_206_PARTIAL_CONTENT,
+            )
+            response['Content-Range'] = f'bytes {start}-{end - 1}/{file.size}'
+            response['Content-Length'] = str(end - start)
+        else:
+            response = StreamingHttpResponse(
+                counting_iterator(self.content_iterator(file, file_path, limiter=limiter), file, channel),
+                content_type=content_type,
+            )
+            response['Content-Length'] = str(file.size)
+        response['Accept-Ranges'] = 'bytes'
+        return self.apply_validators(response, etag, last_modified)
+
+    # Дополнительный метод к download_file, download_file_by_token: ограничитель скорости скачивания
+    def get_bandwidth_limiter(self, request, file, channel):
+        """
+        Возвращает (limiter, None) или (None, Response 429), если очередь на отдачу
+        по ссылке, пользователю или общему лимиту больше DOWNLOAD_MAX_WAIT секунд
+        """
+        limiter = BandwidthLimiter.for_download(request, file, channel)
+        delay = limiter.delay()
+        if delay > settings.DOWNLOAD_MAX_WAIT:
+            logger.warning('Превышен лимит скорости скачивания для файла %s, ожидание %.1f с', file.id_file, delay)
+            response = Response({"detail": "Слишком много скачиваний, повторите позже."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(math.ceil(delay))
+            return None, response
+        return limiter, None
+
     # Метод для обработки GET-запроса: просмотр файла    
     def view_file(self, request, id_user, id_file):
         logger.info('Предоставление файла для просмотра: id_file=%s', id_file)
         try:
-            file_path, content_type, encoded_file_name, _ = self.get_file_params(id_file=id_file, options="os.path")
+            file_path, content_type, encoded_file_name, file = self.get_file_params(id_file=id_file)
+            etag, last_modified = self.get_validators(file)
+            if self.is_not_modified(request, etag):
+                return self.apply_validators(HttpResponseNotModified(), etag, last_modified)
+
+            # Кодировка текста определена при загрузке; для старых записей без метаданных считаем текст utf-8
+            charset = file.charset
+            if file.content_type is None and content_type in ['text/plain', 'text/html', 'text/csv']:
+                charset = 'utf-8'
+            if charset:
+                content_type = f"{content_type}; charset={charset}"
 
-            # Если файл текстовый, открываем его с кодировкой
-            if content_type in ['text/plain', 'text/html', 'text/csv']:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    response = HttpResponse(file.read(), content_type=f"{content_type}; charset=utf-8")
+            if file.chunked or file.encrypted:
+                # Файл из хранилища блоков или зашифрованный файл отдаем потоком
+                response = StreamingHttpResponse(self.content_iterator(file, file_path), content_type=content_type)
             else:
-                # Для остальных типов файлов, используем FileResponse
-                response = FileResponse(open(file_path, 'rb'), content_type=content_type)
+                # Текст отдается как есть, с указанием кодировки: браузер декодирует его сам
+                response = FileResponse(self.open_file(file_path), content_type=content_type)
 
             response['Content-Disposition'] = f'inline; filename="{encoded_file_name}"'
-            return response
+            return self.apply_validators(response, etag, last_modified)
         except Storage.DoesNotExist:
             logger.warning('Файл не найден для просмотра: id_file=%s', id_file)
             raise Http404("Файл не найден")
@@ -302,13 +568,16 @@ class StorageView(APIView):
         try:
             file_path, content_type, encoded_file_name, file = self.get_file_params(id_file=id_file)
 
-            self.update_last_download_date(file)
+            limiter, error_response = self.get_bandwidth_limiter(request, file, DownloadStat.CHANNEL_DIRECT)
+            if error_response:
+                return error_response
 
-            response = StreamingHttpResponse(self.file_iterator(file_path), content_type=content_type)
+            response = self.make_download_response(request, file, file_path, content_type, limiter, DownloadStat.CHANNEL_DIRECT)
             response['Content-Disposition'] = f'attachment; filename="{encoded_file_name}"'
             response['X-Filename'] = encoded_file_name
             
-            response['X-Last-Download-Date'] = file.last_download_date.isoformat()
+            if file.last_download_date:
+                response['X-Last-Download-Date'] = file.last_download_date.isoformat()
             return response
         except Storage.DoesNotExist:
             logger.warning('Файл не найден при скачивании: id_file=%s', id_file)
@@ -318,17 +587,18 @@ class StorageView(APIView):
     def download_file_by_token(self, request, token):
         logger.info('Скачивание файла по токену: token=%s', token)
         try:
-            file_path, content_type, encoded_file_name, file = self.get_file_params(token=token, options="os.path")
+            file_path, content_type, encoded_file_name, file = self.get_file_params(token=token)
 
             # Проверяем, не истек ли токен
             if file.token_expiration < timezone.now():
                 logger.warning('Ссылка устарела для токена: %s', token)
                 return Response({"detail": "Ссылка устарела."}, status=status.HTTP_403_FORBIDDEN)
 
-            # Обновляем поле last_download_date
-            self.update_last_download_date(file)
+            limiter, error_response = self.get_bandwidth_limiter(request, file, DownloadStat.CHANNEL_LINK)
+            if error_response:
+                return error_response
 
-            response = StreamingHttpResponse(self.file_iterator(file_path), content_type=content_type)
+            response = self.make_download_response(request, file, file_path, content_type, limiter, DownloadStat.CHANNEL_LINK)
             response['Content-Disposition'] = f'attachment; filename="{encoded_file_name}"'
             response['X-Filename'] = encoded_file_name
             logger.info('Файл %s успешно скачан по токену', encoded_file_name)
@@ -363,13 +633,24 @@ class StorageView(APIView):
             logger.error('Файл не найден: id_user=%s, id_file=%s', id_user, id_file)
             return Response({"detail": "Файл не найден."}, status=status.HTTP_404_NOT_FOUND)
 
+        # Необязательное ограничение скорости скачивания по ссылке (байт/сек)
+        try:
+            rate_limit = int(request.data.get("rate_limit") or 0)
+            if rate_limit < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            logger.error('Неправильное ограничение скорости для ссылки: %s', request.data.get("rate_limit"))
+            return Response({"detail": "Ограничение скорости должно быть целым неотрицательным числом (байт/сек)."}, status=status.HTTP_400_BAD_REQUEST)
+
         # Генерируем уникальный токен
         unique_token = get_random_string(length=32)
 
         # Сохраняем зашифрованный токен
         storage_item.set_token(unique_token)
         storage_item.token_expiration = timezone.now() + timezone.timedelta(minutes=5)
+        storage_item.token_rate_limit = rate_limit or None
         storage_item.save()
+        events.emit_file(events.LINK, storage_item)
 
         # Формируем ссылку с незашифрованным токеном
         link = request.build_absolute_uri(f"/api/storage/download/{unique_token}/")
@@ -389,33 +670,44 @@ class StorageView(APIView):
             logger.error('Пользователь не найден: id_user=%s', id_user)
             return Response({"detail": "Пользователь не найден"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Проверяем и обрабатываем конфликты имен файлов
+        try:
+            folder = self.get_user_folder(id_user, request.data.get("folder"))
+        except Folder.DoesNotExist:
+            logger.error('Папка не найдена: id_user=%s, folder=%s', id_user, request.data.get("folder"))
+            return Response({"detail": "Папка не найдена"}, status=status.HTTP_404_NOT_FOUND)
+
+        if quota_exceeded(id_user, file.size):
+            logger.warning('Превышена квота пользователя %s: файл %s байт', id_user, file.size)
+            return Response({"detail": "Превышена квота на размер файлов"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        # Проверяем и обрабатываем конфликты имен файлов: name, name(1), name(2)...
         original_filename = file.name
-        name_without_ext, ext = os.path.splitext(original_filename)
-        final_filename = original_filename
-        counter = 1
-        
-        # Проверяем есть ли уже файл с таким именем у этого пользователя
-        while Storage.objects.filter(id_user=user, original_name=final_filename).exists():
-            final_filename = f"{name_without_ext}({counter}){ext}"
-            counter += 1
-            logger.info('Конфликт имени файла. Пробуем: %s', final_filename)
+        final_filename = resolve_names(user.id_user, [original_filename])[0]
 
         # Сохраняем файл и информацию о файле в базе данных
         storage_file = Storage(
             id_user=user,
+            folder=folder,
             original_name=final_filename,
             comment=comment,
             size=file.size,
-            file=file
         )
-        storage_file.save()
+        # Запись, как и в пакетной загрузке, через store_content: на диск с контрольной суммой (при заданном ключе
+        # файл шифруется по сегментам прямо при записи) или в хранилище блоков (только новые блоки), тоже с checksum
+        hashes = store_content(storage_file, file, file.name, get_master_key(), chunk_mode=settings.STORAGE_CHUNK_MODE)
+        with transaction.atomic():
+            storage_file.save()
+            if hashes is not None:
+                storage_file.set_chunks(hashes)
+        if folder:
+            Folder.adjust_totals(folder.path, 1, storage_file.size)
 
-        # Если имя изменилось, записываем новое имя
-        if final_filename != original_filename:
+        # Если имя изменилось, записываем новое имя (у файла из хранилища блоков нет файла на диске)
+        if final_filename != original_filename and storage_file.file:
             logger.warning("Файл %s переименован в %s из-за конфликта", original_filename, final_filename)
             storage_file.new_name = storage_file.file.name.split('/')[-1]
             storage_file.save()
+        events.emit_file(events.UPLOAD, storage_file)
         logger.info('Файл %s загружен успешно', final_filename)
         return self.get(request, id_user)
     
@@ -426,20 +718,39 @@ class StorageView(APIView):
         if not self.check_user_access(request, id_user):
             logger.warning('Пользователь %s пытается переименовать файл пользователя %s', request.user.username, id_user)
             return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+        if "name" not in request.data and "folder" in request.data:
+            # перемещение файла в другую папку
+            return self.move_file(request, id_user, id_file)
         new_name = request.data["name"]
+        chunked = Storage.objects.filter(id_file=id_file, id_user=id_user, chunked=True).first()
+        if chunked is not None:
+            # у файла из хранилища блоков нет файла на диске, меняем только имя (без совпадения с другими файлами)
+            if Storage.objects.filter(id_user=id_user, original_name=new_name).exclude(pk=chunked.pk).exists():
+                logger.error('Файл с таким именем уже существует: %s', new_name)
+                return Response({"detail": "Файл с таким именем уже существует"}, status=status.HTTP_400_BAD_REQUEST)
+            chunked.original_name = new_name
+            chunked.new_name = None
+            chunked.save(update_fields=['original_name', 'new_name'])
+            events.emit_file(events.RENAME, chunked)
+            logger.info('Файл переименован: %s', new_name)
+            return Response(StorageSerializer(chunked).data, status=status.HTTP_200_OK)
         # Проверяем, существует ли файл с таким именем
         if os.path.exists(os.path.join(settings.MEDIA_ROOT, "uploads", new_name)):
             logger.error('Файл с таким именем уже существует: %s', new_name)
             return Response({"detail": "Файл с таким именем уже существует"}, status=status.HTTP_400_BAD_REQUEST)        
         try:
-            file_to_rename = Storage.objects.get(id_file=id_file)
+            file_to_rename = Storage.objects.get(id_file=id_file, id_user=id_user)
             old_file_path = file_to_rename.file.path
             new_file_path = os.path.join(os.path.dirname(old_file_path), new_name.replace(" ", "_"))
-            os.rename(old_file_path, new_file_path)
             file_to_rename.original_name = new_name
             file_to_rename.file.name = os.path.join('uploads', new_name.replace(" ", "_"))
             file_to_rename.new_name = None
-            file_to_rename.save()
+            # Сначала запись в БД, затем переименование на диске: если переименовать не удалось,
+            # транзакция откатывается и строка продолжает указывать на существующий файл
+            with transaction.atomic():
+                file_to_rename.save()
+                os.rename(old_file_path, new_file_path)
+                events.emit_file(events.RENAME, file_to_rename)
             serializer = StorageSerializer(file_to_rename)
 
             logger.info('Файл переименован: %s', new_name)
@@ -454,6 +765,28 @@ class StorageView(APIView):
             logger.exception('Ошибка при переименовании файла: %s', str(e))
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
+    # Дополнительный метод к PATCH-запросу: перемещение файла в папку (файл на диске не перемещается)
+    def move_file(self, request, id_user, id_file):
+        logger.info('Перемещение файла: id_user=%s, id_file=%s, folder=%s', id_user, id_file, request.data["folder"])
+        try:
+            file = Storage.objects.select_related('folder').get(id_user=id_user, id_file=id_file)
+            new_folder = self.get_user_folder(id_user, request.data["folder"])
+        except (Storage.DoesNotExist, Folder.DoesNotExist):
+            logger.error('Файл или папка не найдены: id_file=%s, folder=%s', id_file, request.data["folder"])
+            return Response({"detail": "Файл или папка не найдены."}, status=status.HTTP_404_NOT_FOUND)
+
+        if file.folder_id != (new_folder.id_folder if new_folder else None):
+            with transaction.atomic():
+                if file.folder_id:
+                    Folder.adjust_totals(file.folder.path, -1, -file.size)
+                if new_folder:
+                    Folder.adjust_totals(new_folder.path, 1, file.size)
+                file.folder = new_folder
+                file.save(update_fields=['folder'])
+                events.emit_file(events.MOVE, file)
+        logger.info('Файл %s перемещен в папку %s', id_file, new_folder)
+        return Response(StorageSerializer(file).data, status=status.HTTP_200_OK)
+
     # Метод для обработки DELETE-запроса: удаление файла по ID
     def delete(self, request, id_user, id_file): 
         logger.info('DELETE запрос для файла: id_user=%s, id_file=%s', id_user, id_file)
@@ -462,13 +795,623 @@ class StorageView(APIView):
             logger.warning('Пользователь %s пытается удалить файл пользователя %s', request.user.username, id_user)
             return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)       
         try:
-            file = Storage.objects.get(id_user=id_user, id_file=id_file)
-            file.delete()
-            logger.info('Файл с id_file=%s был успешно удалён', id_file)
+            # Файл переносится в корзину (один UPDATE), с диска его удалит purge_trash после срока хранения
+            if not Storage.objects.filter(id_user=id_user, id_file=id_file).trash():
+                logger.error('Файл не найден для удаления: id_file=%s', id_file)
+                return Response({"Детали": "Файл не найден."}, status=status.HTTP_404_NOT_FOUND)
+            logger.info('Файл с id_file=%s перенесен в корзину', id_file)
             return Response(status=status.HTTP_204_NO_CONTENT)
-        except Storage.DoesNotExist:
-            logger.error('Файл не найден для удаления: id_file=%s', id_file)
-            return Response({"Детали": "Файл не найден."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             logger.exception('Ошибка при удалении файла: %s', str(e))
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class BatchUploadView(StorageAccessMixin, APIView):
+    """
+    Загрузка многих файлов одним запросом: несколько полей files в multipart
+    или один архив (zip/tar, в том числе tar.gz) в поле archive, распаковываемый на сервере
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [UploadRateThrottle]
+
+    def post(self, request, id_user):
+        logger.info('Пакетная загрузка файлов: id_user=%s', id_user)
+        if not self.check_user_access(request, id_user):
+            logger.warning('Пользователь %s пытается загрузить файлы пользователю %s', request.user.username, id_user)
+            return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            user = User.objects.get(id_user=id_user)
+            folder = self.get_user_folder(id_user, request.data.get("folder"))
+        except (User.DoesNotExist, Folder.DoesNotExist):
+            logger.error('Пользователь или папка не найдены: id_user=%s, folder=%s', id_user, request.data.get("folder"))
+            return Response({"detail": "Пользователь или папка не найдены"}, status=status.HTTP_404_NOT_FOUND)
+
+        parallel = True
+        if "archive" in request.FILES:
+            try:
+                items, parallel, total_size = archive_members(request.FILES["archive"])
+            except (tarfile.TarError, zipfile.BadZipFile):
+                logger.error('Неподдерживаемый или поврежденный архив: %s', request.FILES["archive"].name)
+                return Response({"detail": "Архив должен быть в формате zip или tar"}, status=status.HTTP_400_BAD_REQUEST)
+            except UploadTooLarge as e:
+                logger.warning('Архив слишком большой после распаковки: %s', str(e))
+                return Response({"detail": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        else:
+            files = request.FILES.getlist("files")
+            items = [(file.name, lambda file=file: file) for file in files]
+            total_size = sum(file.size for file in files)
+
+        if not items:
+            return Response({"detail": "Нет файлов для загрузки"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.STORAGE_BATCH_MAX_FILES:
+            return Response({"detail": f"Не больше {settings.STORAGE_BATCH_MAX_FILES} файлов за один запрос"}, status=status.HTTP_400_BAD_REQUEST)
+        if quota_exceeded(id_user, total_size):
+            logger.warning('Превышена квота пользователя %s: пакет %s байт', id_user, total_size)
+            return Response({"detail": "Превышена квота на размер файлов"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        results = batch_upload(user, folder, items, comment=request.data.get("comment", ""), parallel=parallel)
+        created = sum(1 for result in results if 'id_file' in result)
+        logger.info('Пакетная загрузка: загружено %s из %s файлов', created, len(results))
+        return Response(
+            {"created": created, "failed": len(results) - created, "results": results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class FileTransferView(StorageAccessMixin, APIView):
+    """
+    Копирование и перемещение файлов на сервере (api_app/copying.py), в том числе другому пользователю:
+    содержимое не передается через сеть и не читается Python (жесткая ссылка, reflink или copy_file_range).
+    Тело запроса: files - список id_file, user - получатель (по умолчанию владелец), folder - папка получателя
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, id_user, action):
+        target_id = request.data.get("user") or id_user
+        logger.info('%s файлов: id_user=%s -> user=%s, folder=%s', action, id_user, target_id, request.data.get("folder"))
+        # Нужен доступ и к файлам владельца, и к хранилищу получателя (другим пользователям - только администратор)
+        if not self.check_user_access(request, id_user) or not self.check_user_access(request, target_id):
+            logger.warning('Пользователь %s пытается передать файлы пользователя %s пользователю %s', request.user.username, id_user, target_id)
+            return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+
+        ids = request.data.get("files")
+        if not isinstance(ids, list) or not ids or not all(isinstance(id_file, int) for id_file in ids):
+            return Response({"detail": "files - непустой список id файлов"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.STORAGE_BATCH_MAX_FILES:
+            return Response({"detail": f"Не больше {settings.STORAGE_BATCH_MAX_FILES} файлов за один запрос"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            user = User.objects.get(id_user=target_id)
+            folder = self.get_user_folder(target_id, request.data.get("folder"))
+        except (User.DoesNotExist, Folder.DoesNotExist, ValueError):
+            logger.error('Получатель или папка не найдены: user=%s, folder=%s', target_id, request.data.get("folder"))
+            return Response({"detail": "Пользователь или папка не найдены"}, status=status.HTTP_404_NOT_FOUND)
+
+        files = list(Storage.objects.select_related('folder').filter(id_user=id_user, id_file__in=set(ids)).order_by('id_file'))
+        missing = sorted(set(ids) - {file.id_file for file in files})
+        if missing:
+            logger.error('Файлы не найдены: id_user=%s, files=%s', id_user, missing)
+            return Response({"detail": "Файлы не найдены.", "missing": missing}, status=status.HTTP_404_NOT_FOUND)
+
+        # Копия и перемещение другому пользователю увеличивают занятое им место
+        added = sum(file.size for file in files if action == 'copy' or file.id_user_id != user.id_user)
+        if added and quota_exceeded(user.id_user, added):
+            logger.warning('Превышена квота пользователя %s: %s байт', user.id_user, added)
+            return Response({"detail": "Превышена квота на размер файлов"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        if action == 'move':
+            moved = move_files(files, user, folder)
+            logger.info('Перемещено файлов: %s', len(moved))
+            return Response({"moved": len(moved), "results": [events.file_payload(file) for file in moved]}, status=status.HTTP_200_OK)
+
+        results = copy_files(files, user, folder)
+        created = sum(1 for result in results if 'new_id_file' in result)
+        logger.info('Скопировано %s из %s файлов', created, len(results))
+        return Response(
+            {"created": created, "failed": len(results) - created, "results": results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class StorageSearchView(StorageAccessMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    # Метод для обработки GET-запроса: поиск файлов пользователя по имени и комментарию
+    # Параметры: q, mode (substring|prefix), size_min, size_max, date_from, date_to, page, page_size
+    def get(self, request, id_user):
+        logger.info('GET запрос на поиск файлов: id_user=%s, params=%s', id_user, request.query_params.dict())
+        if not self.check_user_access(request, id_user):
+            logger.warning('Пользователь %s пытается искать файлы пользователя %s', request.user.username, id_user)
+            return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+
+        queryset = Storage.objects.filter(id_user=id_user)
+        try:
+            queryset = filter_storage(queryset, request.query_params)
+        except ValueError as e:
+            logger.warning('Неправильные параметры поиска: %s', str(e))
+            return Response({"detail": f"Неправильные параметры поиска: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = StoragePagination()
+        queryset = StorageListSerializer.values(queryset.order_by('-upload_date', '-id_file'))
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(page)
+
+
+class TrashView(StorageAccessMixin, APIView):
+    """
+    Корзина: удаленные файлы хранятся TRASH_RETENTION_DAYS дней, затем их удаляет команда purge_trash.
+    Восстановленный файл возвращается в корень хранилища (папка могла быть удалена)
+    """
+    permission_classes = [IsAuthenticated]
+
+    # Метод для обработки GET-запроса: файлы в корзине, последние удаленные первыми (page, page_size)
+    def get(self, request, id_user):
+        logger.info('GET запрос на корзину: id_user=%s', id_user)
+        if not self.check_user_access(request, id_user):
+            logger.warning('Пользователь %s пытается получить корзину пользователя %s', request.user.username, id_user)
+            return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+
+        queryset = Storage.all_objects.filter(id_user=id_user, deleted_at__isnull=False).order_by('-deleted_at', '-id_file')
+        paginator = StoragePagination()
+        page = paginator.paginate_queryset(TrashListSerializer.values(queryset), request, view=self)
+        return paginator.get_paginated_response(page)
+
+    # Метод для обработки POST-запроса: восстановление файлов из корзины, тело {"files": [id_file, ...]}
+    def post(self, request, id_user):
+        logger.info('POST запрос на восстановление файлов: id_user=%s', id_user)
+        if not self.check_user_access(request, id_user):
+            logger.warning('Пользователь %s пытается восстановить файлы пользователя %s', request.user.username, id_user)
+            return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+
+        ids = request.data.get("files")
+        if not isinstance(ids, list) or not ids or not all(isinstance(id_file, int) for id_file in ids):
+            return Response({"detail": "files - непустой список id файлов"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.STORAGE_BATCH_MAX_FILES:
+            return Response({"detail": f"Не больше {settings.STORAGE_BATCH_MAX_FILES} файлов за один запрос"}, status=status.HTTP_400_BAD_REQUEST)
+
+        restored = Storage.all_objects.filter(id_user=id_user, id_file__in=set(ids)).restore()
+        missing = sorted(set(ids) - {file.id_file for file in restored})
+        if missing:
+            logger.warning('Файлы не найдены в корзине: id_user=%s, files=%s', id_user, missing)
+        logger.info('Восстановлено файлов: %s', len(restored))
+        return Response(
+            {"restored": len(restored), "missing": missing, "results": [events.file_payload(file) for file in restored]},
+            status=status.HTTP_200_OK if restored else status.HTTP_404_NOT_FOUND,
+        )
+
+
+class FolderView(StorageAccessMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    # Метод для обработки GET-запроса: содержимое папки (без id_folder - корень пользователя)
+    def get(self, request, id_user, id_folder=None):
+        logger.info('GET запрос содержимого папки: id_user=%s, id_folder=%s', id_user, id_folder)
+        if not self.check_user_access(request, id_user):
+            logger.warning('Пользователь %s пытается получить доступ к папкам пользователя %s', request.user.username, id_user)
+            return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            folder = self.get_user_folder(id_user, id_folder)
+        except Folder.DoesNotExist:
+            logger.warning('Папка не найдена: id_folder=%s', id_folder)
+            return Response({"detail": "Папка не найдена."}, status=status.HTTP_404_NOT_FOUND)
+
+        folders = Folder.objects.filter(id_user=id_user, parent=folder).order_by('name')
+        files = Storage.objects.filter(id_user=id_user, folder=folder).order_by('-upload_date', '-id_file')
+        return Response({
+            "folder": FolderSerializer(folder).data if folder else None,
+            "folders": FolderListSerializer(folders).data,
+            "files": StorageListSerializer(files).data,
+        }, status=status.HTTP_200_OK)
+
+    # Метод для обработки POST-запроса: создание папки {name, parent}
+    def post(self, request, id_user):
+        logger.info('POST запрос на создание папки: id_user=%s, data=%s', id_user, request.data)
+        if not self.check_user_access(request, id_user):
+            logger.warning('Пользователь %s пытается создать папку пользователя %s', request.user.username, id_user)
+            return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+        name = (request.data.get("name") or "").strip()
+        if not name:
+            logger.error('Не указано имя папки')
+            return Response({"detail": "Требуется имя папки."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            user = User.objects.get(id_user=id_user)
+            parent = self.get_user_folder(id_user, request.data.get("parent"))
+        except (User.DoesNotExist, Folder.DoesNotExist):
+            logger.error('Пользователь или родительская папка не найдены: id_user=%s, parent=%s', id_user, request.data.get("parent"))
+            return Response({"detail": "Пользователь или родительская папка не найдены."}, status=status.HTTP_404_NOT_FOUND)
+
+        if Folder.objects.filter(id_user=user, parent=parent, name=name).exists():
+            logger.error('Папка с таким именем уже существует: %s', name)
+            return Response({"detail": "Папка с таким именем уже существует"}, status=status.HTTP_400_BAD_REQUEST)
+        folder = Folder.objects.create(id_user=user, parent=parent, name=name)
+        events.emit(user.id_user, events.FOLDER, payload={'action': 'create', 'id_folder': folder.id_folder})
+        logger.info('Папка создана: %s', folder.path)
+        return Response(FolderSerializer(folder).data, status=status.HTTP_201_CREATED)
+
+    # Метод для обработки PATCH-запроса: переименование {name} и/или перемещение {parent} папки
+    def patch(self, request, id_user, id_folder):
+        logger.info('PATCH запрос для папки: id_user=%s, id_folder=%s, data=%s', id_user, id_folder, request.data)
+        if not self.check_user_access(request, id_user):
+            logger.warning('Пользователь %s пытается изменить папку пользователя %s', request.user.username, id_user)
+            return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            folder = self.get_user_folder(id_user, id_folder)
+            new_parent = self.get_user_folder(id_user, request.data.get("parent")) if "parent" in request.data else folder.parent
+        except Folder.DoesNotExist:
+            logger.error('Папка не найдена: id_folder=%s, parent=%s', id_folder, request.data.get("parent"))
+            return Response({"detail": "Папка не найдена."}, status=status.HTTP_404_NOT_FOUND)
+
+        new_name = (request.data.get("name") or folder.name).strip()
+        if Folder.objects.filter(id_user=id_user, parent=new_parent, name=new_name).exclude(id_folder=folder.id_folder).exists():
+            logger.error('Папка с таким именем уже существует: %s', new_name)
+            return Response({"detail": "Папка с таким именем уже существует"}, status=status.HTTP_400_BAD_REQUEST)
+        # Нельзя переместить папку внутрь самой себя
+        if new_parent and new_parent.path.startswith(folder.path):
+            logger.error('Попытка переместить папку %s во вложенную папку %s', folder.path, new_parent.path)
+            return Response({"detail": "Нельзя переместить папку во вложенную папку."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if new_name != folder.name:
+            folder.name = new_name
+            folder.save(update_fields=['name'])
+        if (new_parent.id_folder if new_parent else None) != folder.parent_id:
+            folder.move_to(new_parent)
+        events.emit(folder.id_user_id, events.FOLDER, payload={'action': 'update', 'id_folder': folder.id_folder})
+        logger.info('Папка обновлена: %s', folder.path)
+        return Response(FolderSerializer(folder).data, status=status.HTTP_200_OK)
+
+    # Метод для обработки DELETE-запроса: удаление папки со всеми вложенными папками и файлами
+    def delete(self, request, id_user, id_folder):
+        logger.info('DELETE запрос для папки: id_user=%s, id_folder=%s', id_user, id_folder)
+        if not self.check_user_access(request, id_user):
+            logger.warning('Пользователь %s пытается удалить папку пользователя %s', request.user.username, id_user)
+            return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            folder = self.get_user_folder(id_user, id_folder)
+        except Folder.DoesNotExist:
+            logger.error('Папка не найдена для удаления: id_folder=%s', id_folder)
+            return Response({"detail": "Папка не найдена."}, status=status.HTTP_404_NOT_FOUND)
+
+        # Файлы всего поддерева выбираются одним запросом по индексу path и переносятся в корзину.
+        # Папок больше не будет, поэтому файлы из корзины восстанавливаются в корень; диск очистит purge_trash
+        files = Storage.all_objects.filter(id_user=id_user, folder__path__startswith=folder.path)
+        with transaction.atomic():
+            Folder.adjust_totals(folder.parent.path if folder.parent_id else '', -folder.files_total, -folder.size_total)
+            files.filter(deleted_at__isnull=True).update(deleted_at=timezone.now())
+            files.update(folder=None)
+            folder.delete()
+            events.emit(int(id_user), events.FOLDER, payload={'action': 'delete', 'id_folder': int(id_folder)})
+        logger.info('Папка %s удалена, ее файлы перенесены в корзину', id_folder)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ChunkView(StorageAccessMixin, APIView):
+    """
+    Загрузка файлов блоками (хранилище блоков, см. chunking.py):
+    1. POST missing/ {"hashes": [...]} - какие блоки нужно загрузить
+    2. PUT <hash>/ (тело запроса - содержимое блока) - загрузка недостающих блоков
+    3. POST commit/ {"name", "comment", "folder", "chunks": [...], "id_file"} - сборка файла из блоков;
+       с id_file заменяется содержимое существующего файла (новая версия без повторной загрузки всех данных)
+    """
+    permission_classes = [IsAuthenticated]
+    max_hashes = 10000
+
+    def check_access(self, request, id_user):
+        if not self.check_user_access(request, id_user):
+            logger.warning('Пользователь %s пытается загрузить блоки пользователю %s', request.user.username, id_user)
+            return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+        return None
+
+    # Метод для обработки POST-запроса: проверка недостающих блоков или сборка файла
+    def post(self, request, id_user, action):
+        logger.info('POST запрос к хранилищу блоков: id_user=%s, action=%s', id_user, action)
+        error_response = self.check_access(request, id_user)
+        if error_response:
+            return error_response
+
+        hashes = request.data.get("hashes" if action == 'missing' else "chunks")
+        if not isinstance(hashes, list) or len(hashes) > self.max_hashes or not all(isinstance(h, str) and len(h) == 64 for h in hashes):
+            logger.error('Неправильный список блоков: %s', type(hashes))
+            return Response({"detail": f"Требуется список SHA-256 хэшей блоков (не больше {self.max_hashes})."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Есть только блоки, которыми пользователь уже владеет: чужие блоки с тем же хэшем нужно передать заново
+        owned = Chunk.owned_by(id_user, hashes)
+        missing = list(dict.fromkeys(h for h in hashes if h not in owned))
+        if action == 'missing':
+            return Response({"missing": missing}, status=status.HTTP_200_OK)
+        if missing:
+            logger.warning('Сборка файла невозможна, не хватает блоков: %s', len(missing))
+            return Response({"detail": "Не все блоки загружены.", "missing": missing}, status=status.HTTP_400_BAD_REQUEST)
+        return self.commit(request, id_user, hashes)
+
+    # Дополнительный метод к post: сборка файла из загруженных блоков
+    def commit(self, request, id_user, hashes):
+        sizes = dict(Chunk.objects.filter(hash__in=set(hashes)).values_list('hash', 'size'))
+        size = sum(sizes[h] for h in hashes)
+        try:
+            if request.data.get("id_file"):
+                storage_file = Storage.objects.select_related('folder').get(id_user=id_user, id_file=request.data["id_file"])
+            else:
+                storage_file = None
+                user = User.objects.get(id_user=id_user)
+                folder = self.get_user_folder(id_user, request.data.get("folder"))
+        except (Storage.DoesNotExist, User.DoesNotExist, Folder.DoesNotExist):
+            logger.error('Файл, пользователь или папка не найдены: id_user=%s, data=%s', id_user, request.data)
+            return Response({"detail": "Файл, пользователь или папка не найдены."}, status=status.HTTP_404_NOT_FOUND)
+        if quota_exceeded(id_user, size - (storage_file.size if storage_file else 0)):
+            logger.warning('Превышена квота пользователя %s: файл из блоков %s байт', id_user, size)
+            return Response({"detail": "Превышена квота на размер файлов"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        # Тип содержимого определяем по началу первого блока
+        head = next(read_chunks(hashes[:1], SNIFF_SIZE), b'')
+        with transaction.atomic():
+            if storage_file:
+                # Новая версия существующего файла: меняем только список блоков
+                old_path = None if storage_file.chunked else storage_file.file.name
+                if storage_file.folder_id:
+                    Folder.adjust_totals(storage_file.folder.path, 0, size - storage_file.size)
+                storage_file.size = size
+                storage_file.chunked = True
+                storage_file.file = ''
+                storage_file.encrypted = False
+                storage_file.checksum = None
+                storage_file.file_mtime = None
+                set_content_metadata(storage_file, head, storage_file.original_name)
+                storage_file.save(update_fields=['size', 'chunked', 'file', 'encrypted', 'checksum', 'file_mtime', 'content_type', 'charset'])
+                old_hashes = storage_file.set_chunks(hashes)
+                status_code = status.HTTP_200_OK
+            else:
+                final_name = resolve_names(user.id_user, [request.data.get("name") or "file"])[0]
+                storage_file = Storage(
+                    id_user=user, folder=folder, original_name=final_name,
+                    comment=request.data.get("comment", ""), size=size, chunked=True,
+                )
+                set_content_metadata(storage_file, head, final_name)
+                storage_file.save()
+                storage_file.set_chunks(hashes)
+                if folder:
+                    Folder.adjust_totals(folder.path, 1, size)
+                old_path, old_hashes = None, []
+                status_code = status.HTTP_201_CREATED
+
+        if old_path and os.path.isfile(os.path.join(settings.MEDIA_ROOT, old_path)):
+            os.remove(os.path.join(settings.MEDIA_ROOT, old_path))
+        # Владение блоками теперь подтверждают ссылки из файла
+        ChunkUpload.objects.filter(id_user=id_user, chunk_id__in=set(hashes)).delete()
+        if old_hashes:
+            Chunk.release(old_hashes)
+        events.emit_file(events.UPDATE if status_code == status.HTTP_200_OK else events.UPLOAD, storage_file)
+        logger.info('Файл %s собран из %s блоков', storage_file.original_name, len(hashes))
+        return Response(StorageSerializer(storage_file).data, status=status_code)
+
+    # Метод для обработки PUT-запроса: загрузка одного блока (тело запроса - содержимое блока)
+    def put(self, request, id_user, chunk_hash_hex):
+        logger.info('PUT запрос на загрузку блока: id_user=%s, hash=%s', id_user, chunk_hash_hex)
+        error_response = self.check_access(request, id_user)
+        if error_response:
+            return error_response
+
+        data = request.read(MAX_CHUNK_SIZE + 1)
+        if not data or len(data) > MAX_CHUNK_SIZE:
+            logger.error('Неправильный размер блока: %s', len(data))
+            return Response({"detail": f"Размер блока должен быть от 1 до {MAX_CHUNK_SIZE} байт."}, status=status.HTTP_400_BAD_REQUEST)
+        if chunk_hash(data) != chunk_hash_hex.lower():
+            logger.error('Хэш блока не совпадает: %s', chunk_hash_hex)
+            return Response({"detail": "SHA-256 содержимого не совпадает с хэшем блока."}, status=status.HTTP_400_BAD_REQUEST)
+
+        write_chunk(chunk_hash_hex.lower(), data)
+        Chunk.objects.bulk_create([Chunk(hash=chunk_hash_hex.lower(), size=len(data))], ignore_conflicts=True)
+        ChunkUpload.objects.bulk_create([ChunkUpload(id_user_id=id_user, chunk_id=chunk_hash_hex.lower())], ignore_conflicts=True)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class AuthTokenView(APIView):
+    """
+    Токены входа (api_app/authentication.py):
+    - login: username и password -> access и refresh (пароль проверяется только здесь);
+    - refresh: refresh -> новая пара токенов, без пароля;
+    - logout: завершение сессии по access-токену или по refresh (если access уже истек).
+    """
+    permission_classes = [AllowAny]
+
+    def get_throttles(self):
+        # Частота ограничивается только для входа по паролю: обмен refresh-токена дешевый
+        if self.kwargs.get('action') == 'login':
+            return [LoginRateThrottle()]
+        return super().get_throttles()
+
+    def post(self, request, action):
+        if action == 'login':
+            return self.login(request)
+        if action == 'refresh':
+            return self.refresh(request)
+        return self.logout(request)
+
+    def login(self, request):
+        username, password = request.data.get('username'), request.data.get('password')
+        logger.info('Вход по паролю: %s', username)
+        if not username or not password:
+            return Response({"detail": "Укажите username и password."}, status=status.HTTP_400_BAD_REQUEST)
+        user = authenticate(request, username=username, password=password)
+        if user is None:
+            logger.warning('Неверный логин или пароль: %s', username)
+            return Response({"detail": "Некорректный логин или пароль."}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(start_session(user), status=status.HTTP_200_OK)
+
+    def refresh(self, request):
+        refresh = request.data.get('refresh')
+        tokens = refresh_session(refresh) if isinstance(refresh, str) and refresh else None
+        if tokens is None:
+            logger.warning('Недействительный refresh-токен')
+            return Response({"detail": "Сессия завершена или истекла, войдите заново."}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(tokens, status=status.HTTP_200_OK)
+
+    def logout(self, request):
+        refresh = request.data.get('refresh')
+        session = end_session(
+            session=request.auth if isinstance(request.auth, AuthSession) else None,
+            refresh=refresh if isinstance(refresh, str) else None,
+        )
+        if session is None:
+            return Response({"detail": "Сессия не найдена."}, status=status.HTTP_401_UNAUTHORIZED)
+        # Вкладки этой сессии узнают о выходе из ленты событий; другие устройства остаются в системе
+        events.emit(session.id_user_id, events.LOGOUT, payload={'session': session.id_session})
+        logger.info('Сессия %s пользователя %s завершена', session.id_session, session.id_user_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class HealthView(APIView):
+    """
+    Проверки состояния для балансировщика и systemd/docker: live - процесс отвечает (без обращения к БД),
+    ready - доступны БД, кэш и каталог файлов (503, если нет)
+    """
+    permission_classes = [AllowAny]
+    # Без аутентификации и ограничений частоты: проверки не должны обращаться к таблице токенов и кэшу лимитов
+    authentication_classes = []
+    throttle_classes = []
+
+    def get(self, request, check):
+        if check == 'live':
+            return Response({"status": "ok"}, status=status.HTTP_200_OK)
+
+        # Подробности пишутся только в лог: ответ доступен без аутентификации и содержит лишь имена проверок
+        failed = []
+        try:
+            with connections['default'].cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Exception:
+            logger.exception('Проверка готовности: база данных недоступна')
+            failed.append('database')
+        try:
+            cache.set('health:ready', 1, 10)
+            if cache.get('health:ready') != 1:
+                logger.error('Проверка готовности: значение не сохраняется в кэше')
+                failed.append('cache')
+        except Exception:
+            logger.exception('Проверка готовности: кэш недоступен')
+            failed.append('cache')
+        if not os.access(settings.MEDIA_ROOT, os.W_OK):
+            logger.error('Проверка готовности: нет доступа на запись в %s', settings.MEDIA_ROOT)
+            failed.append('media')
+
+        if failed:
+            return Response({"status": "fail", "failed": failed}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({"status": "ok"}, status=status.HTTP_200_OK)
+
+
+class DownloadStatsView(APIView):
+    """Статистика скачиваний для администратора: по файлам, владельцам, ссылкам или по времени"""
+    permission_classes = [IsAdminRole]
+
+    def get(self, request):
+        logger.info('GET запрос статистики скачиваний: %s', request.query_params.dict())
+        # Сначала сохраняем счетчики, накопленные этим процессом
+        flush_stats()
+        try:
+            data = summarize_downloads(request.query_params)
+        except ValueError as e:
+            logger.warning('Неправильные параметры статистики: %s', e)
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ProfileReportView(APIView):
+    """Отчеты профилирования запросов (ProfilingMiddleware) для администратора"""
+    permission_classes = [IsAdminRole]
+    list_fields = ('id_report', 'created_date', 'method', 'path', 'status_code', 'id_user', 'sampled',
+                   'duration_ms', 'query_count', 'query_time_ms')
+
+    def get(self, request, id_report=None):
+        if id_report is None:
+            # Список без текста профиля и SQL, самые медленные - через ?ordering=-duration_ms
+            ordering = request.query_params.get('ordering', '-id_report')
+            if ordering.lstrip('-') not in ('id_report', 'duration_ms', 'query_count', 'query_time_ms'):
+                return Response({"detail": "Неправильное поле сортировки."}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = ProfileReport.objects.order_by(ordering)
+            if request.query_params.get('path'):
+                queryset = queryset.filter(path__startswith=request.query_params['path'])
+            paginator = StoragePagination()
+            page = paginator.paginate_queryset(queryset.values(*self.list_fields), request, view=self)
+            return paginator.get_paginated_response(page)
+
+        report = ProfileReport.objects.filter(id_report=id_report).values(*self.list_fields, 'profile', 'queries').first()
+        if report is None:
+            return Response({"detail": "Отчет не найден."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(report, status=status.HTTP_200_OK)
+
+    def delete(self, request, id_report=None):
+        queryset = ProfileReport.objects.all()
+        if id_report is not None:
+            queryset = queryset.filter(id_report=id_report)
+        deleted = queryset.delete()[0]
+        logger.info('Удалено отчетов профилирования: %s', deleted)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class EventFeedView(StorageAccessMixin, APIView):
+    """
+    Лента изменений хранилища пользователя с курсором (id последнего полученного события):
+    - Accept: text/event-stream - поток SSE, продолжение с заголовка Last-Event-ID или ?cursor=;
+    - иначе - JSON с событиями после ?cursor= (без курсора - только текущий курсор).
+    Если курсор старше хранимого журнала, приходит событие reset: список файлов нужно загрузить заново.
+    События отдаются только до незафиксированной транзакции с меньшим id (events.settled_cursor),
+    поэтому продолжение с курсора ничего не пропускает
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, EventStreamRenderer]
+
+    def get(self, request, id_user):
+        if not self.check_user_access(request, id_user):
+            logger.warning('Пользователь %s пытается читать события пользователя %s', request.user.username, id_user)
+            return Response({"detail": "Нет доступа к файлам этого пользователя"}, status=status.HTTP_403_FORBIDDEN)
+        cursor = request.headers.get('Last-Event-ID') or request.query_params.get('cursor')
+        if cursor is not None and not str(cursor).isdigit():
+            return Response({"detail": "Курсор должен быть целым числом."}, status=status.HTTP_400_BAD_REQUEST)
+
+        oldest = StorageEvent.objects.order_by('id').values_list('id', flat=True).first() or 0
+        reset = cursor is not None and int(cursor) < oldest - 1
+        cursor = events.start_cursor() if cursor is None or reset else int(cursor)
+
+        if request.accepted_renderer.format == EventStreamRenderer.format:
+            # Поток закрывается только при выходе из этой же сессии (при входе через сессию Django ее нет)
+            session_id = request.auth.id_session if isinstance(request.auth, AuthSession) else None
+            event_stream = events.EventStream(id_user, cursor, reset, session_id)
+            # Под ASGI (uvicorn) - асинхронный генератор, ожидание не занимает поток. Под WSGI асинхронный генератор
+            # Django собрал бы целиком до отправки, поэтому там поток синхронный и занимает поток воркера
+            if isinstance(request._request, ASGIRequest):
+                stream = self.stream_async(event_stream)
+            else:
+                stream = self.stream_sync(event_stream)
+            response = StreamingHttpResponse(stream, content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'  # nginx не должен буферизовать поток
+            return response
+
+        items = []
+        if not reset:
+            items, cursor, _ = events.read_events(id_user, cursor)
+        return Response({
+            "cursor": cursor,
+            "reset": reset,
+            "events": items,
+        }, status=status.HTTP_200_OK)
+
+    async def stream_async(self, event_stream):
+        for chunk in event_stream.head():
+            yield chunk
+        while event_stream.running:
+            version = await cache.aget(events.version_key(event_stream.id_user))
+            # Чтение БД - в потоке через sync_to_async, проверка версии и пинг - без него
+            if event_stream.due(version):
+                chunks = await sync_to_async(event_stream.poll)(version)
+            else:
+                chunks = event_stream.idle()
+            for chunk in chunks:
+                yield chunk
+            if event_stream.running and not event_stream.backlog:
+                await asyncio.sleep(settings.EVENTS_POLL_INTERVAL)
+
+    def stream_sync(self, event_stream):
+        yield from event_stream.head()
+        while event_stream.running:
+            yield from event_stream.step(cache.get(events.version_key(event_stream.id_user)))
+            if event_stream.running and not event_stream.backlog:
+                time.sleep(settings.EVENTS_POLL_INTERVAL)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_project.settings')
+# До загрузки настроек: под ASGI постоянные соединения с БД отключаются (settings.SERVING_ASGI)
+os.environ['DJANGO_ASGI'] = 'True'
 
 application = get_asgi_application()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 import os
 from pathlib import Path
+from corsheaders.defaults import default_headers
 from decouple import config
 
 
@@ -20,6 +21,75 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Квота на размер файлов одного пользователя в байтах (0 - без ограничения)
+STORAGE_QUOTA_BYTES = config('STORAGE_QUOTA_BYTES', default=0, cast=int)
+
+# Хранение загружаемых файлов блоками с дедупликацией (api_app/chunking.py) вместо целых файлов в MEDIA_ROOT/uploads
+STORAGE_CHUNK_MODE = config('STORAGE_CHUNK_MODE', default=False, cast=bool)
+
+# Пакетная загрузка (/api/storage/batch/): максимум файлов в запросе и количество потоков записи
+STORAGE_BATCH_MAX_FILES = config('STORAGE_BATCH_MAX_FILES', default=5000, cast=int)
+STORAGE_BATCH_WORKERS = config('STORAGE_BATCH_WORKERS', default=4, cast=int)
+# Архив в пакетной загрузке: максимум байт после распаковки всего архива и одного файла из него
+STORAGE_ARCHIVE_MAX_BYTES = config('STORAGE_ARCHIVE_MAX_BYTES', default=10 * 1024 ** 3, cast=int)
+STORAGE_ARCHIVE_MAX_FILE_BYTES = config('STORAGE_ARCHIVE_MAX_FILE_BYTES', default=4 * 1024 ** 3, cast=int)
+# Django по умолчанию отклоняет multipart-запросы больше чем со 100 файлами
+DATA_UPLOAD_MAX_NUMBER_FILES = STORAGE_BATCH_MAX_FILES
+
+# Копирование файлов на сервере (/api/storage/copy/): копия на диске - жесткая ссылка на тот же файл.
+# False - отдельный файл (reflink или os.copy_file_range, если файловая система их поддерживает)
+STORAGE_COPY_HARDLINKS = config('STORAGE_COPY_HARDLINKS', default=True, cast=bool)
+
+# Корзина (/api/trash/): удаленные файлы хранятся N дней, затем команда purge_trash удаляет их с диска
+TRASH_RETENTION_DAYS = config('TRASH_RETENTION_DAYS', default=30, cast=int)
+
+# Лента изменений (/api/events/): длительность одного SSE-соединения (сек), период проверки новых событий (сек),
+# пауза перед переподключением клиента (мс), срок хранения журнала событий (ч, команда prune_events) и сколько
+# ждать незафиксированную транзакцию с меньшим id события, прежде чем считать ее откаченной (сек)
+EVENTS_STREAM_SECONDS = config('EVENTS_STREAM_SECONDS', default=300, cast=int)
+EVENTS_POLL_INTERVAL = config('EVENTS_POLL_INTERVAL', default=1.0, cast=float)
+EVENTS_RETRY_MS = config('EVENTS_RETRY_MS', default=3000, cast=int)
+EVENTS_RETENTION_HOURS = config('EVENTS_RETENTION_HOURS', default=72, cast=int)
+EVENTS_COMMIT_WINDOW = config('EVENTS_COMMIT_WINDOW', default=60, cast=int)
+
+# Ключ шифрования файлов на диске: 32 байта в url-safe base64 (пусто - новые файлы не шифруются).
+# Сгенерировать: python -c "import base64, os; print(base64.urlsafe_b64encode(os.urandom(32)).decode())"
+STORAGE_ENCRYPTION_KEY = config('STORAGE_ENCRYPTION_KEY', default='')
+
+# Статистика скачиваний копится в памяти процесса и сохраняется пакетом:
+# раз в STATS_FLUSH_INTERVAL секунд или при накоплении STATS_FLUSH_MAX_KEYS счетчиков
+STATS_FLUSH_INTERVAL = config('STATS_FLUSH_INTERVAL', default=60, cast=int)
+STATS_FLUSH_MAX_KEYS = config('STATS_FLUSH_MAX_KEYS', default=1000, cast=int)
+
+# Профилирование запросов (ProfilingMiddleware): staff-пользователи с заголовком X-Profile: 1
+# и случайная доля запросов PROFILING_SAMPLE_RATE (0.0-1.0); хранится PROFILING_MAX_REPORTS последних отчетов
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+PROFILING_MAX_REPORTS = config('PROFILING_MAX_REPORTS', default=200, cast=int)
+PROFILING_TOP_FUNCTIONS = config('PROFILING_TOP_FUNCTIONS', default=60, cast=int)
+
+# Токены входа (api_app/authentication.py): срок действия access-токена и refresh-токена (сек)
+AUTH_ACCESS_TOKEN_LIFETIME = config('AUTH_ACCESS_TOKEN_LIFETIME', default=900, cast=int)
+AUTH_REFRESH_TOKEN_LIFETIME = config('AUTH_REFRESH_TOKEN_LIFETIME', default=14 * 24 * 3600, cast=int)
+
+# Логирование: сообщения api_app с уровня LOG_LEVEL (DEBUG - подробный вывод при разработке),
+# остальных библиотек - с WARNING
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {'format': '%(asctime)s - %(levelname)s - %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'default'},
+    },
+    'root': {'handlers': ['console'], 'level': 'WARNING'},
+    'loggers': {
+        'api_app': {'level': LOG_LEVEL},
+    },
+}
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
@@ -46,7 +116,6 @@ INSTALLED_APPS = [
 
     'rest_framework',
 
-    'rest_framework.authtoken',
     'djoser',
 
     'corsheaders',
@@ -59,6 +128,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api_app.middleware.ProfilingMiddleware',
+    'api_app.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -67,21 +138,69 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # BasicAuthentication не используется: она проверяет пароль (PBKDF2) на каждом запросе.
+    # Бессрочные токены DRF (TokenAuthentication) отключены: вход только через /api/auth/login/
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
+        'api_app.authentication.AccessTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
+    # Браузерный интерфейс DRF (шаблоны, формы) нужен только при разработке
+    'DEFAULT_RENDERER_CLASSES': (
+        'api_app.renderers.ORJSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'token_download': config('THROTTLE_TOKEN_DOWNLOAD', default='60/min'),
+        'upload': config('THROTTLE_UPLOAD', default='120/min'),
+        'login': config('THROTTLE_LOGIN', default='10/min'),
+    },
+}
+
+# djoser (/api/v1/auth/) - только управление пользователями: токены DRF не выдаются и не удаляются
+DJOSER = {
+    'TOKEN_MODEL': None,
 }
 
+# Кэш: счетчики ограничений частоты запросов и скорости скачивания.
+# Для нескольких процессов gunicorn нужен общий кэш (REDIS_URL), иначе лимиты считаются в каждом процессе отдельно
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Ограничения скорости скачивания, байт/сек (0 - без ограничения)
+DOWNLOAD_RATE_GLOBAL = config('DOWNLOAD_RATE_GLOBAL', default=0, cast=int)
+DOWNLOAD_RATE_PER_USER = config('DOWNLOAD_RATE_PER_USER', default=0, cast=int)
+DOWNLOAD_RATE_PER_LINK = config('DOWNLOAD_RATE_PER_LINK', default=0, cast=int)
+# Если очередь на отдачу больше этого времени (сек), скачивание отклоняется с 429 и Retry-After
+DOWNLOAD_MAX_WAIT = config('DOWNLOAD_MAX_WAIT', default=30, cast=int)
+
 CORS_ORIGIN_ALLOW_ALL = True
 
+# Дополнительно к стандартным заголовкам разрешаем X-Profile (профилирование запросов)
+CORS_ALLOW_HEADERS = (*default_headers, 'x-profile')
+
 # Позволяет клиенту видеть эти заголовоки
 CORS_EXPOSE_HEADERS = [
     'X-Filename',  
     'Content-Disposition',
     'Content-Type',
     'X-Last-Download-Date',
+    'ETag',
+    'Retry-After',
+    'Content-Range',
+    'Accept-Ranges',
+    'X-Profile-Id',
 ]
 
 ROOT_URLCONF = 'backend_project.urls'
@@ -108,17 +227,67 @@ WSGI_APPLICATION = 'backend_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+DATABASE_ENGINE = config('DATABASE_ENGINE', default='django.db.backends.postgresql')
+
+# Постоянные соединения: соединение переиспользуется между запросами до DATABASE_CONN_MAX_AGE секунд
+# и проверяется перед использованием (CONN_HEALTH_CHECKS). DATABASE_POOL=True включает пул соединений
+# psycopg 3 (нужен пакет psycopg[pool]), при этом постоянные соединения отключаются.
+# Под ASGI (backend_project.asgi, воркеры uvicorn) постоянные соединения тоже отключаются: синхронный код
+# запроса выполняется в разных потоках, и такие соединения не закрываются (требование документации Django)
+DATABASE_POOL = config('DATABASE_POOL', default=False, cast=bool)
+SERVING_ASGI = config('DJANGO_ASGI', default=False, cast=bool)
+DATABASE_CONN_MAX_AGE = 0 if DATABASE_POOL or SERVING_ASGI else config('DATABASE_CONN_MAX_AGE', default=60, cast=int)
+
+def database_config(host, port):
+    database = {
+        'ENGINE': DATABASE_ENGINE,
         'NAME': config('DATABASE_NAME'),
         'USER': config('DATABASE_USER'),
         'PASSWORD': config('DATABASE_PASSWORD'),
-        'HOST': config('DATABASE_HOST'),
-        'PORT': config('DATABASE_PORT'),
+        'HOST': host,
+        'PORT': port,
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
     }
+    if DATABASE_POOL:
+        database['OPTIONS'] = {
+            'pool': {
+                'min_size': config('DATABASE_POOL_MIN_SIZE', default=2, cast=int),
+                'max_size': config('DATABASE_POOL_MAX_SIZE', default=10, cast=int),
+            },
+        }
+    return database
+
+DATABASES = {
+    'default': database_config(config('DATABASE_HOST'), config('DATABASE_PORT')),
 }
 
+# Реплика только для чтения (необязательно). Для SQLite DATABASE_REPLICA_NAME - путь к файлу копии БД
+DATABASE_REPLICA_HOST = config('DATABASE_REPLICA_HOST', default='')
+DATABASE_REPLICA_NAME = config('DATABASE_REPLICA_NAME', default='')
+if DATABASE_REPLICA_HOST or DATABASE_REPLICA_NAME:
+    DATABASES['replica'] = database_config(
+        DATABASE_REPLICA_HOST or DATABASES['default']['HOST'],
+        config('DATABASE_REPLICA_PORT', default=DATABASES['default']['PORT']),
+    )
+    DATABASES['replica']['NAME'] = DATABASE_REPLICA_NAME or DATABASES['default']['NAME']
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['api_app.routers.ReplicaRouter']
+
+# Пути (GET/HEAD), которые можно обслуживать с реплики: списки файлов, поиск, папки, данные пользователя,
+# поиск метаданных файла при просмотре и скачивании
+DATABASE_REPLICA_PATHS = [
+    r'^/api/storage/\d+/$',
+    r'^/api/storage/search/\d+/$',
+    r'^/api/storage/view/\d+/\d+/$',
+    r'^/api/storage/download/[^/]+/$',
+    r'^/api/folders/',
+    r'^/api/users/(user_info|me)/$',
+]
+# Сколько секунд после записи клиент читает только с основной БД
+DATABASE_REPLICA_STICKY_SECONDS = config('DATABASE_REPLICA_STICKY_SECONDS', default=10, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
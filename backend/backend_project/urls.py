@@ -24,5 +24,4 @@ urlpatterns = [
     path("api/", include("api_app.urls")),
     path("api/v1/drf-auth/", include("rest_framework.urls")),
     path("api/v1/auth/", include('djoser.urls')),
-    path("api/v1/auth/", include('djoser.urls.authtoken')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,78 @@
+"""
+Настройки gunicorn для production. gunicorn читает этот файл сам при запуске из папки backend:
+    gunicorn            (приложение указано в wsgi_app, тип воркеров - GUNICORN_WORKER_CLASS)
+Параметры задаются переменными окружения GUNICORN_* (или в .env).
+
+Воркеры:
+    gthread - по умолчанию: несколько потоков на процесс, долгие скачивания и загрузки не блокируют воркер.
+              Поток SSE (/api/events/) под WSGI держит поток воркера все время соединения (EVENTS_STREAM_SECONDS),
+              поэтому ленту событий обслуживает отдельный пул uvicorn (сервис gunicorn-events и location
+              /api/events/ в nginx, см. README), а не этот пул
+    sync    - один запрос на процесс (ленту событий так же отдает пул uvicorn)
+    uvicorn - ASGI (backend_project.asgi): пул для /api/events/, ожидание событий не занимает поток.
+              Постоянные соединения с БД под ASGI отключаются (CONN_MAX_AGE=0, см. settings.SERVING_ASGI)
+"""
+import multiprocessing
+import time
+
+# Имя config занято настройкой gunicorn (путь к этому файлу)
+from decouple import config as env
+
+bind = env('GUNICORN_BIND', default='unix:/run/gunicorn.sock')
+workers = env('GUNICORN_WORKERS', default=multiprocessing.cpu_count() * 2 + 1, cast=int)
+
+WORKER_CLASS = env('GUNICORN_WORKER_CLASS', default='gthread')
+if WORKER_CLASS == 'uvicorn':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'backend_project.asgi:application'
+else:
+    worker_class = WORKER_CLASS
+    wsgi_app = 'backend_project.wsgi:application'
+threads = env('GUNICORN_THREADS', default=4, cast=int)
+
+# Приложение загружается один раз в главном процессе и прогревается (when_ready), воркеры получают его через fork:
+# быстрее запуск и перезапуск воркеров, меньше памяти (общие страницы). При обновлении кода нужен полный
+# перезапуск (systemctl restart gunicorn), HUP перечитывает только настройки
+preload_app = env('GUNICORN_PRELOAD', default=True, cast=bool)
+
+# Перезапуск воркера после max_requests запросов (со случайным разбросом, чтобы воркеры не перезапускались
+# одновременно): ограничивает рост памяти из-за утечек и фрагментации
+max_requests = env('GUNICORN_MAX_REQUESTS', default=1000, cast=int)
+max_requests_jitter = env('GUNICORN_MAX_REQUESTS_JITTER', default=100, cast=int)
+
+timeout = env('GUNICORN_TIMEOUT', default=60, cast=int)
+graceful_timeout = env('GUNICORN_GRACEFUL_TIMEOUT', default=30, cast=int)
+keepalive = env('GUNICORN_KEEPALIVE', default=5, cast=int)
+
+accesslog = env('GUNICORN_ACCESS_LOG', default='-')
+errorlog = '-'
+loglevel = env('GUNICORN_LOG_LEVEL', default='info')
+
+
+def when_ready(server):
+    if preload_app:
+        from backend_project.warmup import warm_up
+        server.log.info('Приложение прогрето за %.0f мс', warm_up() * 1000)
+
+
+def post_fork(server, worker):
+    worker.started_at = time.monotonic()
+    worker.first_request_at = None
+    worker.first_request_logged = False
+
+
+def post_worker_init(worker):
+    worker.log.info('Воркер %s готов через %.0f мс после запуска', worker.pid, (time.monotonic() - worker.started_at) * 1000)
+
+
+def pre_request(worker, req):
+    if worker.first_request_at is None:
+        worker.first_request_at = time.monotonic()
+
+
+def post_request(worker, req, environ, resp):
+    # Время первого запроса воркера: показывает, что осталось загрузить лениво (см. benchmark_startup)
+    if worker.first_request_at is not None and not worker.first_request_logged:
+        worker.first_request_logged = True
+        worker.log.info('Воркер %s: первый запрос %s обработан за %.0f мс', worker.pid, req.path,
+                        (time.monotonic() - worker.first_request_at) * 1000)
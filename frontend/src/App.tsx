@@ -1,5 +1,5 @@
 import './App.css';
-import API_BASE_URL from './config';
+import AuthUtils from './utils/authUtils';
 import SimpleStorage from './utils/storage';
 import { BrowserRouter as Router, Route, Routes } from "react-router-dom";
 import { useEffect, useState } from 'react';
@@ -40,19 +40,9 @@ const App = () => {
     // Функция выхода из системы
     const handleLogout = async () => {        
 
-        const response = await fetch(`${API_BASE_URL}/auth/token/logout/`, {
-            method: 'POST',
-            headers: {
-                'Authorization': `Token ${SimpleStorage.getItem('token')}`,
-            },
-        });
+        // Сессия завершается на сервере: access- и refresh-токены перестают действовать
+        await AuthUtils.endSession();
 
-        if (!response.ok) {
-            const errorData = await response.json();
-            throw new Error(errorData.detail || 'Не удалось выйти.');
-        }
-
-        SimpleStorage.removeItem('token');
         SimpleStorage.removeItem('id_user');
         SimpleStorage.removeItem('role');
         setRole('');
@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 
 import API_BASE_URL from '../../config';
+import AuthUtils from '../../utils/authUtils';
 import './AdminPanel.css';
 
 // Определение типа пользователя
@@ -38,7 +39,6 @@ interface File {
  */
 export const AdminPanel: React.FC = () => {    
     const [users, setUsers] = useState<User[]>([]);  // Используем состояние для хранения списка пользователей
-    const auth_token = localStorage.getItem('token');
     const navigate = useNavigate();  // Хук для навигации между страницами
     
     /**
@@ -93,7 +93,7 @@ export const AdminPanel: React.FC = () => {
             const response = await fetch(`${API_BASE_URL}/api/users/${id_user}/`, {
                 method: 'DELETE',
                 headers: {
-                    'Authorization': `Token ${auth_token}`,
+                    'Authorization': await AuthUtils.authHeader(),
                 },
             });
 
@@ -124,7 +124,7 @@ export const AdminPanel: React.FC = () => {
                 method: 'PATCH',
                 headers: {
                     'Content-Type': 'application/json',
-                    'Authorization': `Token ${auth_token}`,
+                    'Authorization': await AuthUtils.authHeader(),
                 },
                 body: JSON.stringify({ role: newRole }),
             });
@@ -1,10 +1,10 @@
 import { useEffect, useState } from 'react';
 import { useParams } from 'react-router-dom';
 import './FileStorage.css';
-import FileUtils, { FileItem } from '../../utils/fileUtils';
+import FileUtils, { FileItem, StorageEvent } from '../../utils/fileUtils';
+import AuthUtils from '../../utils/authUtils';
 import ErrorHandler from '../../utils/errorHandler';
 import API_BASE_URL from '../../config';
-import SimpleStorage from '../../utils/storage';
 
 export const FileStorage: React.FC = () => {
     const { id_user } = useParams<{ id_user: string }>(); // Получаем ID пользователя из URL
@@ -31,6 +31,38 @@ export const FileStorage: React.FC = () => {
     useEffect(() => {
         loadFiles();
     }, [id_user]);
+
+    // Изменения из других вкладок и устройств применяем к списку без повторной загрузки
+    useEffect(() => {
+        const unsubscribe = FileUtils.subscribeEvents(id_user!, (event: StorageEvent) => {
+            switch (event.kind) {
+                case 'upload':
+                    setFiles(prev => prev.some(file => file.id_file === event.id_file)
+                        ? prev
+                        : [...prev, event.payload as FileItem]);
+                    break;
+                case 'update':
+                case 'rename':
+                case 'move':
+                case 'link':
+                    setFiles(prev => prev.map(file =>
+                        file.id_file === event.id_file ? { ...file, ...event.payload } : file
+                    ));
+                    break;
+                case 'delete':
+                    setFiles(prev => prev.filter(file => file.id_file !== event.id_file));
+                    break;
+                case 'reset':
+                    loadFiles();
+                    break;
+                case 'logout':
+                    // Выход в другой вкладке этой же сессии (события других устройств пользователя не касаются)
+                    if (AuthUtils.isOwnSession(event.payload.session)) AuthUtils.logout();
+                    break;
+            }
+        });
+        return unsubscribe;
+    }, [id_user]);
     
     // Обработчик загрузки файла
     const handleUpload = async (e: React.FormEvent<HTMLFormElement>) => {
@@ -111,12 +143,11 @@ export const FileStorage: React.FC = () => {
      */
     const handleDownload = async (id_file: number) => {
         setIsLoading(true);
-        const token = SimpleStorage.getItem('token');
         try {
             const response = await fetch(`${API_BASE_URL}/api/storage/download/${id_file}/`, {
                 method: 'GET',
                 headers: {
-                    'Authorization': `Token ${token}`,
+                    'Authorization': await AuthUtils.authHeader(),
                 },
             });    
     
@@ -202,7 +233,7 @@ export const FileStorage: React.FC = () => {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
-                    'Authorization': `Token ${SimpleStorage.getItem('token')}`, // аутентификация через токен
+                    'Authorization': await AuthUtils.authHeader(), // аутентификация через токен
                 },
             });
 
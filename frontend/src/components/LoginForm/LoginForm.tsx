@@ -2,7 +2,7 @@ import "./LoginForm.css";
 
 import API_BASE_URL from '../../config';
 import SimpleStorage from '../../utils/storage';
-import AuthUtils from '../../utils/authUtils';
+import AuthUtils, { AuthTokens } from '../../utils/authUtils';
 import ErrorHandler from '../../utils/errorHandler';
 import React, { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
@@ -18,7 +18,7 @@ export const LoginForm: React.FC<{ updateRole: (role: string, is_superuser: bool
         e.preventDefault();
 
         try {
-            const response = await fetch(`${API_BASE_URL}/api/v1/auth/token/login/`, {
+            const response = await fetch(`${API_BASE_URL}/api/auth/login/`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -30,21 +30,16 @@ export const LoginForm: React.FC<{ updateRole: (role: string, is_superuser: bool
                 throw new Error('Некорректный логин или пароль');
             }
 
-            const data = await response.json();
+            // Пароль больше нигде не хранится: access-токен обновляется по refresh-токену
+            const tokens: AuthTokens = await response.json();
+            AuthUtils.saveTokens(tokens);
             
-            const { auth_token } = data;
-            SimpleStorage.setItem('token', auth_token);
-            
-            // Сохраняем учетные данные для автообновления токена
-            AuthUtils.saveCredentials(username, password);
-            
-            const response_user = await fetch(`${API_BASE_URL}/api/users/`, {
-                method: 'POST',
+            // Данные текущего пользователя (роль, квота, первая страница файлов) одним запросом
+            const response_user = await fetch(`${API_BASE_URL}/api/users/me/`, {
+                method: 'GET',
                 headers: {
-                    'Content-Type': 'application/json',
-                    'Authorization': `Token ${auth_token}`,
+                    'Authorization': `Bearer ${tokens.access}`,
                 },
-                body: JSON.stringify({ username }),
             });
             
             if (!response_user.ok) {
@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import { Navigate } from 'react-router-dom';
 import API_BASE_URL from '../../config';
 import SimpleStorage from '../../utils/storage';
+import AuthUtils from '../../utils/authUtils';
 
 /**
  * Компонент ProtectedRoute обеспечивает защиту маршрутов для аутентифицированных пользователей.
@@ -36,10 +37,11 @@ export const ProtectedRoute: React.FC<{
             }
             
             try {
+                // Легкая проверка сессии при каждом переходе: полные данные для старта (/api/users/me/) нужны только при входе
                 const response = await fetch(`${API_BASE_URL}/api/users/user_info/`, {
                     method: 'GET',
                     headers: {
-                        'Authorization': `Token ${token}`,
+                        'Authorization': await AuthUtils.authHeader(),
                     },
                 });
 
@@ -3,7 +3,30 @@
 import API_BASE_URL from '../config';
 import SimpleStorage from './storage';
 
+// Ответ /api/auth/login/ и /api/auth/refresh/
+export interface AuthTokens {
+    access: string;
+    refresh: string;
+    token_type: string;
+    expires_in: number;
+    refresh_expires: string;
+    session: number;
+}
+
+// Запас до истечения access-токена, при котором он обновляется заранее (мс)
+const REFRESH_MARGIN_MS = 30 * 1000;
+
 export class AuthUtils {
+    private static refreshing: Promise<boolean> | null = null;
+
+    // Сохранение пары токенов после входа или обновления
+    static saveTokens(tokens: AuthTokens): void {
+        SimpleStorage.setItem('token', tokens.access);
+        SimpleStorage.setItem('refresh', tokens.refresh);
+        SimpleStorage.setItem('token_expires', String(Date.now() + tokens.expires_in * 1000));
+        SimpleStorage.setItem('session', String(tokens.session));
+    }
+
     // Проверка валидности токена
     static async checkTokenValidity(): Promise<boolean> {
         const token = SimpleStorage.getItem('token');
@@ -13,7 +36,7 @@ export class AuthUtils {
             const response = await fetch(`${API_BASE_URL}/api/users/user_info/`, {
                 method: 'GET',
                 headers: {
-                    'Authorization': `Token ${token}`,
+                    'Authorization': `Bearer ${token}`,
                 },
             });
             return response.ok;
@@ -23,70 +46,101 @@ export class AuthUtils {
         }
     }
 
-    // Простое обновление токена (повторный логин)
+    // Обновление токена по refresh-токену (пароль не нужен и не хранится)
     static async refreshToken(): Promise<boolean> {
-        const storedUsername = SimpleStorage.getItem('username');
-        const storedPassword = SimpleStorage.getItem('password');
-        
-        if (!storedUsername || !storedPassword) {
-            console.log('Нет сохраненных данных для обновления токена');
+        // Одновременные запросы ждут одного обновления: refresh-токен одноразовый
+        if (!this.refreshing) {
+            this.refreshing = this.doRefresh().finally(() => { this.refreshing = null; });
+        }
+        return this.refreshing;
+    }
+
+    private static async doRefresh(): Promise<boolean> {
+        const refresh = SimpleStorage.getItem('refresh');
+        if (!refresh) {
+            console.log('Нет refresh-токена для обновления');
             return false;
         }
 
         try {
-            const response = await fetch(`${API_BASE_URL}/api/v1/auth/token/login/`, {
+            const response = await fetch(`${API_BASE_URL}/api/auth/refresh/`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ 
-                    username: storedUsername, 
-                    password: storedPassword 
-                }),
+                body: JSON.stringify({ refresh }),
             });
 
             if (response.ok) {
-                const data = await response.json();
-                SimpleStorage.setItem('token', data.auth_token);
+                this.saveTokens(await response.json());
                 console.log('Токен успешно обновлен');
                 return true;
-            } else {
-                console.log('Не удалось обновить токен');
-                this.logout();
-                return false;
             }
+            // Токен мог уже обменять другая вкладка: тогда новая пара уже сохранена
+            if (SimpleStorage.getItem('refresh') !== refresh) return true;
+            console.log('Не удалось обновить токен');
+            this.logout();
+            return false;
         } catch (error) {
             console.error('Ошибка обновления токена:', error);
-            this.logout();
             return false;
         }
     }
 
-    // Проверка и автоматическое обновление токена
+    // Проверка и автоматическое обновление токена: срок действия известен, запрос к серверу не нужен
     static async ensureValidToken(): Promise<boolean> {
-        const isValid = await this.checkTokenValidity();
-        if (isValid) return true;
+        const token = SimpleStorage.getItem('token');
+        const expires = Number(SimpleStorage.getItem('token_expires') || 0);
+        if (token && expires - REFRESH_MARGIN_MS > Date.now()) return true;
 
         console.log('Токен истек, пытаемся обновить...');
         return await this.refreshToken();
     }
 
-    // Выход из системы
-    static logout(): void {
+    // Заголовок Authorization с действующим access-токеном
+    static async authHeader(): Promise<string> {
+        await this.ensureValidToken();
+        return `Bearer ${SimpleStorage.getItem('token')}`;
+    }
+
+    // Завершение сессии на сервере (по refresh-токену: access к этому моменту мог истечь)
+    static async endSession(): Promise<void> {
+        const refresh = SimpleStorage.getItem('refresh');
+        if (refresh) {
+            await fetch(`${API_BASE_URL}/api/auth/logout/`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ refresh }),
+            }).catch((error) => console.error('Ошибка завершения сессии:', error));
+        }
+        this.clearTokens();
+    }
+
+    // Относится ли событие logout к этой сессии (без id сессии - выход по бессрочному токену, для всех)
+    static isOwnSession(session?: number): boolean {
+        return session === undefined || String(session) === SimpleStorage.getItem('session');
+    }
+
+    static clearTokens(): void {
         SimpleStorage.removeItem('token');
-        SimpleStorage.removeItem('role');
+        SimpleStorage.removeItem('refresh');
+        SimpleStorage.removeItem('token_expires');
+        SimpleStorage.removeItem('session');
+        // Раньше для обновления токена сохранялся пароль: удаляем его, если остался
         SimpleStorage.removeItem('username');
         SimpleStorage.removeItem('password');
+    }
+
+    // Выход из системы
+    static logout(): void {
+        this.clearTokens();
+        SimpleStorage.removeItem('role');
         console.log('Пользователь вышел из системы');
         // Перенаправление на страницу логина
         window.location.href = '/signin';
     }
-
-    // Сохранение данных для автообновления токена
-    static saveCredentials(username: string, password: string): void {
-        SimpleStorage.setItem('username', username);
-        SimpleStorage.setItem('password', password);
-    }
 }
 
-export default AuthUtils;
\ No newline at end of file
+export default AuthUtils;
@@ -2,6 +2,7 @@
 
 import API_BASE_URL from '../config';
 import SimpleStorage from './storage';
+import AuthUtils from './authUtils';
 
 export interface FileItem {
     id_file: number;
@@ -12,6 +13,14 @@ export interface FileItem {
     last_download_date: string;
 }
 
+// Событие ленты изменений хранилища (/api/events/)
+export interface StorageEvent {
+    id: number;
+    kind: 'upload' | 'update' | 'rename' | 'move' | 'delete' | 'link' | 'folder' | 'logout' | 'reset';
+    id_file: number | null;
+    payload: Partial<FileItem> & { id_file?: number; session?: number };
+}
+
 export class FileUtils {
     // Получение токена авторизации
     static getAuthToken(): string | null {
@@ -20,11 +29,9 @@ export class FileUtils {
 
     // Загрузка списка файлов
     static async fetchFiles(id_user: string): Promise<FileItem[]> {
-        const token = this.getAuthToken();
-        
         const response = await fetch(`${API_BASE_URL}/api/storage/${id_user}`, {
             headers: {
-                'Authorization': `Token ${token}`,
+                'Authorization': await AuthUtils.authHeader(),
             },
         });
         
@@ -37,7 +44,6 @@ export class FileUtils {
 
     // Загрузка файла на сервер
     static async uploadFile(id_user: string, file: File, comment: string): Promise<FileItem[]> {
-        const token = this.getAuthToken();
         const formData = new FormData();
         formData.append('file', file);
         formData.append('comment', comment);
@@ -45,7 +51,7 @@ export class FileUtils {
         const response = await fetch(`${API_BASE_URL}/api/storage/${id_user}/`, {
             method: 'POST',
             headers: {
-                'Authorization': `Token ${token}`,
+                'Authorization': await AuthUtils.authHeader(),
             },
             body: formData,
         });
@@ -59,12 +65,10 @@ export class FileUtils {
 
     // Удаление файла
     static async deleteFile(id_user: string, id_file: number): Promise<void> {
-        const token = this.getAuthToken();
-        
         const response = await fetch(`${API_BASE_URL}/api/storage/${id_user}/${id_file}/`, {
             method: 'DELETE',
             headers: {
-                'Authorization': `Token ${token}`,
+                'Authorization': await AuthUtils.authHeader(),
             },
         });
 
@@ -75,12 +79,10 @@ export class FileUtils {
 
     // Переименование файла
     static async renameFile(id_user: string, id_file: number, newName: string): Promise<FileItem> {
-        const token = this.getAuthToken();
-        
         const response = await fetch(`${API_BASE_URL}/api/storage/${id_user}/${id_file}/`, {
             method: 'PATCH',
             headers: {
-                'Authorization': `Token ${token}`,
+                'Authorization': await AuthUtils.authHeader(),
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({ name: newName }),
@@ -95,12 +97,10 @@ export class FileUtils {
 
     // Создание ссылки для скачивания
     static async createDownloadLink(id_user: string, id_file: number): Promise<string> {
-        const token = this.getAuthToken();
-        
         const response = await fetch(`${API_BASE_URL}/api/storage/link/${id_user}/${id_file}/`, {
             method: 'POST',
             headers: {
-                'Authorization': `Token ${token}`,
+                'Authorization': await AuthUtils.authHeader(),
             },
         });
 
@@ -121,6 +121,54 @@ export class FileUtils {
         return parseFloat((bytes / Math.pow(k, i)).toFixed(2)) + ' ' + sizes[i];
     }
 
+    // Подписка на ленту изменений (SSE через fetch с токеном), переподключение с курсором; возвращает функцию отписки
+    static subscribeEvents(id_user: string, onEvent: (event: StorageEvent) => void): () => void {
+        const controller = new AbortController();
+        let cursor: string | null = null;
+
+        const connect = async () => {
+            while (!controller.signal.aborted) {
+                try {
+                    const headers: Record<string, string> = {
+                        'Authorization': await AuthUtils.authHeader(),
+                        'Accept': 'text/event-stream',
+                    };
+                    if (cursor) headers['Last-Event-ID'] = cursor;
+                    const response = await fetch(`${API_BASE_URL}/api/events/${id_user}/`, { headers, signal: controller.signal });
+                    if (!response.ok || !response.body) throw new Error('Не удалось подключиться к ленте событий');
+
+                    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+                    let buffer = '';
+                    for (;;) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        buffer += value;
+                        // События разделены пустой строкой
+                        let end;
+                        while ((end = buffer.indexOf('\n\n')) >= 0) {
+                            const block = buffer.slice(0, end);
+                            buffer = buffer.slice(end + 2);
+                            let kind = '', data = '';
+                            for (const line of block.split('\n')) {
+                                if (line.startsWith('id: ')) cursor = line.slice(4);
+                                else if (line.startsWith('event: ')) kind = line.slice(7);
+                                else if (line.startsWith('data: ')) data += line.slice(6);
+                            }
+                            if (kind && data) onEvent({ ...JSON.parse(data), kind });
+                        }
+                    }
+                } catch (err) {
+                    if (controller.signal.aborted) return;
+                    console.error('Лента событий:', err);
+                }
+                // Пауза перед переподключением
+                await new Promise(resolve => setTimeout(resolve, 3000));
+            }
+        };
+        connect();
+        return () => controller.abort();
+    }
+
     // Форматирование даты
     static formatDate(dateString: string): string {
         if (!dateString) return 'Не скачивался';